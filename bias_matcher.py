@@ -0,0 +1,119 @@
+"""Single-pass phrase matcher for the gender-coded word lists used by detect_bias.
+
+An Aho–Corasick automaton over the lower-cased phrases finds every occurrence of
+every phrase in one scan of a sentence. The occurrences are then filtered and
+selected exactly like the previous one-regex-per-phrase loop did:
+
+- an occurrence counts only with a regex word boundary (\\b) on both sides, and
+  letters match case-insensitively the way re.IGNORECASE matches them;
+- phrases are visited in rank order (the order they were given in), and each
+  phrase's occurrences left to right without self-overlap, as re.finditer does;
+- an occurrence overlapping a span accepted earlier is dropped.
+"""
+
+import re
+from bisect import bisect_left
+from collections import deque
+
+
+def _is_word_char(ch):
+    # The test sre uses for \w in str patterns
+    return ch.isalnum() or ch == "_"
+
+
+def _at_boundary(text, i):
+    before = i > 0 and _is_word_char(text[i - 1])
+    after = i < len(text) and _is_word_char(text[i])
+    return before != after
+
+
+class PhraseMatcher:
+    """Aho–Corasick automaton over (phrase, tag) pairs, built once"""
+
+    def __init__(self, phrases):
+        self.phrases = []  # rank -> (phrase, tag); later duplicates are dropped (they never match)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # node -> [(rank, length)] of phrases ending there
+        seen = set()
+        for phrase, tag in phrases:
+            key = phrase.lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            rank = len(self.phrases)
+            self.phrases.append((phrase, tag))
+            node = 0
+            for ch in key:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((rank, len(key)))
+        self._alphabet = {ch for phrase, _ in self.phrases for ch in phrase.lower()}
+        self._fold_cache = {}
+        self._link()
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _fold(self, ch):
+        """Map a text character onto the phrase alphabet character it matches under re.IGNORECASE"""
+        folded = self._fold_cache.get(ch)
+        if folded is None:
+            folded = ch
+            if ch not in self._alphabet:
+                for candidate in self._alphabet:
+                    if re.fullmatch(re.escape(candidate), ch, re.IGNORECASE):
+                        folded = candidate
+                        break
+            self._fold_cache[ch] = folded
+        return folded
+
+    def occurrences(self, text):
+        """Every (rank, start, end) occurrence in text with a word boundary at both ends"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = []
+        node = 0
+        for i, ch in enumerate(text):
+            ch = self._fold(ch)
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for rank, length in out[node]:
+                start, end = i + 1 - length, i + 1
+                if _at_boundary(text, start) and _at_boundary(text, end):
+                    found.append((rank, start, end))
+        return found
+
+    def matches(self, text):
+        """Accepted (rank, start, end) spans, in the order the rank-by-rank scan accepts them"""
+        accepted = []
+        starts, ends = [], []  # accepted spans sorted by start; they never overlap
+        current_rank, finditer_end = None, 0
+        for rank, start, end in sorted(self.occurrences(text)):
+            if rank != current_rank:
+                current_rank, finditer_end = rank, 0
+            if start < finditer_end:
+                continue  # re.finditer resumes after the previous match of the same phrase
+            finditer_end = end
+            i = bisect_left(starts, end)
+            if i and ends[i - 1] > start:
+                continue
+            starts.insert(i, start)
+            ends.insert(i, end)
+            accepted.append((rank, start, end))
+        return accepted
@@ -148,6 +148,14 @@ class DatabaseManager:
     # ── Domain detection (unchanged logic) ───────────────────────────────────
 
     def detect_domain_llm(self, job_title: str, job_description: str, session=None) -> str:
+        """LLM domain classification, falling back to keyword matching when it fails"""
+        domain = self.classify_domain_llm(job_title, job_description, session=session)
+        if domain is None:
+            return self.detect_domain_from_title_and_description(job_title, job_description)
+        return domain
+
+    def classify_domain_llm(self, job_title: str, job_description: str, session=None) -> Optional[str]:
+        """LLM domain classification; None when the LLM is unavailable or answers off-list"""
         prompt = f"""
 You are an expert career advisor.
 Given either a job posting (title + description) OR a candidate resume (summary, skills, experience, projects),
@@ -166,22 +174,29 @@ Business Analysis, Technical Writing, Digital Marketing, E-commerce, Fintech,
 Healthcare Tech, EdTech, IoT Development, AR/VR Development, Technical Sales,
 Agile Coaching, Software Engineering]
 """
+        valid_domains = [
+            "Data Science", "AI/Machine Learning", "UI/UX Design", "Mobile Development",
+            "Frontend Development", "Backend Development", "Full Stack Development", "Cybersecurity",
+            "Cloud Engineering", "DevOps/Infrastructure", "Quality Assurance", "Game Development",
+            "Blockchain Development", "Embedded Systems", "System Architecture", "Database Management",
+            "Networking", "Site Reliability Engineering", "Product Management", "Project Management",
+            "Business Analysis", "Technical Writing", "Digital Marketing", "E-commerce", "Fintech",
+            "Healthcare Tech", "EdTech", "IoT Development", "AR/VR Development", "Technical Sales",
+            "Agile Coaching", "Software Engineering"
+        ]
         try:
-            result = call_llm(prompt, session=session).strip()
-            valid_domains = [
-                "Data Science", "AI/Machine Learning", "UI/UX Design", "Mobile Development",
-                "Frontend Development", "Backend Development", "Full Stack Development", "Cybersecurity",
-                "Cloud Engineering", "DevOps/Infrastructure", "Quality Assurance", "Game Development",
-                "Blockchain Development", "Embedded Systems", "System Architecture", "Database Management",
-                "Networking", "Site Reliability Engineering", "Product Management", "Project Management",
-                "Business Analysis", "Technical Writing", "Digital Marketing", "E-commerce", "Fintech",
-                "Healthcare Tech", "EdTech", "IoT Development", "AR/VR Development", "Technical Sales",
-                "Agile Coaching", "Software Engineering"
-            ]
-            return result if result in valid_domains else "Software Engineering"
+            # Routed to the small model; an answer outside the list escalates to the 70B model
+            result = call_llm(prompt, session=session, family="domain_detect",
+                              semantic_text=job_description,
+                              validator=lambda r: r.strip() in valid_domains).strip()
         except Exception as e:
             logger.error(f"LLM domain detection failed: {e}")
-            return self.detect_domain_from_title_and_description(job_title, job_description)
+            return None
+        if result not in valid_domains:
+            # call_llm reports failures as a "❌ ..." string rather than raising
+            logger.warning(f"LLM domain detection gave no valid domain: {result[:80]}")
+            return None
+        return result
 
     def detect_domain_from_title_and_description(self, job_title: str, job_description: str) -> str:
         title = job_title.lower().strip()
@@ -641,22 +656,27 @@ Agile Coaching, Software Engineering]
 
     # ── CRUD operations ───────────────────────────────────────────────────────
 
+    @staticmethod
+    def _normalize_candidate(data: Tuple, detected_domain: str) -> Tuple:
+        """Validate a candidate tuple and append the detected domain."""
+        if len(data) < 9:
+            raise ValueError(f"Expected at least 9 data fields, got {len(data)}")
+        normalized_data = data[:9] + (detected_domain,)
+
+        for i, score in enumerate(normalized_data[2:8]):
+            if not isinstance(score, (int, float)) or not (0 <= score <= 100):
+                raise ValueError(f"Score at position {i+2} must be between 0 and 100, got {score}")
+        bias_score = normalized_data[8]
+        if not isinstance(bias_score, (int, float)) or not (0.0 <= bias_score <= 1.0):
+            raise ValueError(f"Bias score must be between 0.0 and 1.0, got {bias_score}")
+        return normalized_data
+
     def insert_candidate(self, data: Tuple, job_title: str = "", job_description: str = "") -> int:
         try:
             local_tz = pytz.timezone("Asia/Kolkata")
             local_time = datetime.now(local_tz).strftime("%Y-%m-%d %H:%M:%S")
             detected_domain = self.detect_domain_from_title_and_description(job_title, job_description)
-
-            if len(data) < 9:
-                raise ValueError(f"Expected at least 9 data fields, got {len(data)}")
-            normalized_data = data[:9] + (detected_domain,)
-
-            for i, score in enumerate(normalized_data[2:8]):
-                if not isinstance(score, (int, float)) or not (0 <= score <= 100):
-                    raise ValueError(f"Score at position {i+2} must be between 0 and 100, got {score}")
-            bias_score = normalized_data[8]
-            if not isinstance(bias_score, (int, float)) or not (0.0 <= bias_score <= 1.0):
-                raise ValueError(f"Bias score must be between 0.0 and 1.0, got {bias_score}")
+            normalized_data = self._normalize_candidate(data, detected_domain)
 
             sql = """
                 INSERT INTO candidates (
@@ -673,6 +693,60 @@ Agile Coaching, Software Engineering]
             logger.error(f"Error inserting candidate: {e}")
             raise
 
+    def insert_candidates_batch(self, rows: List[Tuple], job_title: str = "",
+                                job_description: str = "") -> Tuple[List[Optional[int]], List[Tuple[str, str]]]:
+        """
+        Insert many candidates for one job, in a single statement when every row is valid.
+        Rows that fail validation are skipped; if the batch statement itself fails, each row
+        is retried on its own so one bad row cannot drop the others.
+        Returns (ids aligned with rows, None where not inserted; [(resume_name, error), ...]).
+        """
+        candidate_ids: List[Optional[int]] = [None] * len(rows)
+        failures: List[Tuple[str, str]] = []
+        if not rows:
+            return candidate_ids, failures
+
+        local_tz = pytz.timezone("Asia/Kolkata")
+        local_time = datetime.now(local_tz).strftime("%Y-%m-%d %H:%M:%S")
+        detected_domain = self.detect_domain_from_title_and_description(job_title, job_description)
+        pending = []  # (row index, values)
+        for i, data in enumerate(rows):
+            try:
+                pending.append((i, self._normalize_candidate(data, detected_domain) + (local_time,)))
+            except Exception as e:
+                logger.error(f"Skipping invalid candidate row {data[:1]}: {e}")
+                failures.append((str(data[0]) if data else f"row {i}", str(e)))
+        if not pending:
+            return candidate_ids, failures
+
+        sql = """
+            INSERT INTO candidates (
+                resume_name, candidate_name, ats_score, edu_score, exp_score,
+                skills_score, lang_score, keyword_score, bias_score, domain, timestamp
+            ) VALUES %s
+            RETURNING id
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    result = psycopg2.extras.execute_values(
+                        cur, sql, [values for _, values in pending], page_size=len(pending), fetch=True
+                    )
+            for (i, _), r in zip(pending, result):
+                candidate_ids[i] = r[0]
+            logger.info(f"Inserted {len(pending)} candidates in one batch")
+        except Exception as e:
+            logger.warning(f"Candidate batch insert failed, retrying row by row: {e}")
+            for i, values in pending:
+                try:
+                    with self.get_connection() as conn:
+                        with conn.cursor() as cur:
+                            result = psycopg2.extras.execute_values(cur, sql, [values], fetch=True)
+                    candidate_ids[i] = result[0][0]
+                except Exception as row_error:
+                    failures.append((str(values[0]), str(row_error)))
+        return candidate_ids, failures
+
     def get_top_domains_by_score(self, limit: int = 5) -> List[Tuple]:
         try:
             sql = """
@@ -987,6 +1061,9 @@ def get_domain_similarity(resume_domain: str, job_domain: str) -> float:
 def insert_candidate(data: tuple, job_title: str = "", job_description: str = ""):
     return db_manager.insert_candidate(data, job_title, job_description)
 
+def insert_candidates_batch(rows: list, job_title: str = "", job_description: str = ""):
+    return db_manager.insert_candidates_batch(rows, job_title, job_description)
+
 def get_top_domains_by_score(limit: int = 5) -> list:
     return db_manager.get_top_domains_by_score(limit)
 
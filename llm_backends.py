@@ -0,0 +1,212 @@
+"""Offline stand-ins for ChatGroq, used when LLM_BACKEND is not "groq".
+
+Both backends hand out clients with the same invoke / ainvoke / stream surface as
+ChatGroq, so llm_manager's caching, key scheduling, hedging and metrics run
+unchanged on top of them:
+
+- replay: answers from the llm_cache table of a recorded SQLite file
+  (LLM_REPLAY_DB), ignoring expiry. Prompts that were never recorded fall back to
+  the fake backend.
+- fake: fills a response template chosen by regex over the prompt and sleeps for
+  a latency sampled from a log-normal distribution. Latency and injected failures
+  are seeded from the prompt, so repeated runs behave identically.
+
+Environment:
+    LLM_FAKE_LATENCY_MS     median simulated latency (default 800)
+    LLM_FAKE_LATENCY_SIGMA  log-normal spread (default 0.5, 0 = fixed latency)
+    LLM_FAKE_ERROR_RATE     fraction of calls failing with a simulated 429 (default 0)
+    LLM_FAKE_TEMPLATES      JSON file with [{"match": regex, "response": text}, ...]
+                            tried before the built-in templates
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Built-in templates cover the prompts whose output main.py parses (structured calls
+# are matched on the schema title embedded in the prompt); anything else gets the
+# generic answer at the end.
+DEFAULT_TEMPLATES = [
+    (r"classify the most relevant professional domain", "Software Engineering"),
+    (r'"title":"AtsReport"', json.dumps({
+        "candidate_name": "Offline Candidate",
+        "education": {
+            "score": 14,
+            "analysis": "- Offline evaluation of the education section."
+        },
+        "experience": {
+            "score": 24,
+            "analysis": "- Offline evaluation of the experience section."
+        },
+        "skills": {
+            "score": 21,
+            "analysis": "- Offline evaluation of the skills section."
+        },
+        "skills_gaps": [
+            "Docker",
+            "Kubernetes"
+        ],
+        "language_assessment": "Offline evaluation of language quality.",
+        "keywords": {
+            "score": 7,
+            "analysis": "- Offline evaluation of keyword coverage."
+        },
+        "missing_keywords": [
+            "CI/CD",
+            "Microservices"
+        ],
+        "final_assessment": "Offline assessment generated by the fake LLM backend."
+    })),
+    (r'"title":"GrammarReport"', json.dumps({
+        "score": 4,
+        "feedback": "Offline feedback generated by the fake LLM backend.",
+        "suggestions": [
+            "Quantify achievements with metrics.",
+            "Start bullet points with strong action verbs.",
+            "Keep tense consistent across roles."
+        ]
+    })),
+    (r'"title":"QuickEvaluation"', json.dumps({
+        "score": 3,
+        "feedback": "Offline feedback generated by the fake LLM backend."
+    })),
+    (r'"title":"InterviewEvaluation"', json.dumps({
+        "key_concepts": [],
+        "strengths": [],
+        "gaps": [],
+        "knowledge": 6,
+        "communication": 6,
+        "relevance": 6,
+        "feedback": "Offline feedback generated by the fake LLM backend. The answer covers the main idea; add a concrete example and state one tradeoff explicitly.",
+        "followup": ""
+    })),
+    (r"\bJSON\b", "{}"),
+]
+GENERIC_RESPONSE = "Offline response generated by the fake LLM backend."
+
+
+def _as_text(prompt):
+    """Plain text of a prompt given as a string or [(role, content), ...] messages"""
+    return prompt if isinstance(prompt, str) else "\n\n".join(content for _, content in prompt)
+
+
+class OfflineMessage:
+    """Minimal stand-in for a LangChain AIMessage / AIMessageChunk"""
+    __slots__ = ("content", "response_metadata")
+
+    def __init__(self, content, response_metadata=None):
+        self.content = content
+        self.response_metadata = response_metadata or {}
+
+
+class FakeBackend:
+    def __init__(self, latency_ms=800.0, sigma=0.5, error_rate=0.0, templates=None):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.templates = [(re.compile(p), r) for p, r in (templates or []) + DEFAULT_TEMPLATES]
+
+    @classmethod
+    def from_env(cls):
+        templates = []
+        path = os.getenv("LLM_FAKE_TEMPLATES")
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    templates = [(t["match"], t["response"]) for t in json.load(f)]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Ignoring unreadable LLM_FAKE_TEMPLATES {path}: {e}")
+        return cls(latency_ms=float(os.getenv("LLM_FAKE_LATENCY_MS", "800")),
+                   sigma=float(os.getenv("LLM_FAKE_LATENCY_SIGMA", "0.5")),
+                   error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", "0")),
+                   templates=templates)
+
+    def respond(self, prompt, model, api_key):
+        """Return (response, simulated latency in seconds) or raise a simulated 429"""
+        prompt = _as_text(prompt)
+        seed = hashlib.sha256(f"{api_key}|{model}|{prompt}".encode("utf-8")).digest()
+        rng = random.Random(seed)
+        latency = self.latency_ms * rng.lognormvariate(0, self.sigma) / 1000 if self.sigma else self.latency_ms / 1000
+        if rng.random() < self.error_rate:
+            raise RuntimeError("Simulated 429: rate limit reached (fake LLM backend)")
+        for pattern, response in self.templates:
+            if pattern.search(prompt):
+                return response, latency
+        return GENERIC_RESPONSE, latency
+
+
+class ReplayBackend:
+    def __init__(self, db_file, key_fn, decode_fn, fallback):
+        self.db_file = db_file
+        self.key_fn = key_fn  # (prompt, model) -> llm_cache.prompt_hash
+        self.decode_fn = decode_fn  # stored payload -> text
+        self.fallback = fallback
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _lookup(self, prompt, model):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True,
+                                             check_same_thread=False)
+            row = self._conn.execute("SELECT response FROM llm_cache WHERE prompt_hash = ?",
+                                     (self.key_fn(prompt, model),)).fetchone()
+        return self.decode_fn(row[0]) if row else None
+
+    def respond(self, prompt, model, api_key):
+        try:
+            response = self._lookup(prompt, model)
+        except sqlite3.Error as e:
+            logger.warning(f"Replay lookup failed in {self.db_file}: {e}")
+            response = None
+        if response is None:
+            return self.fallback.respond(prompt, model, api_key)
+        return response, 0.0
+
+
+class OfflineClient:
+    """ChatGroq-compatible client backed by a FakeBackend or ReplayBackend"""
+
+    def __init__(self, backend, api_key, model):
+        self.backend = backend
+        self.api_key = api_key
+        self.model = model
+
+    def _message(self, prompt, response):
+        prompt_tokens, completion_tokens = len(_as_text(prompt)) // 4, len(response) // 4
+        return OfflineMessage(response, {"model_name": self.model, "token_usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }})
+
+    def invoke(self, prompt, **kwargs):
+        response, latency = self.backend.respond(prompt, self.model, self.api_key)
+        time.sleep(latency)
+        return self._message(prompt, response)
+
+    async def ainvoke(self, prompt, **kwargs):
+        response, latency = self.backend.respond(prompt, self.model, self.api_key)
+        await asyncio.sleep(latency)
+        return self._message(prompt, response)
+
+    def stream(self, prompt, **kwargs):
+        # Failures surface before the first chunk, like a rejected Groq request
+        response, latency = self.backend.respond(prompt, self.model, self.api_key)
+        return self._chunks(response, latency)
+
+    def _chunks(self, response, latency):
+        words = re.findall(r"\S+\s*|\s+", response) or [""]
+        time.sleep(latency / 2)  # time to first token
+        for word in words:
+            yield OfflineMessage(word)
+            time.sleep(latency / 2 / len(words))
@@ -1,26 +1,305 @@
+import asyncio
+import atexit
+import contextvars
 import hashlib
+import importlib.util
+import json
+import logging
 import os
 import random
+import re
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from langchain_groq import ChatGroq
 
+try:
+    import zstandard
+except ImportError:  # zlib fallback; rows written with zstd stay readable wherever it is installed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
 # ---- CONFIG ----
 WORKING_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(WORKING_DIR, "llm_data.sqlite")
+DB_FILE = os.getenv("LLM_DB_FILE") or os.path.join(WORKING_DIR, "llm_data.sqlite")
+# "sqlite" keeps the cache, key health and metrics in DB_FILE (one file per host);
+# "postgres" shares them between all app processes through the Supabase database.
+CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite").strip().lower()
 CACHE_EXPIRY_HOURS = 24
-FAILURE_COOLDOWN_MINUTES = 5
-QUOTA_COOLDOWN_MINUTES = 60
+FAILURE_COOLDOWN_MINUTES = 5  # longest circuit-breaker cooldown for transient errors (5xx, timeouts)
+QUOTA_COOLDOWN_MINUTES = 60  # longest cooldown for a 429 without Retry-After
+AUTH_COOLDOWN_HOURS = 24  # longest cooldown for a rejected (401/403) key
+CIRCUIT_BASE_COOLDOWN_SECONDS = {"error": 15, "quota": 60, "auth": 15 * 60}  # first trip; doubles per repeat
+CIRCUIT_PROBE_TIMEOUT_SECONDS = 60  # a half-open probe that never reports back frees the key after this
 DAILY_KEY_LIMIT = 800
 DEAD_KEY_REMOVE_DAYS = 3  # auto-remove permanently dead keys after X days
+JANITOR_INTERVAL_SECONDS = 300  # how often the background janitor purges expired rows
+KEY_STATE_FLUSH_SECONDS = 15  # how often in-memory key health is written to SQLite
+MEMORY_CACHE_MAX_ENTRIES = 512  # in-process LRU tier in front of llm_cache
+CACHE_MAX_SIZE_MB = 64  # llm_cache payload budget; least recently used rows are evicted beyond it
+CACHE_COMPRESS_MIN_BYTES = 256  # shorter responses (e.g. a domain label) are stored as plain text
+
+# Semantic cache: near-duplicate inputs (whitespace / one-word edits) reuse a cached
+# response when their embedding similarity clears the family's threshold. Off by default.
+SEMANTIC_CACHE_ENABLED = os.getenv("LLM_SEMANTIC_CACHE", "false").strip().lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLDS = {
+    "domain_detect": 0.95,
+    "grammar": 0.97,
+    "ats_eval": 0.985,
+}
+SEMANTIC_INDEX_MAX_ENTRIES = 5000  # per family, rebuilt from SQLite when exceeded
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+SINGLE_FLIGHT_TIMEOUT_SECONDS = 120  # followers stop waiting on a stuck leader after this
+LLM_MAX_CONCURRENCY = 8  # in-flight requests per call_llm_many batch
+KEY_REQUESTS_PER_MINUTE = 30  # default per-key request budget (Groq free-tier RPM)
+KEY_TOKENS_PER_MINUTE = 12000  # default per-key token budget (prompt + completion)
+COMPLETION_TOKEN_ESTIMATE = 800  # reserved per request until the real usage is known
+RATE_LIMIT_MAX_WAIT_SECONDS = 20  # queue this long for budget before giving up on a key set
+
+# Hedged requests: if the first key has not answered by its p95 latency, race a second key
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "false").strip().lower() in ("1", "true", "yes")
+HEDGE_DEFAULT_DEADLINE_SECONDS = 8.0  # used until a key has HEDGE_MIN_SAMPLES latencies
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200  # recent successful call latencies kept per key
+METRICS_RETENTION_DAYS = 14  # llm_metrics rows older than this are purged by the janitor
+DEFAULT_MODEL = "llama-3.3-70b-versatile"  # generation, and the escalation target for routed families
+SMALL_MODEL = "llama-3.1-8b-instant"
+MODEL_ROUTES = {
+    # Short classification / scoring prompts with a fixed output format run on the
+    # small model; anything not listed (generation, ATS evaluation) uses DEFAULT_MODEL.
+    "domain_detect": SMALL_MODEL,
+    "grammar": SMALL_MODEL,
+}
+# "groq" calls the API; "replay" / "fake" use the offline stand-ins in llm_backends
+# (recorded llm_cache responses / templated answers with simulated latency).
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq").strip().lower()
+LLM_REPLAY_DB = os.getenv("LLM_REPLAY_DB") or DB_FILE  # recorded cache read by the replay backend
+OFFLINE_KEY_COUNT = 4  # placeholder keys scheduled when an offline backend runs without GROQ_API_KEYS
+STRUCTURED_CACHE_MAX_ENTRIES = 256  # parsed call_llm_structured results kept per process
+ANALYSIS_CACHE_EXPIRY_DAYS = 30  # finished resume analyses, keyed by file + job + settings
+PG_POOL_MAX_CONNECTIONS = 8  # pooled Postgres connections per process (LLM_CACHE_BACKEND=postgres)
+HTTP_MAX_CONNECTIONS = 20  # shared keep-alive pool to api.groq.com (all keys share it)
+HTTP_KEEPALIVE_SECONDS = 120
+
+# ---- Connection Layer ----
+# Writes share one long-lived connection per process, serialised by a lock (SQLite
+# allows a single writer anyway). Reads use a long-lived read-only connection per
+# thread, so cache lookups from different Streamlit sessions run concurrently and
+# WAL lets them proceed while a write commits. Every write block commits when
+# it ends, so no transaction (and its RESERVED lock, which would block other Streamlit
+# worker processes on the same file) stays open between requests; high-volume
+# bookkeeping (usage counts, metrics, access times) is buffered in memory and written
+# with one executemany per flush instead.
+#
+# With LLM_CACHE_BACKEND=postgres the same statements run against Supabase through
+# _PostgresConnection, a small sqlite3-style facade: every worker behind the load
+# balancer then shares one cache and one view of key health, and nobody waits on a
+# local file lock. Each _db block borrows its own connection from a thread-safe pool
+# (autocommit), so sessions do not queue behind one socket, and a connection that
+# fails with OperationalError / InterfaceError is discarded and replaced.
+_conn = None  # the writer
+_conn_lock = threading.RLock()
+_read_local = threading.local()  # .conn: this thread's read-only connection
+_pg_pool = None
+_pg_pool_lock = threading.Lock()
+_pg_slots = threading.BoundedSemaphore(PG_POOL_MAX_CONNECTIONS)  # getconn() raises instead of waiting
+
+class _PostgresConnection:
+    """sqlite3-style execute/executemany/commit over psycopg2 for this module's SQL"""
+    _DDL_TYPES = ((re.compile(r"\b(DATETIME|DATE)\b"), "TEXT"), (re.compile(r"\bBLOB\b"), "BYTEA"))
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def _sql(self, sql, has_params):
+        if sql.lstrip().upper().startswith(("CREATE TABLE", "ALTER TABLE")):
+            for pattern, replacement in self._DDL_TYPES:
+                sql = pattern.sub(replacement, sql)
+        return sql.replace("%", "%%").replace("?", "%s") if has_params else sql
+
+    def execute(self, sql, params=()):
+        cursor = self.raw.cursor()
+        cursor.execute(self._sql(sql, bool(params)), tuple(params) or None)
+        return cursor
+
+    def executemany(self, sql, seq_of_params):
+        cursor = self.raw.cursor()
+        cursor.executemany(self._sql(sql, True), list(seq_of_params))
+        return cursor
+
+    def commit(self):
+        pass  # _pg_connection commits (or rolls back) a write block when it ends
+
+    def rollback(self):
+        pass
+
+def _postgres_settings():
+    """Supabase connection settings from st.secrets, falling back to the environment"""
+    names = ["SUPABASE_HOST", "SUPABASE_DB", "SUPABASE_USER", "SUPABASE_PASSWORD", "SUPABASE_PORT"]
+    settings = {}
+    try:
+        import streamlit as st
+        settings = {name: st.secrets[name] for name in names}
+    except Exception:
+        settings = {name: os.getenv(name) for name in names}
+    missing = [name for name, value in settings.items() if not value]
+    if missing:
+        raise ValueError(f"❌ LLM_CACHE_BACKEND=postgres but {', '.join(missing)} is not set.")
+    return settings
+
+def _postgres_pool():
+    global _pg_pool
+    with _pg_pool_lock:
+        if _pg_pool is None:
+            from psycopg2.pool import ThreadedConnectionPool
+            settings = _postgres_settings()
+            _pg_pool = ThreadedConnectionPool(
+                1, PG_POOL_MAX_CONNECTIONS,
+                host=settings["SUPABASE_HOST"],
+                dbname=settings["SUPABASE_DB"],
+                user=settings["SUPABASE_USER"],
+                password=settings["SUPABASE_PASSWORD"],
+                port=settings["SUPABASE_PORT"],
+                connect_timeout=30,
+                keepalives=1,
+                keepalives_idle=30,
+                keepalives_interval=10,
+                keepalives_count=5,
+                application_name="hirelyzer-llm-cache",
+            )
+        return _pg_pool
+
+@contextmanager
+def _pg_connection(transaction=False):
+    """Borrow a pooled connection; one that failed at the connection level is closed
+
+    Reads run in autocommit. transaction=True wraps the block in BEGIN / COMMIT,
+    rolled back if the block raises.
+    """
+    import psycopg2
+    pool = _postgres_pool()
+    with _pg_slots:
+        raw = pool.getconn()
+        broken = False
+        try:
+            if raw.closed:  # dropped while idle in the pool
+                pool.putconn(raw, close=True)
+                raw = pool.getconn()
+            if raw.autocommit == transaction:
+                raw.autocommit = not transaction
+            yield _PostgresConnection(raw)
+            if transaction:
+                raw.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except BaseException:
+            if transaction:
+                raw.rollback()
+            raise
+        finally:
+            pool.putconn(raw, close=broken or bool(raw.closed))
+
+def _connect(read_only=False):
+    # Readers run in autocommit: an implicit BEGIN left open would pin the thread's snapshot
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=30, cached_statements=256,
+                           isolation_level=None if read_only else "")
+    if not read_only:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # new files; existing ones are migrated by init_db
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+@contextmanager
+def _db(write=False):
+    """Yield a connection; a write block is committed (or rolled back) when it ends
+
+    Read blocks get this thread's read-only connection and never wait on the write lock.
+    """
+    global _conn
+    if CACHE_BACKEND == "postgres":
+        with _pg_connection(transaction=write) as conn:
+            yield conn
+        return
+    if not write:
+        conn = getattr(_read_local, "conn", None)
+        if conn is None:
+            conn = _read_local.conn = _connect(read_only=True)
+        yield conn
+        return
+    with _conn_lock:
+        if _conn is None:
+            _conn = _connect()
+        try:
+            yield _conn
+        except BaseException:
+            _conn.rollback()
+            raise
+        _conn.commit()
+
+def flush_db():
+    """Commit a transaction left open on the write connection (normally a no-op)"""
+    with _conn_lock:
+        if _conn is not None and getattr(_conn, "in_transaction", False):
+            _conn.commit()
+
+def _flush_on_exit():
+    flush_key_states()
+    flush_llm_metrics()
+    flush_db()
+
+atexit.register(_flush_on_exit)
 
 # ---- DB Init ----
+def _table_columns(conn, table):
+    if CACHE_BACKEND == "postgres":
+        rows = conn.execute("SELECT column_name FROM information_schema.columns WHERE table_name = ?",
+                            (table,)).fetchall()
+        return {row[0] for row in rows}
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _reclaim_free_pages(conn):
+    """Return free SQLite pages to the filesystem; returns the bytes reclaimed"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free_pages:
+        # A bare execute() steps the pragma once and frees a single page
+        conn.executescript("PRAGMA incremental_vacuum;")
+        free_pages -= conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return free_pages * page_size
+
+def _migrate_auto_vacuum(conn):
+    """Switch a database created before auto_vacuum=INCREMENTAL over (one-time VACUUM)"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    conn.commit()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+    logger.info(f"LLM cache migrated to incremental auto-vacuum: "
+                f"reclaimed {(pages_before - pages_after) * page_size} bytes")
+
 def init_db():
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
+    with _db(write=True) as conn:
+        if CACHE_BACKEND == "sqlite":
+            _migrate_auto_vacuum(conn)
         conn.execute("""
             CREATE TABLE IF NOT EXISTS llm_cache (
                 prompt_hash TEXT PRIMARY KEY,
-                response TEXT,
+                response BLOB,  -- compressed payload, or plain text below CACHE_COMPRESS_MIN_BYTES
                 timestamp DATETIME
             )
         """)
@@ -38,17 +317,103 @@ def init_db():
                 last_reset DATE
             )
         """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_embeddings (
+                prompt_hash TEXT PRIMARY KEY,
+                family TEXT,
+                scope TEXT,
+                embedding BLOB
+            )
+        """)
+        # Columns added after the first release: payload size and last-access time (for LRU)
+        columns = _table_columns(conn, "llm_cache")
+        if "size" not in columns:
+            conn.execute("ALTER TABLE llm_cache ADD COLUMN size INTEGER")
+        if "last_access" not in columns:
+            conn.execute("ALTER TABLE llm_cache ADD COLUMN last_access DATETIME")
+        # Circuit-breaker state: consecutive failures and when the key may be probed again
+        columns = _table_columns(conn, "key_failures")
+        if "failures" not in columns:
+            conn.execute("ALTER TABLE key_failures ADD COLUMN failures INTEGER DEFAULT 1")
+        if "retry_at" not in columns:
+            conn.execute("ALTER TABLE key_failures ADD COLUMN retry_at DATETIME")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_metrics (
+                ts DATETIME,
+                family TEXT,
+                model TEXT,
+                key_hint TEXT,
+                latency_ms REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                retries INTEGER,
+                cache TEXT,
+                ok INTEGER
+            )
+        """)
+        columns = _table_columns(conn, "llm_metrics")
+        if "cached_tokens" not in columns:
+            conn.execute("ALTER TABLE llm_metrics ADD COLUMN cached_tokens INTEGER")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                analysis_key TEXT PRIMARY KEY,
+                payload BLOB,  -- compressed JSON document
+                timestamp DATETIME
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_metrics_ts ON llm_metrics(ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_timestamp ON llm_cache(timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_key_failures_fail_time ON key_failures(fail_time)")
+        conn.commit()
 init_db()
 
 # ---- Auto-clean expired cache ----
 def cleanup_cache():
+    """Purge expired cache rows and long-dead keys (run by the janitor, never inline)"""
     cutoff = datetime.utcnow() - timedelta(hours=CACHE_EXPIRY_HOURS)
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
+    with _db(write=True) as conn:
         conn.execute("DELETE FROM llm_cache WHERE timestamp < ?", (cutoff.strftime("%Y-%m-%d %H:%M:%S"),))
+    flush_cache_access_times()
+    enforce_cache_size()
     # Auto-remove dead keys older than DEAD_KEY_REMOVE_DAYS
     cutoff_dead = datetime.utcnow() - timedelta(days=DEAD_KEY_REMOVE_DAYS)
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
+    with _db(write=True) as conn:
         conn.execute("DELETE FROM key_failures WHERE fail_time < ?", (cutoff_dead.strftime("%Y-%m-%d %H:%M:%S"),))
+        cutoff_metrics = datetime.utcnow() - timedelta(days=METRICS_RETENTION_DAYS)
+        conn.execute("DELETE FROM llm_metrics WHERE ts < ?", (cutoff_metrics.strftime("%Y-%m-%d %H:%M:%S"),))
+        cutoff_analysis = datetime.utcnow() - timedelta(days=ANALYSIS_CACHE_EXPIRY_DAYS)
+        conn.execute("DELETE FROM analysis_cache WHERE timestamp < ?", (cutoff_analysis.strftime("%Y-%m-%d %H:%M:%S"),))
+        # Embeddings whose cached response has expired can never produce a hit
+        conn.execute("DELETE FROM llm_embeddings WHERE prompt_hash NOT IN (SELECT prompt_hash FROM llm_cache)")
+
+# ---- Background Janitor ----
+_janitor_started = False
+_janitor_lock = threading.Lock()
+
+def _janitor_loop(interval):
+    last_cleanup = time.monotonic()
+    while True:
+        time.sleep(min(interval, KEY_STATE_FLUSH_SECONDS))
+        try:
+            flush_key_states()
+            flush_llm_metrics()
+            if time.monotonic() - last_cleanup >= interval:
+                cleanup_cache()
+                last_cleanup = time.monotonic()
+            flush_db()
+        except Exception as e:
+            logger.error(f"LLM cache janitor failed: {e}")
+
+def start_cache_janitor(interval=JANITOR_INTERVAL_SECONDS):
+    """Start the daemon thread that expires cache rows off the request path (idempotent)"""
+    global _janitor_started
+    with _janitor_lock:
+        if _janitor_started:
+            return
+        _janitor_started = True
+    cleanup_cache()
+    threading.Thread(target=_janitor_loop, args=(interval,), name="llm-cache-janitor", daemon=True).start()
 
 # ---- Load API Keys ----
 def load_groq_api_keys():
@@ -66,142 +431,1568 @@ def load_groq_api_keys():
         keys = [k.strip() for k in env_keys.split(",") if k.strip()]
         random.shuffle(keys)
         return keys
+    if LLM_BACKEND != "groq":
+        return [f"offline-key-{i}" for i in range(OFFLINE_KEY_COUNT)]
     raise ValueError("❌ No Groq API keys found.")
 
 # ---- Hash Prompt ----
-def hash_prompt(prompt: str, model: str) -> str:
-    """Create a unique hash for caching based on model + prompt"""
+def hash_prompt(prompt, model: str) -> str:
+    """Create a unique hash for caching based on model + prompt (text or message list)"""
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt, ensure_ascii=False)
     return hashlib.sha256(f"{model}|{prompt}".encode("utf-8")).hexdigest()
 
+def prompt_text(prompt):
+    """Flatten a prompt given as [(role, content), ...] messages into plain text"""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n\n".join(content for _, content in prompt)
+
 # ---- Cache Handling ----
+# Two tiers: a per-process LRU (hot prompts, no SQL, no timestamp parsing) in
+# front of the llm_cache table. Writes go through to SQLite; SQLite hits are
+# promoted into memory with the remaining TTL of the stored row.
+_memory_cache = OrderedDict()  # prompt_hash -> (response, expires_at epoch seconds)
+_memory_cache_lock = threading.Lock()
+_cache_stats = {"memory_hits": 0, "sqlite_hits": 0, "misses": 0, "evictions": 0}
+
+def _memory_get(key):
+    with _memory_cache_lock:
+        entry = _memory_cache.get(key)
+        if entry is None:
+            return None
+        response, expires_at = entry
+        if expires_at < time.time():
+            del _memory_cache[key]
+            return None
+        _memory_cache.move_to_end(key)
+        _cache_stats["memory_hits"] += 1
+        return response
+
+def _memory_put(key, response, expires_at):
+    with _memory_cache_lock:
+        _memory_cache[key] = (response, expires_at)
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_MAX_ENTRIES:
+            _memory_cache.popitem(last=False)
+            _cache_stats["evictions"] += 1
+
+# ---- Compressed Storage & Size Budget ----
+# Responses are stored as BLOBs tagged with their codec (zstd when installed, else
+# zlib); legacy and short rows stay TEXT. Hits only record their access time in
+# memory and the janitor writes them back before evicting the least recently used
+# rows once the payload exceeds CACHE_MAX_SIZE_MB.
+_pending_access = {}  # prompt_hash -> last access timestamp awaiting write-back
+_pending_access_lock = threading.Lock()
+
+def _compress_response(response):
+    raw = response.encode("utf-8")
+    if len(raw) < CACHE_COMPRESS_MIN_BYTES:
+        # Postgres keeps llm_cache.response as BYTEA, so plain text gets a codec tag too
+        return b"pt" + raw if CACHE_BACKEND == "postgres" else response
+    if zstandard is not None:
+        return b"zs" + zstandard.ZstdCompressor(level=6).compress(raw)
+    return b"zl" + zlib.compress(raw, 6)
+
+def _decompress_response(value):
+    if isinstance(value, memoryview):  # psycopg2 returns BYTEA as memoryview
+        value = bytes(value)
+    if not isinstance(value, bytes):
+        return value
+    codec, payload = value[:2], value[2:]
+    if codec == b"pt":
+        return payload.decode("utf-8")
+    if codec == b"zs":
+        if zstandard is None:
+            raise ValueError("cache row is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    return zlib.decompress(payload).decode("utf-8")
+
+def _note_access(key):
+    with _pending_access_lock:
+        _pending_access[key] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+def flush_cache_access_times():
+    """Write buffered last-access times back to llm_cache"""
+    with _pending_access_lock:
+        accesses = [(ts, key) for key, ts in _pending_access.items()]
+        _pending_access.clear()
+    if accesses:
+        with _db(write=True) as conn:
+            conn.executemany("UPDATE llm_cache SET last_access = ? WHERE prompt_hash = ?", accesses)
+
+def enforce_cache_size(max_mb=None):
+    """Evict least recently used llm_cache rows until the payload fits the budget"""
+    budget = int((CACHE_MAX_SIZE_MB if max_mb is None else max_mb) * 1024 * 1024)
+    with _db(write=True) as conn:
+        total = conn.execute("SELECT COALESCE(SUM(COALESCE(size, LENGTH(response))), 0) FROM llm_cache").fetchone()[0]
+        if total <= budget:
+            return 0
+        excess, victims = total - budget, []
+        rows = conn.execute("""
+            SELECT prompt_hash, COALESCE(size, LENGTH(response)) FROM llm_cache
+            ORDER BY COALESCE(last_access, timestamp)
+        """)
+        for prompt_hash, size in rows:
+            if excess <= 0:
+                break
+            victims.append((prompt_hash,))
+            excess -= size or 0
+        conn.executemany("DELETE FROM llm_cache WHERE prompt_hash = ?", victims)
+        conn.commit()
+        reclaimed = _reclaim_free_pages(conn) if CACHE_BACKEND == "sqlite" else 0
+    with _memory_cache_lock:
+        for (prompt_hash,) in victims:
+            _memory_cache.pop(prompt_hash, None)
+    logger.info(f"LLM cache over budget: evicted {len(victims)} least recently used rows, "
+                f"reclaimed {reclaimed} bytes")
+    return len(victims)
+
+def get_cache_stats():
+    """Return hit/miss counters for both cache tiers"""
+    with _memory_cache_lock:
+        stats = dict(_cache_stats, memory_entries=len(_memory_cache))
+    lookups = stats["memory_hits"] + stats["sqlite_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["memory_hits"] + stats["sqlite_hits"]) / lookups if lookups else 0.0
+    return stats
+
 def get_cached_response(prompt: str, model: str):
     """Fetch cached response if still valid"""
-    key = hash_prompt(prompt, model)
+    return _get_cached_by_key(hash_prompt(prompt, model))
+
+def _get_cached_by_key(key):
+    response = _memory_get(key)
+    if response is not None:
+        _note_access(key)
+        return response
     cutoff = datetime.utcnow() - timedelta(hours=CACHE_EXPIRY_HOURS)
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
-        row = conn.execute("SELECT response, timestamp FROM llm_cache WHERE prompt_hash = ?", (key,)).fetchone()
+    with _db() as conn:
+        row = conn.execute(
+            "SELECT response, timestamp FROM llm_cache WHERE prompt_hash = ? AND timestamp >= ?",
+            (key, cutoff.strftime("%Y-%m-%d %H:%M:%S"))
+        ).fetchone()
     if row:
-        response, ts_str = row
-        if datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S") >= cutoff:
-            return response
+        stored, ts_str = row
+        try:
+            response = _decompress_response(stored)
+        except Exception as e:
+            logger.warning(f"Unreadable llm_cache row {key[:12]}: {e}")
+            with _memory_cache_lock:
+                _cache_stats["misses"] += 1
+            return None
+        _note_access(key)
+        stored_at = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
+        expires_at = time.time() + (stored_at - cutoff).total_seconds()
+        _memory_put(key, response, expires_at)
+        with _memory_cache_lock:
+            _cache_stats["sqlite_hits"] += 1
+        return response
+    with _memory_cache_lock:
+        _cache_stats["misses"] += 1
     return None
 
 def set_cached_response(prompt: str, model: str, response: str):
     """Store response in cache"""
     key = hash_prompt(prompt, model)
     ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
+    _memory_put(key, response, time.time() + CACHE_EXPIRY_HOURS * 3600)
+    stored = _compress_response(response)
+    size = len(stored) if isinstance(stored, bytes) else len(stored.encode("utf-8"))
+    with _db(write=True) as conn:
+        conn.execute("""
+            INSERT INTO llm_cache (prompt_hash, response, timestamp, size, last_access)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(prompt_hash) DO UPDATE SET
+                response = excluded.response, timestamp = excluded.timestamp,
+                size = excluded.size, last_access = excluded.last_access
+        """, (key, stored, ts, size, ts))
+
+def invalidate_cached_response(prompt, model: str):
+    """Drop a cached response (e.g. one that failed structured-output validation)"""
+    _invalidate_cached_key(hash_prompt(prompt, model))
+
+def _invalidate_cached_key(key):
+    with _memory_cache_lock:
+        _memory_cache.pop(key, None)
+    with _db(write=True) as conn:
+        conn.execute("DELETE FROM llm_cache WHERE prompt_hash = ?", (key,))
+
+# ---- Analysis Cache ----
+# Whole analysis results (e.g. a screened resume) stored as JSON under a content key
+# from analysis_cache_key, so repeating identical work skips every LLM call behind it.
+def _normalize_key_input(value):
+    """Collapse whitespace in strings (recursively), so cosmetic edits keep the same key"""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize_key_input(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_key_input(v) for v in value]
+    return value
+
+def analysis_cache_key(content, **inputs):
+    """SHA-256 over raw content bytes plus every (JSON-serializable) input the result depends on"""
+    digest = hashlib.sha256(content)
+    settings = {name: _normalize_key_input(value) for name, value in inputs.items()}
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def get_cached_analysis(key):
+    """Return the stored JSON document for key, or None if absent or expired"""
+    cutoff = datetime.utcnow() - timedelta(days=ANALYSIS_CACHE_EXPIRY_DAYS)
+    with _db() as conn:
+        row = conn.execute(
+            "SELECT payload FROM analysis_cache WHERE analysis_key = ? AND timestamp >= ?",
+            (key, cutoff.strftime("%Y-%m-%d %H:%M:%S"))
+        ).fetchone()
+    if not row:
+        return None
+    try:
+        return json.loads(_decompress_response(row[0]))
+    except Exception as e:
+        logger.warning(f"Unreadable analysis_cache row {key[:12]}: {e}")
+        return None
+
+def set_cached_analysis(key, document):
+    """Store a JSON-serializable document under key"""
+    ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    stored = _compress_response(json.dumps(document))
+    with _db(write=True) as conn:
         conn.execute("""
-            INSERT OR REPLACE INTO llm_cache (prompt_hash, response, timestamp)
+            INSERT INTO analysis_cache (analysis_key, payload, timestamp)
             VALUES (?, ?, ?)
-        """, (key, response, ts))
+            ON CONFLICT(analysis_key) DO UPDATE SET
+                payload = excluded.payload, timestamp = excluded.timestamp
+        """, (key, stored, ts))
+
+# ---- Semantic Cache ----
+# Prompts are matched on their *variable* part only (semantic_text, e.g. the resume
+# or job description): MiniLM truncates at 256 word pieces, so embedding the whole
+# prompt would mostly embed the static instructions. Everything else in the prompt
+# (instructions, weights, other inputs) must be byte-identical, which is enforced
+# by the scope hash. Long texts are embedded in chunks and mean-pooled.
+_embedding_model = None
+_embedding_lock = threading.Lock()
+_semantic_indexes = {}  # family -> (faiss index, [(prompt_hash, scope), ...])
+_semantic_lock = threading.Lock()
+
+def get_embedding_model():
+    """Return the shared all-MiniLM-L6-v2 embedding model (loaded once per process)"""
+    global _embedding_model
+    with _embedding_lock:
+        if _embedding_model is None:
+            import torch
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            _embedding_model = HuggingFaceEmbeddings(
+                model_name=EMBEDDING_MODEL_NAME, model_kwargs={"device": device}
+            )
+        return _embedding_model
+
+def _embed_text(text, words_per_chunk=180):
+    import numpy as np
+    words = text.split()
+    chunks = [" ".join(words[i:i + words_per_chunk]) for i in range(0, len(words), words_per_chunk)] or [""]
+    vectors = np.asarray(get_embedding_model().embed_documents(chunks), dtype="float32")
+    vector = vectors.mean(axis=0)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).astype("float32")
+
+def _semantic_scope(prompt, semantic_text, model):
+    if isinstance(prompt, str):
+        return hash_prompt(prompt.replace(semantic_text, "\x00"), model)
+    return hash_prompt([(role, content.replace(semantic_text, "\x00")) for role, content in prompt], model)
+
+def _load_semantic_index(family, dim):
+    import faiss
+    import numpy as np
+    index = faiss.IndexFlatIP(dim)
+    entries = []
+    with _db() as conn:
+        rows = conn.execute(
+            "SELECT prompt_hash, scope, embedding FROM llm_embeddings WHERE family = ?", (family,)
+        ).fetchall()
+    if rows:
+        index.add(np.vstack([np.frombuffer(r[2], dtype="float32") for r in rows]))
+        entries = [(r[0], r[1]) for r in rows]
+    return index, entries
+
+def _semantic_lookup(prompt, model, family, semantic_text):
+    """Return (cached response or None, embedding to store on a miss)"""
+    try:
+        vector = _embed_text(semantic_text)
+        scope = _semantic_scope(prompt, semantic_text, model)
+        with _semantic_lock:
+            if family not in _semantic_indexes:
+                _semantic_indexes[family] = _load_semantic_index(family, vector.shape[0])
+            index, entries = _semantic_indexes[family]
+            if not entries:
+                return None, vector
+            scores, ids = index.search(vector.reshape(1, -1), min(8, len(entries)))
+            candidates = [entries[i] for s, i in zip(scores[0], ids[0])
+                          if i >= 0 and s >= SEMANTIC_CACHE_THRESHOLDS[family]]
+        for prompt_hash, entry_scope in candidates:
+            if entry_scope == scope:
+                response = _get_cached_by_key(prompt_hash)
+                if response is not None:
+                    _trace_source(prompt_hash)
+                    return response, vector
+        return None, vector
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed for '{family}': {e}")
+        return None, None
+
+def _semantic_store(prompt, model, family, semantic_text, vector):
+    key = hash_prompt(prompt, model)
+    scope = _semantic_scope(prompt, semantic_text, model)
+    with _db(write=True) as conn:
+        conn.execute("""
+            INSERT INTO llm_embeddings (prompt_hash, family, scope, embedding)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(prompt_hash) DO UPDATE SET
+                family = excluded.family, scope = excluded.scope, embedding = excluded.embedding
+        """, (key, family, scope, vector.tobytes()))
+    with _semantic_lock:
+        if family not in _semantic_indexes:
+            return
+        index, entries = _semantic_indexes[family]
+        if len(entries) >= SEMANTIC_INDEX_MAX_ENTRIES:
+            _semantic_indexes.pop(family)  # reloaded (without expired rows) on next lookup
+            return
+        index.add(vector.reshape(1, -1))
+        entries.append((key, scope))
 
 # ---- Key Tracking ----
+# Key health lives in memory: selection is a dict lookup per key, with no SQL on
+# the request path. Rows in key_failures / key_usage are loaded once per process
+# and dirty states are written back by the janitor every KEY_STATE_FLUSH_SECONDS.
+#
+# Each key is a circuit breaker. A failure opens it for a cooldown that doubles with
+# every consecutive failure (capped per reason) or lasts exactly as long as the
+# server's Retry-After. Once the cooldown passes the key is half-open: a single probe
+# request may use it, and its outcome closes the breaker or re-opens it for longer.
+class _KeyState:
+    __slots__ = ("cooldown_until", "fail_time", "reason", "failures", "probe_started",
+                 "usage_count", "usage_day", "usage_delta", "failure_dirty")
+
+    def __init__(self):
+        self.cooldown_until = 0.0  # epoch seconds
+        self.fail_time = None  # "%Y-%m-%d %H:%M:%S" UTC, as stored in key_failures
+        self.reason = None  # None = closed; otherwise open until cooldown_until, then half-open
+        self.failures = 0  # consecutive failures since the breaker last closed
+        self.probe_started = None  # epoch seconds of the in-flight half-open probe
+        self.usage_count = 0  # today's calls across processes, as of the last flush, plus usage_delta
+        self.usage_day = None
+        self.usage_delta = 0  # calls made by this process since the last flush
+        self.failure_dirty = False
+
+_key_states = {}
+_key_states_lock = threading.Lock()
+_key_states_loaded = False
+
+def _cooldown_seconds(reason, failures=1, retry_after=None):
+    if retry_after is not None:
+        return retry_after
+    cap = {"quota": QUOTA_COOLDOWN_MINUTES * 60, "auth": AUTH_COOLDOWN_HOURS * 3600}.get(
+        reason, FAILURE_COOLDOWN_MINUTES * 60)
+    base = CIRCUIT_BASE_COOLDOWN_SECONDS.get(reason, CIRCUIT_BASE_COOLDOWN_SECONDS["error"])
+    return min(base * 2 ** (max(failures, 1) - 1), cap)
+
+def _utc_epoch(ts_str):
+    return datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+def _utc_str(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def _load_key_states():
+    """Populate the in-memory table from the database (caller holds _key_states_lock)"""
+    global _key_states_loaded
+    with _db() as conn:
+        failures = conn.execute(
+            "SELECT api_key, fail_time, reason, failures, retry_at FROM key_failures").fetchall()
+        usage = conn.execute("SELECT api_key, usage_count, last_reset FROM key_usage").fetchall()
+    for api_key, fail_time, reason, count, retry_at in failures:
+        state = _key_states.setdefault(api_key, _KeyState())
+        state.fail_time, state.reason, state.failures = fail_time, reason, count or 1
+        state.cooldown_until = (_utc_epoch(retry_at) if retry_at else
+                                _utc_epoch(fail_time) + _cooldown_seconds(reason, state.failures))
+    for api_key, usage_count, last_reset in usage:
+        state = _key_states.setdefault(api_key, _KeyState())
+        state.usage_count, state.usage_day = usage_count, last_reset
+    _key_states_loaded = True
+
+def _key_state(api_key):
+    """Return the state for a key (caller holds _key_states_lock)"""
+    if not _key_states_loaded:
+        _load_key_states()
+    state = _key_states.get(api_key)
+    if state is None:
+        state = _key_states[api_key] = _KeyState()
+    return state
+
+def _circuit_allows(state, now):
+    """Closed, or half-open with no probe in flight (caller holds _key_states_lock)"""
+    if state.reason is None:
+        return True
+    if state.cooldown_until > now:
+        return False
+    return state.probe_started is None or now - state.probe_started >= CIRCUIT_PROBE_TIMEOUT_SECONDS
+
+def _key_admits(api_key):
+    with _key_states_lock:
+        return _circuit_allows(_key_state(api_key), time.time())
+
+def _claim_key(api_key):
+    """Claim a key picked by the scheduler; a half-open key admits only one probe"""
+    now = time.time()
+    with _key_states_lock:
+        state = _key_state(api_key)
+        if not _circuit_allows(state, now):
+            return False
+        if state.reason is not None:
+            state.probe_started = now
+        return True
+
+def _release_probe(api_key):
+    """Free a half-open key whose probe failed for reasons unrelated to the key"""
+    with _key_states_lock:
+        _key_state(api_key).probe_started = None
+
 def increment_key_usage(api_key):
-    """Track daily usage count per key"""
+    """Track daily usage count per key (added to key_usage by the next flush)"""
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
-        row = conn.execute("SELECT usage_count, last_reset FROM key_usage WHERE api_key=?", (api_key,)).fetchone()
-        if row:
-            usage_count, last_reset = row
-            if last_reset != today:
-                conn.execute("UPDATE key_usage SET usage_count=1, last_reset=? WHERE api_key=?", (today, api_key))
-            else:
-                conn.execute("UPDATE key_usage SET usage_count=usage_count+1 WHERE api_key=?", (api_key,))
-        else:
-            conn.execute("INSERT INTO key_usage (api_key, usage_count, last_reset) VALUES (?, ?, ?)",
-                         (api_key, 1, today))
+    with _key_states_lock:
+        state = _key_state(api_key)
+        if state.usage_day != today:
+            # Unflushed calls from the previous day no longer count against any quota
+            state.usage_day, state.usage_count, state.usage_delta = today, 0, 0
+        state.usage_count += 1
+        state.usage_delta += 1
 
-def mark_key_failure(api_key, reason="error"):
-    """Mark a key as failed (with cooldown tracking)"""
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
-        conn.execute("""
-            INSERT OR REPLACE INTO key_failures (api_key, fail_time, reason)
-            VALUES (?, ?, ?)
-        """, (api_key, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), reason))
+def mark_key_failure(api_key, reason="error", retry_after=None):
+    """Open the key's circuit for an adaptive cooldown (or the server's Retry-After)"""
+    evict_llm_clients(api_key)
+    now = time.time()
+    with _key_states_lock:
+        state = _key_state(api_key)
+        # Requests already in flight when the breaker opened don't extend the backoff
+        if state.cooldown_until <= now:
+            state.failures += 1
+        state.fail_time = _utc_str(now)
+        state.reason = reason
+        state.probe_started = None
+        state.cooldown_until = max(state.cooldown_until,
+                                   now + _cooldown_seconds(reason, state.failures, retry_after))
+        state.failure_dirty = True
 
 def clear_key_failure(api_key):
     """Remove a key from failure list"""
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
-        conn.execute("DELETE FROM key_failures WHERE api_key = ?", (api_key,))
+    with _key_states_lock:
+        state = _key_state(api_key)
+        if state.reason is not None:
+            state.fail_time = state.reason = state.probe_started = None
+            state.failures = 0
+            state.cooldown_until = 0.0
+            state.failure_dirty = True
 
 def get_healthy_keys(api_keys):
-    """Return keys that are not in cooldown and under quota"""
-    now = datetime.utcnow()
-    healthy = []
-    with sqlite3.connect(DB_FILE, check_same_thread=False) as conn:
+    """Return keys whose circuit admits a request and that are under quota"""
+    now = time.time()
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    healthy, exhausted = [], []
+    with _key_states_lock:
         for key in api_keys:
-            # Check cooldown
-            row = conn.execute("SELECT fail_time, reason FROM key_failures WHERE api_key = ?", (key,)).fetchone()
-            if row:
-                fail_time, reason = row
-                fail_dt = datetime.strptime(fail_time, "%Y-%m-%d %H:%M:%S")
-                cooldown = QUOTA_COOLDOWN_MINUTES if reason == "quota" else FAILURE_COOLDOWN_MINUTES
-                if (now - fail_dt).total_seconds() < cooldown * 60:
-                    continue
-            # Check quota
-            usage = conn.execute("SELECT usage_count, last_reset FROM key_usage WHERE api_key=?", (key,)).fetchone()
-            if usage:
-                usage_count, last_reset = usage
-                if last_reset != now.strftime("%Y-%m-%d"):
-                    usage_count = 0
-                if usage_count >= DAILY_KEY_LIMIT:
-                    mark_key_failure(key, "quota")
-                    continue
+            state = _key_state(key)
+            if not _circuit_allows(state, now):
+                continue
+            if state.usage_day == today and state.usage_count >= DAILY_KEY_LIMIT:
+                exhausted.append(key)
+                continue
             healthy.append(key)
+    if exhausted:
+        # Daily budget is spent: keep the key out until the UTC day rolls over
+        midnight = (datetime.utcnow() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        until_reset = (midnight - datetime.utcnow()).total_seconds()
+        for key in exhausted:
+            mark_key_failure(key, "quota", retry_after=until_reset)
     random.shuffle(healthy)
     return healthy
 
+def flush_key_states():
+    """Write dirty key health to key_failures and add usage deltas to key_usage
+
+    Usage is flushed as a delta through one UPSERT per key, so several app processes
+    sharing the database add to the same counter instead of overwriting each other;
+    the daily reset happens in SQL when the stored day differs. Both tables are then
+    read back and merged, so DAILY_KEY_LIMIT counts usage from all processes and a
+    key that tripped in another worker stops being scheduled here too. If the write
+    fails, the snapshot is handed back so the next flush retries it.
+    """
+    with _key_states_lock:
+        failures, usage = [], []
+        for api_key, state in _key_states.items():
+            if state.failure_dirty:
+                failures.append((api_key, state.fail_time, state.reason, state.failures,
+                                 _utc_str(state.cooldown_until) if state.reason else None))
+                state.failure_dirty = False
+            if state.usage_delta:
+                usage.append((api_key, state.usage_delta, state.usage_day))
+                state.usage_delta = 0
+    try:
+        shared_failures, shared_usage = _write_key_states(failures, usage)
+    except Exception:
+        _restore_key_states(failures, usage)
+        raise
+    _merge_shared_key_states(shared_failures, shared_usage)
+
+def _write_key_states(failures, usage):
+    """Persist a flush snapshot in one transaction and return both tables as stored"""
+    with _db(write=True) as conn:
+        for api_key, fail_time, reason, count, retry_at in failures:
+            if reason is None:
+                conn.execute("DELETE FROM key_failures WHERE api_key = ?", (api_key,))
+            else:
+                conn.execute("""
+                    INSERT INTO key_failures (api_key, fail_time, reason, failures, retry_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(api_key) DO UPDATE SET
+                        fail_time = excluded.fail_time, reason = excluded.reason,
+                        failures = excluded.failures, retry_at = excluded.retry_at
+                """, (api_key, fail_time, reason, count, retry_at))
+        conn.executemany("""
+            INSERT INTO key_usage (api_key, usage_count, last_reset)
+            VALUES (?, ?, ?)
+            ON CONFLICT(api_key) DO UPDATE SET
+                usage_count = CASE WHEN key_usage.last_reset = excluded.last_reset
+                                   THEN key_usage.usage_count + excluded.usage_count
+                                   ELSE excluded.usage_count END,
+                last_reset = excluded.last_reset
+        """, usage)
+        shared_failures = conn.execute(
+            "SELECT api_key, fail_time, reason, failures, retry_at FROM key_failures").fetchall()
+        shared_usage = conn.execute("SELECT api_key, usage_count, last_reset FROM key_usage").fetchall()
+    return shared_failures, shared_usage
+
+def _restore_key_states(failures, usage):
+    """Put an unwritten flush snapshot back: failures stay dirty, usage deltas are re-added"""
+    with _key_states_lock:
+        for api_key, *_ in failures:
+            _key_state(api_key).failure_dirty = True  # the current state is written next time
+        for api_key, delta, day in usage:
+            state = _key_state(api_key)
+            if state.usage_day == day:  # a delta from a day that has since rolled over is moot
+                state.usage_delta += delta
+
+def _merge_shared_key_states(failures, usage):
+    """Fold key health and usage written by other processes into the local table"""
+    shared = {row[0]: row for row in failures}
+    with _key_states_lock:
+        for api_key, state in _key_states.items():
+            if state.failure_dirty or api_key in shared or not state.reason:
+                continue
+            # Flushed as open but gone from the table: another worker closed it
+            state.cooldown_until, state.fail_time, state.reason = 0.0, None, None
+            state.failures, state.probe_started = 0, None
+        for api_key, fail_time, reason, count, retry_at in failures:
+            state = _key_state(api_key)
+            if state.failure_dirty or (state.fail_time and state.fail_time >= fail_time):
+                continue
+            state.fail_time, state.reason, state.failures = fail_time, reason, count or 1
+            state.cooldown_until = (_utc_epoch(retry_at) if retry_at else
+                                    _utc_epoch(fail_time) + _cooldown_seconds(reason, state.failures))
+            state.probe_started = None
+        for api_key, usage_count, last_reset in usage:
+            state = _key_state(api_key)
+            if state.usage_day is None or state.usage_day < last_reset:
+                state.usage_day, state.usage_delta = last_reset, 0
+            if state.usage_day == last_reset:
+                state.usage_count = usage_count + state.usage_delta
+
+def get_key_usage():
+    """Per-key daily usage and circuit state for the configured admin keys"""
+    flush_key_states()
+    try:
+        api_keys = load_groq_api_keys()
+    except ValueError:
+        api_keys = []
+    now = time.time()
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    rows = []
+    with _key_states_lock:
+        for api_key in sorted(api_keys):
+            state = _key_state(api_key)
+            if state.reason is None:
+                circuit = "closed"
+            elif state.cooldown_until > now:
+                circuit = "open"
+            else:
+                circuit = "half-open"
+            rows.append({
+                "key": _key_hint(api_key),
+                "used_today": state.usage_count if state.usage_day == today else 0,
+                "daily_limit": DAILY_KEY_LIMIT,
+                "circuit": circuit,
+                "last_failure": state.reason,
+                "consecutive_failures": state.failures,
+                "retry_in_s": max(0, round(state.cooldown_until - now)) if state.reason else 0,
+            })
+    return rows
+
+# ---- Client Registry ----
+# One warmed ChatGroq per (api_key, model, temperature). Every client shares a single
+# keep-alive (HTTP/2 when `h2` is installed) connection pool: the API key is only a
+# header, so connections to api.groq.com can be reused across keys. Async clients are
+# bound to the event loop that created their connections, so they are kept per loop and
+# closed when that loop shuts down its async generators (asyncio.run does this on exit).
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_http_client = None
+_llm_clients = {}  # (api_key, model, temperature) -> ChatGroq
+_async_llm_clients = weakref.WeakKeyDictionary()  # event loop -> (AsyncClient, {(key, model, temp): ChatGroq}, closer)
+_client_lock = threading.Lock()
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+
+def get_llm_client(api_key, model, temperature):
+    """Return the cached ChatGroq (or offline stand-in) for this key/model/temperature"""
+    global _http_client
+    client_key = (api_key, model, temperature)
+    with _client_lock:
+        llm = _llm_clients.get(client_key)
+        if llm is None and LLM_BACKEND != "groq":
+            llm = _llm_clients[client_key] = _offline_client(api_key, model)
+        elif llm is None:
+            if _http_client is None:
+                import httpx
+                _http_client = httpx.Client(http2=_HTTP2_AVAILABLE, limits=_http_limits())
+            llm = ChatGroq(model=model, temperature=temperature, groq_api_key=api_key,
+                           http_client=_http_client)
+            _llm_clients[client_key] = llm
+        return llm
+
+async def _close_on_loop_shutdown(http_client):
+    """Parked async generator: the loop's shutdown_asyncgens() resumes it to close the client"""
+    try:
+        yield
+    finally:
+        _async_llm_clients.pop(asyncio.get_running_loop(), None)
+        await http_client.aclose()
+
+async def _get_async_llm_client(api_key, model, temperature):
+    if LLM_BACKEND != "groq":
+        return get_llm_client(api_key, model, temperature)  # offline clients are loop-agnostic
+    loop = asyncio.get_running_loop()
+    client_key = (api_key, model, temperature)
+    closer = None
+    with _client_lock:
+        if loop not in _async_llm_clients:
+            import httpx
+            http_client = httpx.AsyncClient(http2=_HTTP2_AVAILABLE, limits=_http_limits())
+            closer = _close_on_loop_shutdown(http_client)
+            _async_llm_clients[loop] = (http_client, {}, closer)
+        http_client, llms, _ = _async_llm_clients[loop]
+        llm = llms.get(client_key)
+        if llm is None:
+            llm = ChatGroq(model=model, temperature=temperature, groq_api_key=api_key,
+                           http_async_client=http_client)
+            llms[client_key] = llm
+    if closer is not None:
+        await closer.asend(None)  # started, so the loop tracks it until shutdown
+    return llm
+
+_offline_backend = None
+
+def _offline_client(api_key, model):
+    """Client for LLM_BACKEND=replay|fake (called with _client_lock held)"""
+    global _offline_backend
+    from llm_backends import FakeBackend, OfflineClient, ReplayBackend
+    if _offline_backend is None:
+        if LLM_BACKEND not in ("replay", "fake"):
+            logger.warning(f"Unknown LLM_BACKEND {LLM_BACKEND!r}; using the fake backend")
+        _offline_backend = FakeBackend.from_env()
+        if LLM_BACKEND == "replay":
+            _offline_backend = ReplayBackend(LLM_REPLAY_DB, hash_prompt, _decompress_response,
+                                             fallback=_offline_backend)
+        logger.info(f"LLM calls served offline by the {LLM_BACKEND} backend")
+    return OfflineClient(_offline_backend, api_key, model)
+
+def evict_llm_clients(api_key):
+    """Drop cached clients for a key (called when the key is marked failed)"""
+    with _client_lock:
+        for client_key in [k for k in _llm_clients if k[0] == api_key]:
+            del _llm_clients[client_key]
+        for _, llms, _ in list(_async_llm_clients.values()):
+            for client_key in [k for k in llms if k[0] == api_key]:
+                del llms[client_key]
+
+# ---- Rate Scheduler ----
+# Proactive token buckets (requests/min and tokens/min) per (key, model), matching how
+# Groq applies its limits. Instead of learning about 429s after the fact, each request
+# reserves budget on a key that has headroom right now, and waits (up to
+# RATE_LIMIT_MAX_WAIT_SECONDS) only when every candidate key is drained, on whichever
+# refills first. Budgets can be overridden with GROQ_KEY_LIMITS (secret or env), a JSON
+# object mapping an API key to {"rpm": ..., "tpm": ...}, or to {model: {"rpm": ..., "tpm": ...}}.
+class _RateBucket:
+    __slots__ = ("rpm", "tpm", "requests", "tokens", "updated")
+
+    def __init__(self, rpm, tpm):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests, self.tokens = float(rpm), float(tpm)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        # `now` may predate the last update (read before the caller took _rate_lock)
+        elapsed = max(0.0, now - self.updated)
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, tokens):
+        """Seconds until one request of `tokens` fits (bucket already refilled)"""
+        need_requests = max(0.0, 1 - self.requests) * 60.0 / self.rpm
+        need_tokens = max(0.0, min(tokens, self.tpm) - self.tokens) * 60.0 / self.tpm
+        return max(need_requests, need_tokens)
+
+    def headroom(self):
+        return min(self.requests / self.rpm, self.tokens / self.tpm)
+
+_rate_buckets = {}  # (api_key, model) -> _RateBucket
+_rate_lock = threading.Lock()
+_key_limits = None
+
+def _load_key_limits():
+    raw = None
+    try:
+        import streamlit as st
+        raw = st.secrets.get("GROQ_KEY_LIMITS")
+    except Exception:
+        pass
+    raw = raw or os.getenv("GROQ_KEY_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return dict(json.loads(raw) if isinstance(raw, str) else raw)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Ignoring malformed GROQ_KEY_LIMITS: {e}")
+        return {}
+
+def _bucket(api_key, model):
+    """Return the rate bucket for a key and model (caller holds _rate_lock)"""
+    global _key_limits
+    bucket = _rate_buckets.get((api_key, model))
+    if bucket is None:
+        if _key_limits is None:
+            _key_limits = _load_key_limits()
+        limits = _key_limits.get(api_key, {})
+        limits = limits.get(model, limits)
+        bucket = _rate_buckets[(api_key, model)] = _RateBucket(
+            limits.get("rpm", KEY_REQUESTS_PER_MINUTE), limits.get("tpm", KEY_TOKENS_PER_MINUTE)
+        )
+    return bucket
+
+def _estimate_tokens(prompt):
+    return len(prompt_text(prompt)) // 4 + COMPLETION_TOKEN_ESTIMATE
+
+def _reserve_key(api_keys, model, tokens, preferred=None):
+    """
+    Non-blocking: reserve budget on `preferred` if it has headroom now, else on the key
+    with most headroom. Returns (key, None), or (None, seconds until the first key refills).
+    """
+    now = time.monotonic()
+    with _rate_lock:
+        best, best_score, wait = None, -1.0, None
+        for key in api_keys:
+            bucket = _bucket(key, model)
+            bucket.refill(now)
+            key_wait = bucket.wait_time(tokens)
+            if key_wait > 0:
+                wait = key_wait if wait is None else min(wait, key_wait)
+                continue
+            if key == preferred:
+                best = key
+                break
+            # Prefer headroom, discounted by the key's typical latency (unknown keys get explored)
+            score = bucket.headroom() / (1.0 + (_latency_percentile(key, 0.5) or 0.0))
+            if score > best_score:
+                best, best_score = key, score
+        if best is None:
+            return None, wait
+        bucket = _rate_buckets[(best, model)]
+        bucket.requests -= 1
+        bucket.tokens -= min(tokens, bucket.tpm)
+        return best, None
+
+def _refund_key(api_key, model, prompt):
+    """Return a reservation that was never used (e.g. the circuit breaker refused the key)"""
+    with _rate_lock:
+        bucket = _bucket(api_key, model)
+        bucket.requests = min(bucket.rpm, bucket.requests + 1)
+        bucket.tokens = min(bucket.tpm, bucket.tokens + min(_estimate_tokens(prompt), bucket.tpm))
+
+def acquire_key(api_keys, prompt, model, preferred=None):
+    """Reserve budget on a key with headroom now; when all are drained, wait for the first to refill"""
+    tokens = _estimate_tokens(prompt)
+    deadline = time.monotonic() + RATE_LIMIT_MAX_WAIT_SECONDS
+    while api_keys:
+        key, wait = _reserve_key(api_keys, model, tokens, preferred)
+        if key is not None:
+            return key
+        if time.monotonic() + wait > deadline:
+            return None
+        time.sleep(wait)
+    return None
+
+async def acquire_key_async(api_keys, prompt, model, preferred=None):
+    """Async acquire_key: waits with asyncio.sleep instead of blocking the loop"""
+    tokens = _estimate_tokens(prompt)
+    deadline = time.monotonic() + RATE_LIMIT_MAX_WAIT_SECONDS
+    while api_keys:
+        key, wait = _reserve_key(api_keys, model, tokens, preferred)
+        if key is not None:
+            return key
+        if time.monotonic() + wait > deadline:
+            return None
+        await asyncio.sleep(wait)
+    return None
+
+def _settle_tokens(api_key, model, prompt, message):
+    """Replace the reserved token estimate with the usage Groq actually reported"""
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    actual = usage.get("total_tokens")
+    if actual is None:
+        return
+    with _rate_lock:
+        bucket = _bucket(api_key, model)
+        bucket.tokens = min(bucket.tpm, bucket.tokens + min(_estimate_tokens(prompt), bucket.tpm) - actual)
+
+# ---- Latency Tracking ----
+_key_latencies = {}  # api_key -> deque of recent successful call durations (seconds)
+_latency_lock = threading.Lock()
+
+def _record_latency(api_key, seconds):
+    with _latency_lock:
+        _key_latencies.setdefault(api_key, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+def _latency_percentile(api_key, q, min_samples=1):
+    """Return the q-quantile of a key's recent latencies, or None without enough samples"""
+    with _latency_lock:
+        samples = sorted(_key_latencies.get(api_key, ()))
+    if len(samples) < min_samples or not samples:
+        return None
+    return samples[int(q * (len(samples) - 1))]
+
+def get_key_latency_stats():
+    """Return p50/p95/p99 latency per key (keys masked to their last 4 characters)"""
+    with _latency_lock:
+        keys = list(_key_latencies)
+    return {
+        f"…{key[-4:]}": {
+            "samples": len(_key_latencies[key]),
+            "p50": _latency_percentile(key, 0.5),
+            "p95": _latency_percentile(key, 0.95),
+            "p99": _latency_percentile(key, 0.99),
+        }
+        for key in keys
+    }
+
+# ---- Instrumentation ----
+# Every call_llm / call_llm_async / call_llm_stream call records one row: prompt family,
+# end-to-end latency, token usage, the key that answered, retries and how the cache
+# answered (hit / semantic / coalesced / miss). Rows are buffered in memory and
+# written to llm_metrics by the janitor; the admin tab reads them via get_llm_metrics.
+_current_trace = contextvars.ContextVar("llm_trace", default=None)
+_metrics_buffer = []
+_metrics_lock = threading.Lock()
+
+def _key_hint(api_key, session=None):
+    if session is not None and api_key == _session_user_key(session):
+        return "user"
+    return f"…{api_key[-4:]}" if api_key else None
+
+def _start_trace(family, model):
+    return {"family": family or "other", "model": model, "started": time.perf_counter(),
+            "attempts": 0, "key": None, "prompt_tokens": None, "completion_tokens": None,
+            "cached_tokens": None, "cache": "miss"}
+
+def _trace_attempt(api_key, message=None):
+    """Note an upstream attempt (and, on success, its key and token usage) on the active trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    if message is None:
+        trace["attempts"] += 1
+        return
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    trace["key"] = api_key
+    trace["prompt_tokens"] = usage.get("prompt_tokens")
+    trace["completion_tokens"] = usage.get("completion_tokens")
+    # Prompt-prefix tokens the provider served from its cache (models that support it)
+    trace["cached_tokens"] = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+
+def _trace_cache(outcome):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["cache"] = outcome
+
+def _trace_source(prompt_hash):
+    """Remember the cache row that answered a semantic hit (it belongs to another prompt)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["source_key"] = prompt_hash
+
+def _finish_trace(trace, response, session):
+    row = (
+        datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        trace["family"],
+        trace["model"],
+        _key_hint(trace["key"], session),
+        round((time.perf_counter() - trace["started"]) * 1000, 1),
+        trace["prompt_tokens"],
+        trace["completion_tokens"],
+        trace["cached_tokens"],
+        max(trace["attempts"] - 1, 0),
+        trace["cache"],
+        int(isinstance(response, str) and not response.startswith("❌")),
+    )
+    with _metrics_lock:
+        _metrics_buffer.append(row)
+
+def flush_llm_metrics():
+    """Write buffered call metrics to llm_metrics"""
+    with _metrics_lock:
+        rows = _metrics_buffer[:]
+        _metrics_buffer.clear()
+    if rows:
+        with _db(write=True) as conn:
+            conn.executemany("""
+                INSERT INTO llm_metrics (ts, family, model, key_hint, latency_ms, prompt_tokens,
+                                         completion_tokens, cached_tokens, retries, cache, ok)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+def get_llm_metrics(hours=24):
+    """Return call metrics from the last `hours` as a list of dicts (newest first)"""
+    flush_llm_metrics()
+    cutoff = (datetime.utcnow() - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+    with _db() as conn:
+        cursor = conn.execute("""
+            SELECT ts, family, model, key_hint, latency_ms, prompt_tokens, completion_tokens,
+                   cached_tokens, retries, cache, ok
+            FROM llm_metrics WHERE ts >= ? ORDER BY ts DESC
+        """, (cutoff,))
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
 # ---- LLM Call ----
 def try_call_llm(prompt, api_key, model, temperature):
     """Make a single LLM call"""
-    llm = ChatGroq(model=model, temperature=temperature, groq_api_key=api_key)
-    return llm.invoke(prompt).content
+    _trace_attempt(api_key)
+    started = time.perf_counter()
+    message = get_llm_client(api_key, model, temperature).invoke(prompt, **_invoke_options())
+    _record_latency(api_key, time.perf_counter() - started)
+    _settle_tokens(api_key, model, prompt, message)
+    _trace_attempt(api_key, message)
+    return message.content
+
+async def try_call_llm_async(prompt, api_key, model, temperature):
+    """Make a single non-blocking LLM call"""
+    _trace_attempt(api_key)
+    started = time.perf_counter()
+    llm = await _get_async_llm_client(api_key, model, temperature)
+    message = await llm.ainvoke(prompt, **_invoke_options())
+    _record_latency(api_key, time.perf_counter() - started)
+    _settle_tokens(api_key, model, prompt, message)
+    _trace_attempt(api_key, message)
+    return message.content
+
+# ---- Model Routing ----
+# call_llm(model=None) picks the model from the prompt family. Routes can be
+# overridden with LLM_MODEL_ROUTES (secret or env), a JSON object mapping a family
+# to a Groq model name.
+def _load_model_routes():
+    routes = dict(MODEL_ROUTES)
+    raw = None
+    try:
+        import streamlit as st
+        raw = st.secrets.get("LLM_MODEL_ROUTES")
+    except Exception:
+        pass
+    raw = raw or os.getenv("LLM_MODEL_ROUTES")
+    if raw:
+        try:
+            routes.update(json.loads(raw) if isinstance(raw, str) else raw)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring malformed LLM_MODEL_ROUTES: {e}")
+    return routes
+
+_model_routes = _load_model_routes()
+
+def resolve_model(family=None):
+    """Model for a prompt family (DEFAULT_MODEL when the family is not routed)"""
+    return _model_routes.get(family, DEFAULT_MODEL)
+
+def _needs_escalation(response, model, validator):
+    """True when a routed small-model answer fails the caller's validator"""
+    if validator is None or model == DEFAULT_MODEL or response.startswith("❌"):
+        return False
+    try:
+        return not validator(response)
+    except Exception:
+        return True
+
+def _cached_escalation(prompt, model, validator, trace):
+    """The DEFAULT_MODEL answer cached when this prompt was escalated before, else None"""
+    if validator is None or model == DEFAULT_MODEL:
+        return None
+    response = get_cached_response(prompt, DEFAULT_MODEL)
+    if response:
+        trace["model"], trace["cache"] = DEFAULT_MODEL, "hit"
+    return response
+
+def _uncache_rejected(prompt, model, trace):
+    """Drop a small-model answer that failed the validator, so later calls stop hitting it"""
+    invalidate_cached_response(prompt, model)
+    source_key = trace.pop("source_key", None)
+    if source_key:
+        _invalidate_cached_key(source_key)
 
 # ---- Main ----
-def call_llm(prompt: str, session, model="llama-3.3-70b-versatile", temperature=0):
-    """Main entry: checks cache, tries user key, falls back to admin keys"""
-    # 🔹 Step 1: Cache first
-    cleanup_cache()
+_inflight = {}  # prompt_hash -> Future shared by concurrent identical call_llm calls
+_inflight_lock = threading.Lock()
+
+def _store_response(prompt, model, response, family, semantic_text, vector):
+    set_cached_response(prompt, model, response)
+    if vector is not None:
+        _semantic_store(prompt, model, family, semantic_text, vector)
+
+def call_llm(prompt, session, model=None, temperature=0,
+             family=None, semantic_text=None, hedge=None, validator=None):
+    """Main entry: checks cache, tries user key, falls back to admin keys
+
+    prompt is a string or a [(role, content), ...] message list (see prompt_templates).
+    family tags the call for metrics (domain_detect, grammar, ats_eval, rewrite,
+    interview_eval, followup, cover_letter, ...) and, when model is None, picks the
+    model via resolve_model. validator(response) -> bool lets a routed small-model
+    answer be escalated to DEFAULT_MODEL when it is unparseable.
+    family / semantic_text also opt a call into the semantic cache: semantic_text is
+    the variable part of the prompt (resume, job description) compared by embedding.
+    hedge=True races a second key when the first exceeds its p95 latency
+    (None follows LLM_HEDGING).
+    """
+    model = model or resolve_model(family)
+    trace = _start_trace(family, model)
+    token = _current_trace.set(trace)
+    response = None
+    try:
+        response = _cached_escalation(prompt, model, validator, trace)
+        if response:
+            return response
+        response = _call_llm(prompt, session, model, temperature, family, semantic_text, hedge)
+        if _needs_escalation(response, model, validator):
+            logger.info(f"Escalating {family or 'call'} from {model} to {DEFAULT_MODEL}")
+            _uncache_rejected(prompt, model, trace)
+            trace["model"] = DEFAULT_MODEL
+            response = _call_llm(prompt, session, DEFAULT_MODEL, temperature, family, semantic_text, hedge)
+        return response
+    finally:
+        _current_trace.reset(token)
+        _finish_trace(trace, response, session)
+
+def _call_llm(prompt, session, model, temperature, family, semantic_text, hedge):
+    upstream = _call_llm_hedged if (HEDGING_ENABLED if hedge is None else hedge) else _call_llm_upstream
+    # 🔹 Step 1: Cache first (expiry is handled by the background janitor)
     cached = get_cached_response(prompt, model)
     if cached:
+        _trace_cache("hit")
         return cached
 
-    if "key_index" not in session:
-        session["key_index"] = 0
+    vector = None
+    if (SEMANTIC_CACHE_ENABLED and family in SEMANTIC_CACHE_THRESHOLDS
+            and semantic_text and semantic_text in prompt_text(prompt)):
+        cached, vector = _semantic_lookup(prompt, model, family, semantic_text)
+        if cached:
+            _trace_cache("semantic")
+            return cached
+
+    # 🔹 Coalesce concurrent identical prompts onto one upstream request
+    flight_key = hash_prompt(prompt, model)
+    with _inflight_lock:
+        flight = _inflight.get(flight_key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _inflight[flight_key] = Future()
+    if not is_leader:
+        try:
+            response = flight.result(timeout=SINGLE_FLIGHT_TIMEOUT_SECONDS)
+            if not response.startswith("❌"):
+                _trace_cache("coalesced")
+                return response
+        except Exception:
+            pass
+        # Leader failed or stalled: fall through and try with this session's own keys
+        return upstream(prompt, session, model, temperature, family, semantic_text, vector)
+
+    try:
+        response = upstream(prompt, session, model, temperature, family, semantic_text, vector)
+        flight.set_result(response)
+        return response
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(flight_key, None)
+
+def _session_user_key(session):
+    return session.get("user_groq_key", "").strip() if isinstance(session.get("user_groq_key"), str) else ""
+
+_RETRY_IN = re.compile(r"try again in\s+((?:[\d.]+(?:ms|h|m|s))+)", re.IGNORECASE)
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+def _retry_after_seconds(error):
+    """Server-requested wait from a Retry-After header or Groq's "try again in 1m2.5s" text"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass  # HTTP-date form; fall through to the message text
+    match = _RETRY_IN.search(str(error))
+    if match:
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * units[u] for n, u in _DURATION_PART.findall(match.group(1)))
+    return None
+
+def _classify_error(error):
+    """Map an upstream exception to (reason, retry_after_seconds)
+
+    reason is "quota" (429), "auth" (401/403), "request" (other 4xx: the prompt is at
+    fault, not the key) or "error" (5xx, timeouts, connection failures).
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return "quota", _retry_after_seconds(error)
+    if status in (401, 403):
+        return "auth", None
+    if status is not None and 400 <= status < 500 and status not in (408, 409):
+        return "request", None
+    if status is None and any(w in str(error).lower() for w in ["quota", "rate limit", "429"]):
+        return "quota", _retry_after_seconds(error)
+    return "error", _retry_after_seconds(error) if status == 503 else None
+
+def _handle_key_error(api_key, error):
+    """Record a failed call on the key's breaker; False means stop trying other keys"""
+    reason, retry_after = _classify_error(error)
+    if reason == "request":
+        _release_probe(api_key)
+        logger.warning(f"LLM request rejected, not retrying on other keys: {error}")
+        return False
+    mark_key_failure(api_key, reason, retry_after)
+    return True
+
+def _candidate_keys(session):
+    """(keys to schedule, preferred key): the user's own key, if usable, ahead of healthy admin keys"""
+    user_key = _session_user_key(session)
+    keys = get_healthy_keys(load_groq_api_keys())
+    if user_key and _key_admits(user_key):
+        return [user_key] + [k for k in keys if k != user_key], user_key
+    return keys, None
 
-    user_key = session.get("user_groq_key", "").strip() if isinstance(session.get("user_groq_key"), str) else ""
+def _claim_next_key(remaining, preferred, prompt, model, block=True):
+    """Reserve and claim the next key from `remaining` (removing it), or None when none is left
+
+    block=False only takes a key with rate headroom right now and never waits for a refill.
+    """
+    while remaining:
+        if block:
+            key = acquire_key(remaining, prompt, model, preferred)
+        else:
+            key, _ = _reserve_key(remaining, model, _estimate_tokens(prompt), preferred)
+        if key is None:
+            return None
+        remaining.remove(key)
+        if _claim_key(key):
+            return key
+        _refund_key(key, model, prompt)
+    return None
+
+def _scheduled_keys(session, prompt, model):
+    """Yield keys with rate budget, the user's key first when it has headroom (each at most once)"""
+    remaining, preferred = _candidate_keys(session)
+    while True:
+        key = _claim_next_key(remaining, preferred, prompt, model)
+        if key is None:
+            return
+        yield key
+
+def _record_success(api_key, session):
+    increment_key_usage(api_key)
+    clear_key_failure(api_key)  # closes the breaker (a no-op for healthy keys)
+
+def _call_llm_upstream(prompt, session, model, temperature, family, semantic_text, vector):
+    """Cache-miss path: try the user's key, then the admin key with the most rate headroom"""
+    last_error = None
+    for key in _scheduled_keys(session, prompt, model):
+        try:
+            response = try_call_llm(prompt, key, model, temperature)
+            _store_response(prompt, model, response, family, semantic_text, vector)
+            _record_success(key, session)
+            return response
+        except Exception as e:
+            last_error = e
+            if not _handle_key_error(key, e):
+                break
+
+    return f"❌ LLM unavailable: {last_error or 'No healthy API keys left within the rate budget'}"
+
+# ---- Hedged Requests ----
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+def _hedge_deadline(api_key):
+    p95 = _latency_percentile(api_key, 0.95, min_samples=HEDGE_MIN_SAMPLES)
+    return p95 if p95 is not None else HEDGE_DEFAULT_DEADLINE_SECONDS
+
+def _record_orphan(api_key, future):
+    """Account for a hedge loser that still completed (it consumed quota)"""
+    if not future.cancelled() and future.exception() is None:
+        increment_key_usage(api_key)
+
+def _call_llm_hedged(prompt, session, model, temperature, family, semantic_text, vector):
+    """Like _call_llm_upstream, but race a second key once the first passes its p95 latency"""
+    remaining, preferred = _candidate_keys(session)
+    pending = {}  # future -> api_key
     last_error = None
+    deadline_key = None
 
-    # 🔹 Step 2: Try user-provided key
-    if user_key:
+    def launch(block=True):
+        key = _claim_next_key(remaining, preferred, prompt, model, block)
+        if key is not None:
+            context = contextvars.copy_context()  # carries the metrics trace into the worker
+            pending[_hedge_executor.submit(context.run, try_call_llm, prompt, key, model, temperature)] = key
+        return key
+
+    try:
+        deadline_key = launch()
+        while pending:
+            timeout = _hedge_deadline(deadline_key) if deadline_key else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # First key is past its p95: hedge once on the next key, then wait for either.
+                # The hedge never waits for rate budget: with no headroom anywhere it is skipped.
+                deadline_key = None
+                if launch(block=False) is None:
+                    logger.debug("Skipping hedge: no key has rate headroom")
+                continue
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    if not _handle_key_error(key, e):
+                        return f"❌ LLM unavailable: {e}"
+                    continue
+                _store_response(prompt, model, response, family, semantic_text, vector)
+                _record_success(key, session)
+                return response
+            if not pending:
+                deadline_key = launch()
+    finally:
+        for future, key in pending.items():
+            future.add_done_callback(lambda f, k=key: _record_orphan(k, f))
+
+    return f"❌ LLM unavailable: {last_error or 'No healthy API keys left within the rate budget'}"
+
+# ---- Async API ----
+async def _scheduled_keys_async(session, prompt, model):
+    """Async _scheduled_keys: rate waits use asyncio.sleep"""
+    remaining, preferred = _candidate_keys(session)
+    while remaining:
+        key = await acquire_key_async(remaining, prompt, model, preferred)
+        if key is None:
+            return
+        remaining.remove(key)
+        if _claim_key(key):
+            yield key
+        else:
+            _refund_key(key, model, prompt)
+
+async def _call_llm_upstream_async(prompt, session, model, temperature, family, semantic_text, vector):
+    """Async twin of _call_llm_upstream with identical key scheduling"""
+    last_error = None
+    async for key in _scheduled_keys_async(session, prompt, model):
         try:
-            response = try_call_llm(prompt, user_key, model, temperature)
-            set_cached_response(prompt, model, response)
-            increment_key_usage(user_key)
+            response = await try_call_llm_async(prompt, key, model, temperature)
+            _store_response(prompt, model, response, family, semantic_text, vector)
+            _record_success(key, session)
             return response
         except Exception as e:
-            reason = "quota" if any(w in str(e).lower() for w in ["quota", "rate limit", "429"]) else "error"
-            mark_key_failure(user_key, reason)
             last_error = e
+            if not _handle_key_error(key, e):
+                break
 
-    # 🔹 Step 3: Rotate through admin keys
-    admin_keys = get_healthy_keys(load_groq_api_keys())
-    if admin_keys:
-        start_index = session["key_index"] % len(admin_keys)
-        for offset in range(len(admin_keys)):
-            idx = (start_index + offset) % len(admin_keys)
-            key = admin_keys[idx]
-            try:
-                response = try_call_llm(prompt, key, model, temperature)
-                set_cached_response(prompt, model, response)
-                increment_key_usage(key)
-                clear_key_failure(key)
-                session["key_index"] = (idx + 1) % len(admin_keys)
+    return f"❌ LLM unavailable: {last_error or 'No healthy API keys left within the rate budget'}"
+
+async def call_llm_async(prompt, session, model=None, temperature=0,
+                         family=None, semantic_text=None, validator=None):
+    """Non-blocking call_llm: same caching, coalescing, key rotation, routing and metrics"""
+    model = model or resolve_model(family)
+    trace = _start_trace(family, model)
+    token = _current_trace.set(trace)
+    response = None
+    try:
+        response = _cached_escalation(prompt, model, validator, trace)
+        if response:
+            return response
+        response = await _call_llm_async(prompt, session, model, temperature, family, semantic_text)
+        if _needs_escalation(response, model, validator):
+            logger.info(f"Escalating {family or 'call'} from {model} to {DEFAULT_MODEL}")
+            _uncache_rejected(prompt, model, trace)
+            trace["model"] = DEFAULT_MODEL
+            response = await _call_llm_async(prompt, session, DEFAULT_MODEL, temperature, family, semantic_text)
+        return response
+    finally:
+        _current_trace.reset(token)
+        _finish_trace(trace, response, session)
+
+async def _call_llm_async(prompt, session, model, temperature, family, semantic_text):
+    cached = get_cached_response(prompt, model)
+    if cached:
+        _trace_cache("hit")
+        return cached
+
+    vector = None
+    if (SEMANTIC_CACHE_ENABLED and family in SEMANTIC_CACHE_THRESHOLDS
+            and semantic_text and semantic_text in prompt_text(prompt)):
+        cached, vector = await asyncio.to_thread(_semantic_lookup, prompt, model, family, semantic_text)
+        if cached:
+            _trace_cache("semantic")
+            return cached
+
+    # Shares the in-flight table with call_llm, so sync and async callers coalesce too
+    flight_key = hash_prompt(prompt, model)
+    with _inflight_lock:
+        flight = _inflight.get(flight_key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _inflight[flight_key] = Future()
+    if not is_leader:
+        try:
+            response = await asyncio.wait_for(asyncio.wrap_future(flight), SINGLE_FLIGHT_TIMEOUT_SECONDS)
+            if not response.startswith("❌"):
+                _trace_cache("coalesced")
                 return response
+        except Exception:
+            pass
+        return await _call_llm_upstream_async(prompt, session, model, temperature, family, semantic_text, vector)
+
+    try:
+        response = await _call_llm_upstream_async(prompt, session, model, temperature, family, semantic_text, vector)
+        flight.set_result(response)
+        return response
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(flight_key, None)
+
+async def call_llm_many(prompts, session, max_concurrency=LLM_MAX_CONCURRENCY, **kwargs):
+    """Run independent prompts concurrently (at most max_concurrency in flight).
+
+    Returns responses in the order of `prompts`; kwargs are passed to call_llm_async.
+    From synchronous code (e.g. a Streamlit script): asyncio.run(call_llm_many(...)).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(prompt):
+        async with semaphore:
+            return await call_llm_async(prompt, session, **kwargs)
+
+    return await asyncio.gather(*(run_one(p) for p in prompts))
+
+# ---- Streaming ----
+def call_llm_stream(prompt, session, model=None, temperature=0,
+                    family=None, semantic_text=None):
+    """Yield response text as it is generated; the full text is cached on completion.
+
+    Cache hits are yielded in one piece. A key that fails before the first token is
+    skipped like in call_llm; a failure mid-stream ends the stream with an error
+    marker (already-yielded text cannot be retried) and nothing is cached.
+    """
+    model = model or resolve_model(family)
+    # A generator runs in its consumer's context, so the trace is updated directly
+    # here rather than through the _current_trace context variable.
+    trace = _start_trace(family, model)
+    response = None
+    try:
+        cached = get_cached_response(prompt, model)
+        if cached:
+            trace["cache"] = "hit"
+            response = cached
+            yield cached
+            return
+
+        vector = None
+        if (SEMANTIC_CACHE_ENABLED and family in SEMANTIC_CACHE_THRESHOLDS
+                and semantic_text and semantic_text in prompt_text(prompt)):
+            cached, vector = _semantic_lookup(prompt, model, family, semantic_text)
+            if cached:
+                trace["cache"] = "semantic"
+                response = cached
+                yield cached
+                return
+
+        last_error = None
+        for key in _scheduled_keys(session, prompt, model):
+            chunks = []
+            trace["attempts"] += 1
+            started = time.perf_counter()
+            try:
+                for chunk in get_llm_client(key, model, temperature).stream(prompt, **_invoke_options()):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield chunk.content
             except Exception as e:
-                reason = "quota" if any(w in str(e).lower() for w in ["quota", "rate limit", "429"]) else "error"
-                mark_key_failure(key, reason)
                 last_error = e
+                keep_rotating = _handle_key_error(key, e)
+                if chunks:
+                    response = f"❌ LLM stream interrupted: {e}"
+                    yield f"\n\n{response}"
+                    return
+                if not keep_rotating:
+                    break
+                continue
+            response = "".join(chunks)
+            _record_latency(key, time.perf_counter() - started)
+            trace["key"] = key
+            _store_response(prompt, model, response, family, semantic_text, vector)
+            _record_success(key, session)
+            return
+
+        response = f"❌ LLM unavailable: {last_error or 'No healthy API keys left within the rate budget'}"
+        yield response
+    finally:
+        _finish_trace(trace, response, session)
+
+# ---- Structured Output ----
+# call_llm_structured asks for a JSON object (Groq JSON mode), validates it against a
+# pydantic model and returns the parsed instance, so callers read fields instead of
+# regex-scraping free text. An answer that does not validate gets one repair
+# round-trip on DEFAULT_MODEL and the repaired JSON replaces it in llm_cache. Parsed
+# objects are kept in a small LRU, so Streamlit reruns skip parsing and validation.
+_response_format = contextvars.ContextVar("llm_response_format", default=None)
+_structured_cache = OrderedDict()  # (schema, prompt_hash) -> (instance, expires_at)
+_structured_cache_lock = threading.Lock()
+
+def _invoke_options():
+    """Extra invoke() arguments for the active call (JSON mode inside call_llm_structured)"""
+    response_format = _response_format.get()
+    return {"response_format": response_format} if response_format else {}
+
+@lru_cache(maxsize=32)
+def _schema_instructions(schema):
+    spec = json.dumps(schema.model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+    return ("Respond with a single JSON object, without markdown fences or commentary, "
+            f"that validates against this JSON schema:\n{spec}")
+
+def _with_schema(prompt, schema):
+    """Append the schema contract to the system message, keeping the prefix static"""
+    instructions = _schema_instructions(schema)
+    if isinstance(prompt, str):
+        return [("system", instructions), ("human", prompt)]
+    messages = list(prompt)
+    if messages and messages[0][0] == "system":
+        messages[0] = ("system", f"{messages[0][1]}\n\n{instructions}")
+    else:
+        messages.insert(0, ("system", instructions))
+    return messages
+
+def _parse_structured(response, schema):
+    """Validated schema instance; raises ValueError (pydantic's ValidationError is one)"""
+    start, end = response.find("{"), response.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("no JSON object in the response")
+    return schema.model_validate_json(response[start:end + 1])
+
+def _structured_get(key):
+    with _structured_cache_lock:
+        entry = _structured_cache.get(key)
+        if entry is None or entry[1] < time.time():
+            _structured_cache.pop(key, None)
+            return None
+        _structured_cache.move_to_end(key)
+        return entry[0]
+
+def _structured_put(key, parsed):
+    with _structured_cache_lock:
+        _structured_cache[key] = (parsed, time.time() + CACHE_EXPIRY_HOURS * 3600)
+        _structured_cache.move_to_end(key)
+        while len(_structured_cache) > STRUCTURED_CACHE_MAX_ENTRIES:
+            _structured_cache.popitem(last=False)
+
+def _repair_structured(schema, response, error, session, family):
+    """One corrective call on DEFAULT_MODEL; None if the answer is still invalid"""
+    repair_prompt = [
+        ("system", "Your previous answer did not match the required JSON schema. Return the "
+                   "corrected JSON object only, keeping the original content where it is valid.\n\n"
+                   + _schema_instructions(schema)),
+        ("human", f"Previous answer:\n{response[:8000]}\n\nValidation error:\n{str(error)[:2000]}"),
+    ]
+    repaired = call_llm(repair_prompt, session, model=DEFAULT_MODEL, family=family)
+    if repaired.startswith("❌"):
+        return None
+    try:
+        return _parse_structured(repaired, schema)
+    except ValueError as e:
+        logger.warning(f"Structured {family or 'call'} still invalid after repair: {e}")
+        invalidate_cached_response(repair_prompt, DEFAULT_MODEL)
+        return None
+
+def call_llm_structured(prompt, schema, session, model=None, temperature=0,
+                        family=None, semantic_text=None, hedge=None):
+    """Like call_llm, but returns a validated instance of `schema` (a pydantic model)
+
+    The schema's JSON Schema is appended to the system message and the request runs
+    in JSON mode. Returns None when no valid object could be obtained (upstream
+    failure, or an answer that is still invalid after one repair), so callers keep a
+    single fallback instead of parsing free text.
+    """
+    model = model or resolve_model(family)
+    prompt = _with_schema(prompt, schema)
+    cache_key = (schema, hash_prompt(prompt, model))
+    parsed = _structured_get(cache_key)
+    if parsed is not None:
+        trace = _start_trace(family, model)
+        trace["cache"] = "parsed"
+        _finish_trace(trace, "", session)
+        return parsed.model_copy(deep=True)
+
+    token = _response_format.set({"type": "json_object"})
+    try:
+        response = call_llm(prompt, session, model=model, temperature=temperature,
+                            family=family, semantic_text=semantic_text, hedge=hedge)
+        if response.startswith("❌"):
+            return None
+        try:
+            parsed = _parse_structured(response, schema)
+        except ValueError as e:
+            logger.info(f"Repairing structured {family or 'call'} answer: {e}")
+            parsed = _repair_structured(schema, response, e, session, family)
+            if parsed is None:
+                invalidate_cached_response(prompt, model)
+                return None
+            set_cached_response(prompt, model, parsed.model_dump_json())
+    finally:
+        _response_format.reset(token)
+    _structured_put(cache_key, parsed)
+    return parsed.model_copy(deep=True)
 
-    return f"❌ LLM unavailable: {last_error or 'No healthy API keys left'}"
+# ---- Startup ----
+start_cache_janitor()
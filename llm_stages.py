@@ -0,0 +1,54 @@
+"""Bounded worker pool for independent LLM stages.
+
+ats_percentage_score fans its independent stages (grammar scoring, resume and job
+domain detection) out here instead of running them one after another. Resumes in
+a batch are screened concurrently and each screening submits its own stages, so
+submissions wait for a free stage worker: the number of LLM stages in flight per
+process stays at LLM_STAGE_WORKERS however many screenings and sessions are running.
+
+Workers run with the submitting Streamlit script run's context, so st.session_state
+(and the user's own Groq key in it) works inside a stage.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+LLM_STAGE_WORKERS = 8
+
+_stage_pool = ThreadPoolExecutor(max_workers=LLM_STAGE_WORKERS, thread_name_prefix="llm-stage")
+_stage_slots = threading.BoundedSemaphore(LLM_STAGE_WORKERS)  # one per stage worker
+
+
+def _with_script_run_ctx(fn, args, kwargs):
+    """Wrap fn to run under the calling script run's context (a plain call outside Streamlit)"""
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    except ImportError:
+        return lambda: fn(*args, **kwargs)
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return run
+
+
+def submit_llm_stage(fn, *args, pool=None, **kwargs):
+    """Run fn(*args, **kwargs) on the stage pool, or on `pool` if given; returns a Future
+
+    Stage submissions block while every stage worker is busy, which bounds the fan-in
+    from concurrent screenings and sessions. Submissions to another pool are not limited.
+    """
+    run = _with_script_run_ctx(fn, args, kwargs)
+    if pool is not None:
+        return pool.submit(run)
+
+    # Stage functions never submit stages themselves, so a held slot is always released
+    _stage_slots.acquire()
+    try:
+        future = _stage_pool.submit(run)
+    except BaseException:
+        _stage_slots.release()
+        raise
+    future.add_done_callback(lambda _: _stage_slots.release())
+    return future
@@ -33,7 +33,7 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.opc.constants import RELATIONSHIP_TYPE as RT
 from xhtml2pdf import pisa
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from streamlit_pdf_viewer import pdf_viewer
 
 # Heavy libraries - loaded with caching
@@ -59,10 +59,14 @@ from langchain_groq import ChatGroq  # optional if you're using it
 
 
 # Local project imports
-from llm_manager import call_llm, load_groq_api_keys
+from llm_manager import call_llm, call_llm_stream, call_llm_structured, load_groq_api_keys, get_embedding_model, get_llm_metrics, get_cache_stats, get_key_usage, analysis_cache_key, get_cached_analysis, set_cached_analysis
+from prompt_templates import register_template, get_template_stats
+from bias_matcher import PhraseMatcher
+from llm_stages import submit_llm_stage
 from db_manager import (
     db_manager,
     insert_candidate,
+    insert_candidates_batch,
     get_top_domains_by_score,
     get_database_stats,
     detect_domain_from_title_and_description,
@@ -244,7 +248,7 @@ LENGTH: 3 short-to-medium paragraphs. Maximum 350 words.
 """
 
         # ✅ Call LLM
-        cover_letter = call_llm(prompt, session=st.session_state).strip()
+        cover_letter = call_llm(prompt, session=st.session_state, family="cover_letter").strip()
 
         # ✅ Store plain text
         st.session_state["cover_letter"] = cover_letter
@@ -2808,72 +2812,96 @@ gender_words = {
     ]
 }
 
-def detect_bias(text):
-    # Split into sentences using simple delimiters
-    sentences = re.split(r'(?<=[.!?])\s+', text.strip())
-
-    masc_set, fem_set = set(), set()
-    masculine_found, feminine_found = [] , []
+# ✅ Built once: one automaton over both word lists (masculine first, longest words first
+# within each list) plus a precompiled highlighter per word
+BIAS_MATCHER = PhraseMatcher(
+    [(word, "masculine") for word in sorted(gender_words["masculine"], key=len, reverse=True)] +
+    [(word, "feminine") for word in sorted(gender_words["feminine"], key=len, reverse=True)]
+)
+BIAS_HIGHLIGHTERS = [
+    (re.compile(rf'\b({re.escape(word)})\b', re.IGNORECASE),
+     r'<span style="color:blue;">\1</span>' if gender == "masculine" else r'<span style="color:red;">\1</span>')
+    for word, gender in BIAS_MATCHER.phrases
+]
 
-    masculine_words = sorted(gender_words["masculine"], key=len, reverse=True)
-    feminine_words = sorted(gender_words["feminine"], key=len, reverse=True)
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
 
-    for sent in sentences:
+def analyze_bias(text):
+    """
+    Single scan of text against both gender-coded word lists.
+    Returns a dict with:
+      spans     — accepted (start, end, word, gender) matches in text order, offsets into text
+      masculine / feminine — one {"word", "sentence"} finding per word and sentence
+      bias_score
+    """
+    spans = []
+    seen = set()
+    masculine_found, feminine_found = [], []
+
+    # Split into sentences using simple delimiters, keeping each sentence's offset
+    stripped = text.strip()
+    offset = len(text) - len(text.lstrip())
+    bounds, start = [], 0
+    for m in SENTENCE_BREAK.finditer(stripped):
+        bounds.append((start, m.start()))
+        start = m.end()
+    bounds.append((start, len(stripped)))
+
+    for sent_start, sent_end in bounds:
+        sent = stripped[sent_start:sent_end]
         sent_text = sent.strip()
+        base = offset + sent_start + len(sent) - len(sent.lstrip())
         sent_lower = sent_text.lower()
-        matched_spans = []
-
-        def is_overlapping(start, end):
-            return any(start < e and end > s for s, e in matched_spans)
-
-        # 🔵 Highlight masculine words in blue
-        for word in masculine_words:
-            pattern = re.compile(rf'\b{re.escape(word)}\b', re.IGNORECASE)
-            for match in pattern.finditer(sent_lower):
-                start, end = match.span()
-                if not is_overlapping(start, end):
-                    matched_spans.append((start, end))
-                    key = (word.lower(), sent_text)
-                    if key not in masc_set:
-                        masc_set.add(key)
-                        highlighted = re.sub(
-                            rf'\b({re.escape(word)})\b',
-                            r'<span style="color:blue;">\1</span>',
-                            sent_text,
-                            flags=re.IGNORECASE
-                        )
-                        masculine_found.append({
-                            "word": word,
-                            "sentence": highlighted
-                        })
 
-        # 🔴 Highlight feminine words in red
-        for word in feminine_words:
-            pattern = re.compile(rf'\b{re.escape(word)}\b', re.IGNORECASE)
-            for match in pattern.finditer(sent_lower):
-                start, end = match.span()
-                if not is_overlapping(start, end):
-                    matched_spans.append((start, end))
-                    key = (word.lower(), sent_text)
-                    if key not in fem_set:
-                        fem_set.add(key)
-                        highlighted = re.sub(
-                            rf'\b({re.escape(word)})\b',
-                            r'<span style="color:red;">\1</span>',
-                            sent_text,
-                            flags=re.IGNORECASE
-                        )
-                        feminine_found.append({
-                            "word": word,
-                            "sentence": highlighted
-                        })
+        # Lower-casing a few characters (e.g. "İ") changes the length; map back to sent_text
+        index = None
+        if len(sent_lower) != len(sent_text):
+            index = [i for i, ch in enumerate(sent_text) for _ in ch.lower()] + [len(sent_text)]
+
+        # 🔵 masculine words highlighted in blue, 🔴 feminine words in red;
+        # one finding per word and sentence
+        for rank, start, end in BIAS_MATCHER.matches(sent_lower):
+            word, gender = BIAS_MATCHER.phrases[rank]
+            if index is not None:
+                start, end = index[start], index[end - 1] + 1
+            spans.append((base + start, base + end, word, gender))
+
+            if (rank, sent_text) in seen:
+                continue
+            seen.add((rank, sent_text))
+            pattern, replacement = BIAS_HIGHLIGHTERS[rank]
+            found = masculine_found if gender == "masculine" else feminine_found
+            found.append({
+                "word": word,
+                "sentence": pattern.sub(replacement, sent_text)
+            })
 
-    masc = len(masculine_found)
-    fem = len(feminine_found)
-    total = masc + fem
+    spans.sort()
+    total = len(masculine_found) + len(feminine_found)
     bias_score = min(total / 20, 1.0) if total > 0 else 0.0
 
-    return round(bias_score, 2), masc, fem, masculine_found, feminine_found
+    return {
+        "spans": spans,
+        "masculine": masculine_found,
+        "feminine": feminine_found,
+        "bias_score": round(bias_score, 2),
+    }
+
+def render_bias_highlights(text, spans):
+    """Text with every bias span wrapped in a colored <span>, built in one pass"""
+    parts, pos = [], 0
+    for start, end, _, gender in spans:
+        color = "blue" if gender == "masculine" else "red"
+        parts.append(text[pos:start])
+        parts.append(f"<span style='color:{color};'>{text[start:end]}</span>")
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def detect_bias(text):
+    analysis = analyze_bias(text)
+    masculine_found, feminine_found = analysis["masculine"], analysis["feminine"]
+    return analysis["bias_score"], len(masculine_found), len(feminine_found), masculine_found, feminine_found
 
 replacement_mapping = {
     "masculine": {
@@ -3030,32 +3058,41 @@ replacement_mapping = {
     }
 }
 
-def rewrite_text_with_llm(text, replacement_mapping, user_location):
-    """
-    Enhanced resume rewrite engine (backward compatible).
-    - Improves structure, clarity, and ATS readiness
-    - Fills missing sections using internal evidence
-    - Maintains bias-free language
-    - Preserves and ENFORCES suggested job titles output
-    """
-
-    # -----------------------------
-    # Format bias replacement rules
-    # -----------------------------
-    formatted_mapping = "\n".join(
-        [f'- "{key}" → "{value}"' for key, value in replacement_mapping.items()]
-    )
+def show_llm_overlay(placeholder, label, preview=""):
+    """Render the floating LLM progress box (label plus an optional text preview)"""
+    placeholder.markdown(f"""
+            <div style="position:fixed;bottom:24px;left:50%;transform:translateX(-50%);
+                        width:min(760px,92vw);max-height:32vh;overflow:hidden;z-index:10000;
+                        background:rgba(11,12,16,0.92);border:1px solid rgba(0,191,255,0.35);
+                        border-radius:12px;padding:12px 16px;box-shadow:0 10px 30px rgba(0,0,0,0.4);">
+                <div style="color:#00bfff;font-weight:600;font-size:13px;margin-bottom:6px;
+                            font-family:'Segoe UI',sans-serif;">{label}…</div>
+                <div style="color:#cbd5e1;font-size:12px;line-height:1.45;white-space:pre-wrap;
+                            font-family:Consolas,monospace;">{preview}</div>
+            </div>
+            """, unsafe_allow_html=True)
 
-    # -----------------------------
-    # MASTER PROMPT
-    # -----------------------------
-    prompt = f"""
+def stream_llm_to_placeholder(prompt, placeholder, label="✍️ Generating", **llm_kwargs):
+    """Stream an LLM response into a Streamlit placeholder as it arrives; return the full text"""
+    import html
+    parts = []
+    last_render = 0.0
+    for token in call_llm_stream(prompt, session=st.session_state, **llm_kwargs):
+        parts.append(token)
+        if time.monotonic() - last_render >= 0.15:  # throttle re-renders
+            show_llm_overlay(placeholder, label, html.escape("".join(parts)[-1500:]))
+            last_render = time.monotonic()
+    placeholder.empty()
+    return "".join(parts)
+
+# Static rewrite instructions; the bias rules, location and resume go in the user message
+REWRITE_INSTRUCTIONS = """
 You are an elite Resume Optimization Engine used by Fortune 500 recruiters and executive career coaches.
 
 You will receive:
-1. Original Resume Text
-2. Bias Replacement Rules
-3. Candidate Location
+1. Bias Replacement Rules
+2. Candidate Location
+3. Original Resume Text
 
 Your goal is to TRANSFORM the resume into a top-1% recruiter-ready document:
 ATS-optimized, bias-free, quantification-rich, and professionally compelling.
@@ -3136,16 +3173,6 @@ Formatting requirements:
 - ATS-safe formatting (no tables, columns, or special characters)
 - Tense: past for completed roles, present for current role
 
-═══════════════════════════════════════════════════
-🧠 BIAS REPLACEMENT RULES (APPLY EXACTLY)
-═══════════════════════════════════════════════════
-{formatted_mapping}
-
-═══════════════════════════════════════════════════
-📄 ORIGINAL RESUME
-═══════════════════════════════════════════════════
-\"\"\"{text}\"\"\"
-
 ═══════════════════════════════════════════════════
 🎯 MANDATORY JOB TITLE SUGGESTIONS
 ═══════════════════════════════════════════════════
@@ -3154,7 +3181,7 @@ After the resume, include a clearly separated section:
 
 ### 🎯 Suggested Job Titles (Based on Resume)
 
-Provide EXACTLY **5 job titles** suited for a candidate in **{user_location}**.
+Provide EXACTLY **5 job titles** suited for a candidate in the **Candidate Location** given with the resume.
 
 For EACH job title, provide:
 - A specific reason why this role fits the candidate's background
@@ -3163,7 +3190,7 @@ For EACH job title, provide:
 FORMAT STRICTLY AS:
 
 1. **[Job Title]** — [Specific reason based on resume content]  
-🔗 https://www.linkedin.com/jobs/search/?keywords=[URL+encoded+title]&location={urllib.parse.quote(user_location)}
+🔗 https://www.linkedin.com/jobs/search/?keywords=[URL+encoded+title]&location=[URL-encoded candidate location]
 
 2. **[Job Title]** — ...  
 🔗 ...
@@ -3177,107 +3204,80 @@ FORMAT STRICTLY AS:
 2. Suggested Job Titles section (MANDATORY — 5 titles with URLs)
 """
 
-    # -----------------------------
-    # Call LLM
-    # -----------------------------
-    response = call_llm(prompt, session=st.session_state)
-    return response
+REWRITE_TEMPLATE = register_template(
+    "rewrite",
+    system=REWRITE_INSTRUCTIONS,
+    user='''
+🧠 BIAS REPLACEMENT RULES (APPLY EXACTLY):
+{formatted_mapping}
+
+📍 Candidate Location: {user_location} (URL-encoded: {encoded_location})
 
+📄 ORIGINAL RESUME:
+"""{text}"""
+'''
+)
 
-def rewrite_and_highlight(text, replacement_mapping, user_location):
-    highlighted_text = text
-    masculine_count, feminine_count = 0, 0
-    detected_masculine_words, detected_feminine_words = [], []
-    matched_spans = []
+def rewrite_text_with_llm(text, replacement_mapping, user_location, stream_placeholder=None):
+    """
+    Enhanced resume rewrite engine (backward compatible).
+    - Improves structure, clarity, and ATS readiness
+    - Fills missing sections using internal evidence
+    - Maintains bias-free language
+    - Preserves and ENFORCES suggested job titles output
+    - Streams tokens into `stream_placeholder` when one is given
+    """
 
-    masculine_words = sorted(gender_words["masculine"], key=len, reverse=True)
-    feminine_words = sorted(gender_words["feminine"], key=len, reverse=True)
+    # -----------------------------
+    # Format bias replacement rules
+    # -----------------------------
+    formatted_mapping = "\n".join(
+        [f'- "{key}" → "{value}"' for key, value in replacement_mapping.items()]
+    )
 
-    def span_overlaps(start, end):
-        return any(s < end and e > start for s, e in matched_spans)
+    # -----------------------------
+    # MASTER PROMPT (static instructions + this resume)
+    # -----------------------------
+    prompt = REWRITE_TEMPLATE.render(
+        formatted_mapping=formatted_mapping,
+        user_location=user_location,
+        encoded_location=urllib.parse.quote(user_location),
+        text=text,
+    )
 
-    # Highlight and count masculine words
-    for word in masculine_words:
-        pattern = re.compile(rf'\b{re.escape(word)}\b', re.IGNORECASE)
-        for match in pattern.finditer(highlighted_text):
-            start, end = match.span()
-            if span_overlaps(start, end):
-                continue
+    # -----------------------------
+    # Call LLM
+    # -----------------------------
+    if stream_placeholder is not None:
+        return stream_llm_to_placeholder(prompt, stream_placeholder, label="✍️ Rewriting resume", family="rewrite")
+    response = call_llm(prompt, session=st.session_state, family="rewrite")
+    return response
 
-            word_match = match.group(0)
-            colored = f"<span style='color:blue;'>{word_match}</span>"
-
-            # Replace word in the highlighted text
-            highlighted_text = highlighted_text[:start] + colored + highlighted_text[end:]
-            shift = len(colored) - len(word_match)
-            matched_spans = [(s if s < start else s + shift, e if s < start else e + shift) for s, e in matched_spans]
-            matched_spans.append((start, start + len(colored)))
-
-            masculine_count += 1
-
-            # Get sentence context and highlight
-            sentence_match = re.search(r'([^.]*?\b' + re.escape(word_match) + r'\b[^.]*\.)', text, re.IGNORECASE)
-            if sentence_match:
-                sentence = sentence_match.group(1).strip()
-                colored_sentence = re.sub(
-                    rf'\b({re.escape(word_match)})\b',
-                    r"<span style='color:blue;'>\1</span>",
-                    sentence,
-                    flags=re.IGNORECASE
-                )
-                detected_masculine_words.append({
-                    "word": word_match,
-                    "sentence": colored_sentence
-                })
-            break  # Only one match per word
-
-    # Highlight and count feminine words
-    for word in feminine_words:
-        pattern = re.compile(rf'\b{re.escape(word)}\b', re.IGNORECASE)
-        for match in pattern.finditer(highlighted_text):
-            start, end = match.span()
-            if span_overlaps(start, end):
-                continue
 
-            word_match = match.group(0)
-            colored = f"<span style='color:red;'>{word_match}</span>"
-
-            # Replace word in the highlighted text
-            highlighted_text = highlighted_text[:start] + colored + highlighted_text[end:]
-            shift = len(colored) - len(word_match)
-            matched_spans = [(s if s < start else s + shift, e if s < start else e + shift) for s, e in matched_spans]
-            matched_spans.append((start, start + len(colored)))
-
-            feminine_count += 1
-
-            # Get sentence context and highlight
-            sentence_match = re.search(r'([^.]*?\b' + re.escape(word_match) + r'\b[^.]*\.)', text, re.IGNORECASE)
-            if sentence_match:
-                sentence = sentence_match.group(1).strip()
-                colored_sentence = re.sub(
-                    rf'\b({re.escape(word_match)})\b',
-                    r"<span style='color:red;'>\1</span>",
-                    sentence,
-                    flags=re.IGNORECASE
-                )
-                detected_feminine_words.append({
-                    "word": word_match,
-                    "sentence": colored_sentence
-                })
-            break  # Only one match per word
+def rewrite_and_highlight(text, replacement_mapping, user_location, stream_placeholder=None, analysis=None):
+    """
+    Highlight gender-coded words in text and rewrite it with neutral terms.
+    Pass `analysis` (from analyze_bias) to reuse an existing scan of the same text.
+    """
+    analysis = analysis or analyze_bias(text)
+    highlighted_text = render_bias_highlights(text, analysis["spans"])
+    detected_masculine_words, detected_feminine_words = analysis["masculine"], analysis["feminine"]
+    masculine_count, feminine_count = len(detected_masculine_words), len(detected_feminine_words)
 
     # Rewrite text with neutral terms
     rewritten_text = rewrite_text_with_llm(
         text,
         replacement_mapping["masculine"] | replacement_mapping["feminine"],
-        user_location
+        user_location,
+        stream_placeholder=stream_placeholder
     )
 
     return highlighted_text, rewritten_text, masculine_count, feminine_count, detected_masculine_words, detected_feminine_words
 
 # ✅ Enhanced Grammar evaluation using LLM with suggestions
-def get_grammar_score_with_llm(text, max_score=5):
-    grammar_prompt = f"""
+def _grammar_instructions(max_score, **_):
+    """Static grammar rubric (changes only with the language weight)"""
+    return f"""
 You are a senior HR language quality specialist and professional resume reviewer with 15+ years of experience evaluating resumes for Fortune 500 companies.
 
 Analyze the following resume text across FIVE dimensions and provide an overall language quality score:
@@ -3299,121 +3299,32 @@ Analyze the following resume text across FIVE dimensions and provide an overall
 
 **IMPORTANT:** Be balanced — a technically competent resume with minor grammar issues should not be harshly penalized. Focus on overall professional impression.
 
-Return EXACTLY in this format (no extra text):
-
-Score: <number>
-Feedback: <single sentence summarizing overall language quality and tone>
-Suggestions:
-- <Actionable suggestion 1 with example if helpful>
-- <Actionable suggestion 2 with example if helpful>
-- <Actionable suggestion 3 with example if helpful>
-- <Actionable suggestion 4 with example if helpful>
-- <Actionable suggestion 5 with example if helpful>
-
----
-{text}
----
+Give the score out of {max_score}, a single-sentence feedback summarizing overall language quality and tone, and five actionable suggestions (with an example where helpful).
 """
 
-    response = call_llm(grammar_prompt, session=st.session_state).strip()
-    score_match = re.search(r"Score:\s*(\d+)", response)
-    feedback_match = re.search(r"Feedback:\s*(.+)", response)
-    suggestions = re.findall(r"- (.+)", response)
+class GrammarReport(BaseModel):
+    score: int = Field(description="Overall language quality score on the rubric scale")
+    feedback: str = Field(description="Single sentence summarizing overall language quality and tone")
+    suggestions: list[str] = Field(description="Five actionable suggestions, each with an example if helpful")
 
-    score = int(score_match.group(1)) if score_match else max(3, max_score-2)  # More generous default
-    feedback = feedback_match.group(1).strip() if feedback_match else "Language quality appears adequate for professional communication."
-    return score, feedback, suggestions
-
-# ✅ Main ATS Evaluation Function
-def ats_percentage_score(
-    resume_text,
-    job_description,
-    job_title="Unknown",
-    logic_profile_score=None,
-    edu_weight=20,
-    exp_weight=35,
-    skills_weight=30,
-    lang_weight=5,
-    keyword_weight=10
-):
-    import datetime
-
-    # ✅ Grammar evaluation
-    grammar_score, grammar_feedback, grammar_suggestions = get_grammar_score_with_llm(
-        resume_text, max_score=lang_weight
-    )
-
-    # ✅ Domain similarity detection using LLM
-    resume_domain = db_manager.detect_domain_llm(
-        "Unknown", 
-        resume_text, 
-        session=st.session_state  # ✅ pass the Groq API key from session
-    )
-    job_domain = db_manager.detect_domain_llm(
-        job_title, 
-        job_description, 
-        session=st.session_state  # ✅ pass the Groq API key from session
-    )
-    similarity_score = get_domain_similarity(resume_domain, job_domain)
-
-    # ✅ Balanced domain penalty
-    MAX_DOMAIN_PENALTY = 15
-    domain_penalty = round((1 - similarity_score) * MAX_DOMAIN_PENALTY)
-
-    # ✅ Optional profile score note
-    logic_score_note = (
-        f"\n\nOptional Note: The system also calculated a logic-based profile score of {logic_profile_score}/100 "
-        f"based on resume length, experience, and skills."
-        if logic_profile_score else ""
-    )
+GRAMMAR_TEMPLATE = register_template(
+    "grammar", system=_grammar_instructions, user="---\n{text}\n---"
+)
 
-    # ✅ FIXED: Stable education scoring with 2025 cutoff
-    current_year = datetime.datetime.now().year
-    current_month = datetime.datetime.now().month
-    
-    # ✅ FIXED: Education completion detection with 2025 cutoff
-    def determine_education_status(education_text, end_year_str):
-        """
-        Determine if education is completed or ongoing based on 2025 cutoff and keywords.
-        Returns 'completed' or 'ongoing'.
-        """
-        try:
-            end_year = int(end_year_str.strip())
-        except (ValueError, AttributeError):
-            # If we can't parse the year, default to ongoing
-            return "ongoing"
-        
-        # Apply 2025 cutoff rule (HARDCODED - NOT dynamic)
-        if end_year < 2025:
-            education_status = "completed"
-        elif end_year == 2025:
-            education_status = "completed"
-        else:  # end_year > 2025
-            education_status = "ongoing"
-        
-        # Check for explicit keywords that might override numeric rules
-        education_lower = education_text.lower()
-        ongoing_keywords = ["pursuing", "present", "ongoing", "currently enrolled", "in progress"]
-        completed_keywords = ["graduated", "completed", "finished"]
-        
-        # Override rule: If end year < 2025, always completed regardless of text
-        if end_year < 2025:
-            return "completed"
-        
-        # For years >= 2025, check keywords
-        if end_year < 2025:
-            return "completed"
-        
-        # For years >= 2025, check keywords
-        if any(keyword in education_lower for keyword in ongoing_keywords):
-            education_status = "ongoing"
-        elif any(keyword in education_lower for keyword in completed_keywords):
-            education_status = "completed"
-        
-        return education_status
-    
-    # ✅ UPDATED: Stable education scoring with priority degrees minimum
-    prompt = f"""
+def get_grammar_score_with_llm(text, max_score=5):
+    """Returns (score, feedback, suggestions, fallback_used)"""
+    grammar_prompt = GRAMMAR_TEMPLATE.render(text=text, max_score=max_score)
+    report = call_llm_structured(grammar_prompt, GrammarReport, session=st.session_state,
+                                 family="grammar", semantic_text=text)
+    if report is None:
+        # More generous default when the language check is unavailable
+        return max(3, max_score-2), "Language quality appears adequate for professional communication.", [], True
+    score = max(0, min(report.score, max_score))
+    return score, report.feedback.strip(), [s.strip() for s in report.suggestions if s.strip()], False
+
+# ✅ Static ATS rubric and output format (changes only with the sidebar weights)
+def _ats_rubric(edu_weight, exp_weight, skills_weight, keyword_weight, lang_weight, **_):
+    return f"""
 You are a senior ATS (Applicant Tracking System) Evaluator and Technical Recruiter with 15+ years of experience at top-tier tech firms.
 Your evaluation must be rigorous, consistent, evidence-based, and match industry-standard hiring benchmarks.
 
@@ -3505,106 +3416,89 @@ Compare against resume. Credit synonyms and equivalent terms.
   • 0: Poor — fewer than 20% critical terms
 
 ═══════════════════════════════════════════════════
-📋 REQUIRED OUTPUT FORMAT
+📋 REQUIRED OUTPUT
 ═══════════════════════════════════════════════════
 
-Follow this EXACT structure. Do not skip any section:
-
-### 🏷️ Candidate Name
-<Extract full name from resume header or contact section>
-
-### 🏫 Education Analysis
-**Score:** <0–{edu_weight}> / {edu_weight}
-
-**Scoring Rationale:**
-- Degree Level & Relevance: <Does it qualify for minimum {int(edu_weight * 0.75)}-pt rule? Which degree?>
-- Completion Status: <Apply strict 2025 cutoff rule; state year and final status>
-- Academic Quality Indicators: <GPA, honors, relevant coursework if mentioned>
-- **Score Justification:** <Explain exact score with evidence from resume>
-
-### 💼 Experience Analysis
-**Score:** <0–{exp_weight}> / {exp_weight}
-
-**Experience Breakdown:**
-- Total Years of Relevant Experience: <X years — include internships, freelance, open-source>
-- Role Progression & Seniority: <Entry → Mid → Senior trajectory>
-- Domain Alignment: <How well does background match job domain?>
-- Quantified Achievements: <List metrics found: % improvement, $ savings, users served, etc.>
-- Leadership & Ownership Evidence: <Managed teams? Led projects? Mentored?>
-- Technology Currency: <Are skills/tools recent and relevant (last 3 years)?>
-- **Score Justification:** <Explain score with specific resume evidence>
-
-### 🛠 Skills Analysis
-**Score:** <0–{skills_weight}> / {skills_weight}
-
-**Skills Assessment:**
-- Core Technical Skills Matched: <List matched skills with evidence>
-- Emerging/Cutting-Edge Skills: <LLMs, GenAI, Web3, MLOps, Cloud, etc.>
-- Certifications Detected: <List any certifications found>
-- Soft Skills with Evidence: <Only count if backed by concrete examples>
-- Proficiency Depth: <Surface knowledge vs. demonstrated project usage>
-
-**Skills Gaps (Development Opportunities):**
-- <Gap 1 — specific missing skill from job description>
-- <Gap 2 — specific missing skill>
-- <Gap 3 — specific missing skill>
-- <Gap 4 — specific missing skill>
-- <Gap 5 — specific missing skill>
-
-**Score Justification:** <Explain with matched vs. required skills ratio>
-
-### 🗣 Language Quality Analysis
-**Score:** {grammar_score} / {lang_weight}
-**Grammar & Professional Tone:** {grammar_feedback}
-**Assessment:** <Specific feedback on action verb usage, clarity, tense consistency, and ATS language>
-
-### 🔑 Keyword Analysis
-**Score:** <0–{keyword_weight}> / {keyword_weight}
-
-**Keyword Assessment:**
-- Industry Terminology Match: <Percentage and specific matches found>
-- Role-Specific Keywords Present: <List matched keywords>
-- Technical Vocabulary: <Tools, frameworks, platforms found in both>
-- Keyword Density Quality: <Natural integration vs. stuffing>
-
-**Keyword Enhancement Opportunities:**
-- <Critical keyword 1 from job description — not in resume>
-- <Critical keyword 2>
-- <Critical keyword 3>
-- <Critical keyword 4>
-- <Critical keyword 5>
-- <Critical keyword 6>
-- <Critical keyword 7>
-- <Critical keyword 8>
-
-**Score Justification:** <Evidence-based explanation>
-
-### ✅ Final Assessment
-
-**Overall Evaluation:**
-<5–7 sentences covering: candidate's unique value proposition, strongest evidence-backed qualifications, key gaps, culture/team fit signals, and a clear hire/interview recommendation>
-
-**Top 3 Strengths (with evidence):**
-1. <Strength 1 — backed by resume evidence>
-2. <Strength 2 — backed by resume evidence>
-3. <Strength 3 — backed by resume evidence>
-
-**Top 3 Development Areas:**
-1. <Gap 1 framed as a growth opportunity>
-2. <Gap 2 framed as a growth opportunity>
-3. <Gap 3 framed as a growth opportunity>
-
-**Hiring Recommendation:** <Strongly Recommend / Recommend / Recommend with Reservations / Do Not Recommend> — <2-sentence reasoning>
+Fill EVERY field of the JSON object. Analysis fields are Markdown bullet lists:
+
+- candidate_name: full name from the resume header or contact section
+- education.score: 0–{edu_weight}
+- education.analysis:
+  - Degree Level & Relevance: <Does it qualify for minimum {int(edu_weight * 0.75)}-pt rule? Which degree?>
+  - Completion Status: <Apply strict 2025 cutoff rule; state year and final status>
+  - Academic Quality Indicators: <GPA, honors, relevant coursework if mentioned>
+  - **Score Justification:** <Explain exact score with evidence from resume>
+- experience.score: 0–{exp_weight}
+- experience.analysis:
+  - Total Years of Relevant Experience: <X years — include internships, freelance, open-source>
+  - Role Progression & Seniority: <Entry → Mid → Senior trajectory>
+  - Domain Alignment: <How well does background match job domain?>
+  - Quantified Achievements: <List metrics found: % improvement, $ savings, users served, etc.>
+  - Leadership & Ownership Evidence: <Managed teams? Led projects? Mentored?>
+  - Technology Currency: <Are skills/tools recent and relevant (last 3 years)?>
+  - **Score Justification:** <Explain score with specific resume evidence>
+- skills.score: 0–{skills_weight}
+- skills.analysis:
+  - Core Technical Skills Matched: <List matched skills with evidence>
+  - Emerging/Cutting-Edge Skills: <LLMs, GenAI, Web3, MLOps, Cloud, etc.>
+  - Certifications Detected: <List any certifications found>
+  - Soft Skills with Evidence: <Only count if backed by concrete examples>
+  - Proficiency Depth: <Surface knowledge vs. demonstrated project usage>
+  - **Score Justification:** <Explain with matched vs. required skills ratio>
+- skills_gaps: 5 specific skills from the job description missing in the resume
+- language_assessment: specific feedback on action verb usage, clarity, tense consistency, and ATS language
+  (the language score out of {lang_weight} is pre-evaluated — see the evaluation context)
+- keywords.score: 0–{keyword_weight}
+- keywords.analysis:
+  - Industry Terminology Match: <Percentage and specific matches found>
+  - Role-Specific Keywords Present: <List matched keywords>
+  - Technical Vocabulary: <Tools, frameworks, platforms found in both>
+  - Keyword Density Quality: <Natural integration vs. stuffing>
+  - **Score Justification:** <Evidence-based explanation>
+- missing_keywords: 8 critical keywords from the job description that are not in the resume
+- final_assessment (Markdown):
+  **Overall Evaluation:** <5–7 sentences covering: candidate's unique value proposition, strongest evidence-backed qualifications, key gaps, culture/team fit signals, and a clear hire/interview recommendation>
+  **Top 3 Strengths (with evidence):** <numbered list, each backed by resume evidence>
+  **Top 3 Development Areas:** <numbered list, each framed as a growth opportunity>
+  **Hiring Recommendation:** <Strongly Recommend / Recommend / Recommend with Reservations / Do Not Recommend> — <2-sentence reasoning>
+"""
 
----
+class AtsSection(BaseModel):
+    score: int
+    analysis: str = Field(description="Markdown bullet list")
+
+class AtsReport(BaseModel):
+    candidate_name: str
+    education: AtsSection
+    experience: AtsSection
+    skills: AtsSection
+    skills_gaps: list[str]
+    language_assessment: str
+    keywords: AtsSection
+    missing_keywords: list[str]
+    final_assessment: str = Field(description="Markdown")
+
+# ✅ Used when the evaluation is unavailable (scores then fall to the minimum thresholds)
+ATS_FALLBACK_REPORT = AtsReport(
+    candidate_name="Not Found",
+    education=AtsSection(score=0, analysis="N/A"),
+    experience=AtsSection(score=0, analysis="N/A"),
+    skills=AtsSection(score=0, analysis="N/A"),
+    skills_gaps=[],
+    language_assessment="N/A",
+    keywords=AtsSection(score=0, analysis="N/A"),
+    missing_keywords=[],
+    final_assessment="N/A",
+)
 
+ATS_TEMPLATE = register_template("ats_eval", system=_ats_rubric, user="""
 **EVALUATION CONTEXT:**
-- Current Date: {datetime.datetime.now().strftime('%B %Y')} (Year: {current_year}, Month: {current_month})
+- Current Date: {current_date} (Year: {current_year}, Month: {current_month})
 - Grammar Score Pre-evaluated: {grammar_score} / {lang_weight} — {grammar_feedback}
 - Resume Domain Detected: {resume_domain}
 - Target Job Domain: {job_domain}
 - Domain Similarity Score: {similarity_score:.2f}/1.0
-- Domain Mismatch Penalty Applied: {domain_penalty}/{MAX_DOMAIN_PENALTY} pts
+- Domain Mismatch Penalty Applied: {domain_penalty}/{max_domain_penalty} pts
 
 ---
 
@@ -3615,33 +3509,197 @@ Follow this EXACT structure. Do not skip any section:
 {resume_text}
 
 {logic_score_note}
-"""
+""")
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=256)
+def _classify_job_domain(job_title, job_description, _session=None):
+    """LLM domain of a job posting; raises so a failed classification is never cached"""
+    domain = db_manager.classify_domain_llm(job_title, job_description, session=_session)
+    if domain is None:
+        raise RuntimeError("LLM domain classification unavailable")
+    return domain
+
+def detect_domain(job_title, text, session=None, cached=False):
+    """
+    Returns (domain, fallback_used). Falls back to keyword matching when the LLM fails;
+    with cached=True successful classifications are shared across sessions.
+    """
+    if cached:
+        try:
+            domain = _classify_job_domain(job_title, text, _session=session)
+        except RuntimeError:
+            domain = None
+    else:
+        domain = db_manager.classify_domain_llm(job_title, text, session=session)
+    if domain is not None:
+        return domain, False
+    return detect_domain_from_title_and_description(job_title, text), True
+
+# ✅ Main ATS Evaluation Function
+def ats_percentage_score(
+    resume_text,
+    job_description,
+    job_title="Unknown",
+    logic_profile_score=None,
+    edu_weight=20,
+    exp_weight=35,
+    skills_weight=30,
+    lang_weight=5,
+    keyword_weight=10,
+    stream_placeholder=None
+):
+    import datetime
+
+    # ✅ Grammar evaluation and both domain detections are independent: run them
+    # concurrently; only the main ATS prompt below waits for all three
+    grammar_future = submit_llm_stage(get_grammar_score_with_llm, resume_text, max_score=lang_weight)
+    resume_domain_future = submit_llm_stage(
+        detect_domain,
+        "Unknown",
+        resume_text,
+        session=st.session_state  # ✅ pass the Groq API key from session
+    )
+    # ✅ Job domain is shared across sessions, but only when the LLM actually classified it
+    job_domain_future = submit_llm_stage(detect_domain, job_title, job_description,
+                                         session=st.session_state, cached=True)
+
+    grammar_score, grammar_feedback, grammar_suggestions, grammar_fallback = grammar_future.result()
+    resume_domain, resume_domain_fallback = resume_domain_future.result()
+    job_domain, job_domain_fallback = job_domain_future.result()
+    similarity_score = get_domain_similarity(resume_domain, job_domain)
+
+    # ✅ Balanced domain penalty
+    MAX_DOMAIN_PENALTY = 15
+    domain_penalty = round((1 - similarity_score) * MAX_DOMAIN_PENALTY)
+
+    # ✅ Optional profile score note
+    logic_score_note = (
+        f"\n\nOptional Note: The system also calculated a logic-based profile score of {logic_profile_score}/100 "
+        f"based on resume length, experience, and skills."
+        if logic_profile_score else ""
+    )
+
+    # ✅ FIXED: Stable education scoring with 2025 cutoff
+    current_year = datetime.datetime.now().year
+    current_month = datetime.datetime.now().month
+    
+    # ✅ FIXED: Education completion detection with 2025 cutoff
+    def determine_education_status(education_text, end_year_str):
+        """
+        Determine if education is completed or ongoing based on 2025 cutoff and keywords.
+        Returns 'completed' or 'ongoing'.
+        """
+        try:
+            end_year = int(end_year_str.strip())
+        except (ValueError, AttributeError):
+            # If we can't parse the year, default to ongoing
+            return "ongoing"
+        
+        # Apply 2025 cutoff rule (HARDCODED - NOT dynamic)
+        if end_year < 2025:
+            education_status = "completed"
+        elif end_year == 2025:
+            education_status = "completed"
+        else:  # end_year > 2025
+            education_status = "ongoing"
+        
+        # Check for explicit keywords that might override numeric rules
+        education_lower = education_text.lower()
+        ongoing_keywords = ["pursuing", "present", "ongoing", "currently enrolled", "in progress"]
+        completed_keywords = ["graduated", "completed", "finished"]
+        
+        # Override rule: If end year < 2025, always completed regardless of text
+        if end_year < 2025:
+            return "completed"
+        
+        # For years >= 2025, check keywords
+        if end_year < 2025:
+            return "completed"
+        
+        # For years >= 2025, check keywords
+        if any(keyword in education_lower for keyword in ongoing_keywords):
+            education_status = "ongoing"
+        elif any(keyword in education_lower for keyword in completed_keywords):
+            education_status = "completed"
+        
+        return education_status
+    
+    # ✅ UPDATED: Stable education scoring with priority degrees minimum
+    prompt = ATS_TEMPLATE.render(
+        edu_weight=edu_weight,
+        exp_weight=exp_weight,
+        skills_weight=skills_weight,
+        keyword_weight=keyword_weight,
+        lang_weight=lang_weight,
+        current_date=datetime.datetime.now().strftime('%B %Y'),
+        current_year=current_year,
+        current_month=current_month,
+        grammar_score=grammar_score,
+        grammar_feedback=grammar_feedback,
+        resume_domain=resume_domain,
+        job_domain=job_domain,
+        similarity_score=similarity_score,
+        domain_penalty=domain_penalty,
+        max_domain_penalty=MAX_DOMAIN_PENALTY,
+        job_description=job_description,
+        resume_text=resume_text,
+        logic_score_note=logic_score_note,
+    )
    
    
-    ats_result = call_llm(prompt, session=st.session_state).strip()
-
-    def extract_section(pattern, text, default="N/A"):
-        match = re.search(pattern, text, re.DOTALL)
-        return match.group(1).strip() if match else default
-
-    def extract_score(pattern, text, default=0):
-        match = re.search(pattern, text)
-        return int(match.group(1)) if match else default
-
-    # Extract key sections
-    candidate_name = extract_section(r"### 🏷️ Candidate Name(.*?)###", ats_result, "Not Found")
-    edu_analysis = extract_section(r"### 🏫 Education Analysis(.*?)###", ats_result)
-    exp_analysis = extract_section(r"### 💼 Experience Analysis(.*?)###", ats_result)
-    skills_analysis = extract_section(r"### 🛠 Skills Analysis(.*?)###", ats_result)
-    lang_analysis = extract_section(r"### 🗣 Language Quality Analysis(.*?)###", ats_result)
-    keyword_analysis = extract_section(r"### 🔑 Keyword Analysis(.*?)###", ats_result)
-    final_thoughts = extract_section(r"### ✅ Final Assessment(.*)", ats_result)
-
-    # Extract scores with improved patterns (LLM now scores directly using sidebar weights)
-    edu_score = extract_score(r"\*\*Score:\*\*\s*(\d+)", edu_analysis)
-    exp_score = extract_score(r"\*\*Score:\*\*\s*(\d+)", exp_analysis)
-    skills_score = extract_score(r"\*\*Score:\*\*\s*(\d+)", skills_analysis)
-    keyword_score = extract_score(r"\*\*Score:\*\*\s*(\d+)", keyword_analysis)
+    # ✅ Structured evaluation: scores and sections come back as fields, not free text
+    if stream_placeholder is not None:
+        show_llm_overlay(stream_placeholder, "📊 Writing ATS report")
+    try:
+        report = call_llm_structured(prompt, AtsReport, session=st.session_state,
+                                     family="ats_eval", semantic_text=resume_text, hedge=True)
+    finally:
+        if stream_placeholder is not None:
+            stream_placeholder.empty()
+    # ✅ Scores built on a fallback are provisional (screen_resume does not cache them)
+    fallback_used = report is None or grammar_fallback or resume_domain_fallback or job_domain_fallback
+    report = report or ATS_FALLBACK_REPORT
+
+    def list_items(items):
+        return [item.strip() for item in items if len(item.strip()) > 2]  # Avoid empty or very short items
+
+    def scored_section(section, weight, extra=""):
+        return f"**Score:** {section.score} / {weight}\n\n{section.analysis.strip()}{extra}"
+
+    def bullet_block(title, items):
+        return f"\n\n**{title}:**\n" + "\n".join(f"- {item}" for item in items) if items else ""
+
+    skills_gaps = list_items(report.skills_gaps)
+    missing_keyword_items = list_items(report.missing_keywords)
+
+    candidate_name = report.candidate_name.strip() or "Not Found"
+    edu_analysis = scored_section(report.education, edu_weight)
+    exp_analysis = scored_section(report.experience, exp_weight)
+    skills_analysis = scored_section(report.skills, skills_weight,
+                                     bullet_block("Skills Gaps (Development Opportunities)", skills_gaps))
+    lang_analysis = (f"**Score:** {grammar_score} / {lang_weight}\n"
+                     f"**Grammar & Professional Tone:** {grammar_feedback}\n"
+                     f"**Assessment:** {report.language_assessment.strip()}")
+    keyword_analysis = scored_section(report.keywords, keyword_weight,
+                                      bullet_block("Keyword Enhancement Opportunities", missing_keyword_items))
+    final_thoughts = report.final_assessment.strip()
+
+    # Markdown report with the same sections the free-text format used to have
+    ats_result = "\n\n".join([
+        f"### 🏷️ Candidate Name\n{candidate_name}",
+        f"### 🏫 Education Analysis\n{edu_analysis}",
+        f"### 💼 Experience Analysis\n{exp_analysis}",
+        f"### 🛠 Skills Analysis\n{skills_analysis}",
+        f"### 🗣 Language Quality Analysis\n{lang_analysis}",
+        f"### 🔑 Keyword Analysis\n{keyword_analysis}",
+        f"### ✅ Final Assessment\n{final_thoughts}",
+    ])
+
+    # Scores (LLM scores directly using sidebar weights)
+    edu_score = report.education.score
+    exp_score = report.experience.score
+    skills_score = report.skills.score
+    keyword_score = report.keywords.score
     lang_score = grammar_score  # Grammar score already uses lang_weight
 
     # ✅ Apply minimum thresholds to avoid overly harsh penalties
@@ -3650,42 +3708,9 @@ Follow this EXACT structure. Do not skip any section:
     skills_score = max(skills_score, int(skills_weight * 0.15))  # Minimum 15% of weight
     keyword_score = max(keyword_score, int(keyword_weight * 0.10))  # Minimum 10% of weight
 
-    # Extract missing items with better parsing - now called "opportunities"
-    missing_keywords_section = extract_section(r"\*\*Keyword Enhancement Opportunities:\*\*(.*?)(?:\*\*|###|\Z)", keyword_analysis)
-    missing_skills_section = extract_section(r"\*\*Skills Gaps \(Opportunities for Growth\):\*\*(.*?)(?:\*\*|###|\Z)", skills_analysis)
-    
-    # Fallback to old patterns if new ones don't match
-    if not missing_keywords_section.strip():
-        missing_keywords_section = extract_section(r"\*\*Missing Critical Keywords:\*\*(.*?)(?:\*\*|###|\Z)", keyword_analysis)
-    if not missing_skills_section.strip():
-        missing_skills_section = extract_section(r"\*\*Missing Critical Skills:\*\*(.*?)(?:\*\*|###|\Z)", skills_analysis)
-    
-    # Improved extraction - handle multiple formats and get all items
-    def extract_list_items(text):
-        if not text.strip():
-            return "None identified"
-        
-        # Find all bullet points with various formats
-        items = []
-        lines = text.strip().split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Remove various bullet point formats
-            cleaned_line = re.sub(r'^[-•*]\s*', '', line)  # Remove -, •, * bullets
-            cleaned_line = re.sub(r'^\d+\.\s*', '', cleaned_line)  # Remove numbered lists
-            cleaned_line = cleaned_line.strip()
-            
-            if cleaned_line and len(cleaned_line) > 2:  # Avoid empty or very short items
-                items.append(cleaned_line)
-        
-        return ', '.join(items) if items else "None identified"
-    
-    missing_keywords = extract_list_items(missing_keywords_section)
-    missing_skills = extract_list_items(missing_skills_section)
+    # Missing items - now called "opportunities"
+    missing_keywords = ", ".join(missing_keyword_items) or "None identified"
+    missing_skills = ", ".join(skills_gaps) or "None identified"
 
     # ✅ IMPROVED: More balanced total score calculation
     total_score = edu_score + exp_score + skills_score + lang_score + keyword_score
@@ -3763,14 +3788,13 @@ Follow this EXACT structure. Do not skip any section:
         "Resume Domain": resume_domain,
         "Job Domain": job_domain,
         "Domain Penalty": domain_penalty,
-        "Domain Similarity Score": similarity_score
+        "Domain Similarity Score": similarity_score,
+        "LLM Fallback": fallback_used
     }
 
 # Setup Vector DB
 def setup_vectorstore(documents):
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    if DEVICE == "cuda":
-        embeddings.model = embeddings.model.to(torch.device("cuda"))
+    embeddings = get_embedding_model()  # shared with the LLM semantic cache
     text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=100)
     doc_chunks = text_splitter.split_text("\n".join(documents))
     return FAISS.from_texts(doc_chunks, embeddings)
@@ -3948,381 +3972,376 @@ if "processed_files" not in st.session_state:
 resume_data = st.session_state.resume_data
 
 # ✏️ Resume Evaluation Logic
-if uploaded_files and job_description:
-    all_text = []
-
-    for uploaded_file in uploaded_files:
-        if uploaded_file.name in st.session_state.processed_files:
-            continue
+SCREENING_WORKERS = 4  # resumes screened concurrently; their LLM stages share the bounded stage pool
 
-        # ✅ Improved optimized scanner animation with better performance
-        scanner_placeholder = st.empty()
+@st.cache_resource(show_spinner=False)
+def get_screening_pool():
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=SCREENING_WORKERS, thread_name_prefix="screening")
 
-        # ✅ IMPROVED: More efficient CSS animations with GPU acceleration
-        OPTIMIZED_SCANNER_HTML = f"""
-        <style>
-        .scanner-overlay {{
-            position: fixed;
-            top: 0; left: 0;
-            width: 100vw; height: 100vh;
-            background: linear-gradient(135deg, #0b0c10 0%, #1a1c29 100%);
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            z-index: 9999;
-            will-change: transform, opacity;
-        }}
-        
-        .scanner-doc {{
-            width: 280px;
-            height: 340px;
-            background: linear-gradient(145deg, #f8f9fa, #e9ecef);
-            border-radius: 16px;
-            position: relative;
-            overflow: hidden;
-            box-shadow: 0 20px 40px rgba(0, 191, 255, 0.3);
-            transform: translateZ(0);
-            will-change: transform;
-            animation: docFloat 3s ease-in-out infinite alternate;
-        }}
-        
-        @keyframes docFloat {{
-            0% {{ transform: translateY(0px) scale(1); }}
-            100% {{ transform: translateY(-8px) scale(1.02); }}
-        }}
-        
-        .doc-header {{
-            padding: 20px;
-            text-align: center;
-            border-bottom: 2px solid #e9ecef;
-        }}
-        
-        .doc-avatar {{
-            width: 50px;
-            height: 50px;
-            background: linear-gradient(135deg, #667eea, #764ba2);
-            border-radius: 50%;
-            margin: 0 auto 10px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 20px;
-            color: white;
-        }}
-        
-        .doc-title {{
-            font-size: 16px;
-            font-weight: bold;
-            color: #2c3e50;
-            margin-bottom: 5px;
-            font-family: 'Segoe UI', sans-serif;
-        }}
-        
-        .doc-content {{
-            padding: 15px;
-            font-size: 12px;
-            color: #6c757d;
-            line-height: 1.4;
-        }}
-        
-        .scan-line {{
-            position: absolute;
-            top: 0; left: 0;
-            width: 100%; height: 4px;
-            background: linear-gradient(90deg, transparent, rgba(0,191,255,0.8), transparent);
-            animation: scanMove 2.5s ease-in-out infinite;
-            box-shadow: 0 0 20px rgba(0,191,255,0.6);
-            transform: translateZ(0);
-            will-change: transform;
-        }}
-        
-        @keyframes scanMove {{
-            0% {{ top: 0; opacity: 1; }}
-            50% {{ opacity: 0.8; }}
-            100% {{ top: 340px; opacity: 1; }}
-        }}
-        
-        .scanner-text {{
-            margin-top: 30px;
-            font-family: 'Orbitron', 'Segoe UI', sans-serif;
-            font-weight: 600;
-            font-size: 18px;
-            color: #00bfff;
-            text-shadow: 0 0 10px rgba(0,191,255,0.5);
-            animation: textPulse 2s ease-in-out infinite;
-        }}
-        
-        @keyframes textPulse {{
-            0%, 100% {{ opacity: 1; transform: scale(1); }}
-            50% {{ opacity: 0.8; transform: scale(1.05); }}
-        }}
-        
-        .progress-bar {{
-            width: 200px;
-            height: 4px;
-            background: rgba(255,255,255,0.2);
-            border-radius: 2px;
-            margin-top: 20px;
-            overflow: hidden;
-        }}
-        
-        .progress-fill {{
-            height: 100%;
-            background: linear-gradient(90deg, #00bfff, #1e90ff);
-            border-radius: 2px;
-            animation: progressFill 3s ease-in-out infinite;
-            transform: translateX(-100%);
-        }}
-        
-        @keyframes progressFill {{
-            0% {{ transform: translateX(-100%); }}
-            100% {{ transform: translateX(0); }}
-        }}
-        
-        /* Mobile optimizations */
-        @media (max-width: 768px) {{
-            .scanner-doc {{ width: 240px; height: 300px; }}
-            .scanner-text {{ font-size: 16px; }}
-        }}
-        </style>
-        
-        <div class="scanner-overlay">
-            <div class="scanner-doc">
-                <div class="scan-line"></div>
-                <div class="doc-header">
-                    <div class="doc-avatar">👤</div>
-                    <div class="doc-title">{job_title}</div>
-                </div>
-                <div class="doc-content">
-                    • Analyzing candidate profile...<br>
-                    • Extracting key skills...<br>
-                    • Matching with job requirements...<br>
-                    • Calculating ATS compatibility...<br>
-                    • Checking for bias patterns...
-                </div>
+def scanner_overlay_html(job_title, done, total):
+    """Full-screen scanner animation with aggregate batch progress"""
+    progress = int(done * 100 / total) if total else 100
+    return f"""
+    <style>
+    .scanner-overlay {{
+        position: fixed;
+        top: 0; left: 0;
+        width: 100vw; height: 100vh;
+        background: linear-gradient(135deg, #0b0c10 0%, #1a1c29 100%);
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+        align-items: center;
+        z-index: 9999;
+        will-change: transform, opacity;
+    }}
+    
+    .scanner-doc {{
+        width: 280px;
+        height: 340px;
+        background: linear-gradient(145deg, #f8f9fa, #e9ecef);
+        border-radius: 16px;
+        position: relative;
+        overflow: hidden;
+        box-shadow: 0 20px 40px rgba(0, 191, 255, 0.3);
+        transform: translateZ(0);
+        will-change: transform;
+        animation: docFloat 3s ease-in-out infinite alternate;
+    }}
+    
+    @keyframes docFloat {{
+        0% {{ transform: translateY(0px) scale(1); }}
+        100% {{ transform: translateY(-8px) scale(1.02); }}
+    }}
+    
+    .doc-header {{
+        padding: 20px;
+        text-align: center;
+        border-bottom: 2px solid #e9ecef;
+    }}
+    
+    .doc-avatar {{
+        width: 50px;
+        height: 50px;
+        background: linear-gradient(135deg, #667eea, #764ba2);
+        border-radius: 50%;
+        margin: 0 auto 10px;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        font-size: 20px;
+        color: white;
+    }}
+    
+    .doc-title {{
+        font-size: 16px;
+        font-weight: bold;
+        color: #2c3e50;
+        margin-bottom: 5px;
+        font-family: 'Segoe UI', sans-serif;
+    }}
+    
+    .doc-content {{
+        padding: 15px;
+        font-size: 12px;
+        color: #6c757d;
+        line-height: 1.4;
+    }}
+    
+    .scan-line {{
+        position: absolute;
+        top: 0; left: 0;
+        width: 100%; height: 4px;
+        background: linear-gradient(90deg, transparent, rgba(0,191,255,0.8), transparent);
+        animation: scanMove 2.5s ease-in-out infinite;
+        box-shadow: 0 0 20px rgba(0,191,255,0.6);
+        transform: translateZ(0);
+        will-change: transform;
+    }}
+    
+    @keyframes scanMove {{
+        0% {{ top: 0; opacity: 1; }}
+        50% {{ opacity: 0.8; }}
+        100% {{ top: 340px; opacity: 1; }}
+    }}
+    
+    .scanner-text {{
+        margin-top: 30px;
+        font-family: 'Orbitron', 'Segoe UI', sans-serif;
+        font-weight: 600;
+        font-size: 18px;
+        color: #00bfff;
+        text-shadow: 0 0 10px rgba(0,191,255,0.5);
+        animation: textPulse 2s ease-in-out infinite;
+    }}
+    
+    @keyframes textPulse {{
+        0%, 100% {{ opacity: 1; transform: scale(1); }}
+        50% {{ opacity: 0.8; transform: scale(1.05); }}
+    }}
+    
+    .progress-bar {{
+        width: 200px;
+        height: 4px;
+        background: rgba(255,255,255,0.2);
+        border-radius: 2px;
+        margin-top: 20px;
+        overflow: hidden;
+    }}
+    
+    .progress-fill {{
+        height: 100%;
+        width: {progress}%;
+        background: linear-gradient(90deg, #00bfff, #1e90ff);
+        border-radius: 2px;
+        transition: width 0.4s ease-out;
+    }}
+    
+    /* Mobile optimizations */
+    @media (max-width: 768px) {{
+        .scanner-doc {{ width: 240px; height: 300px; }}
+        .scanner-text {{ font-size: 16px; }}
+    }}
+    </style>
+    
+    <div class="scanner-overlay">
+        <div class="scanner-doc">
+            <div class="scan-line"></div>
+            <div class="doc-header">
+                <div class="doc-avatar">👤</div>
+                <div class="doc-title">{job_title}</div>
             </div>
-            <div class="scanner-text">Scanning Resume...</div>
-            <div class="progress-bar">
-                <div class="progress-fill"></div>
+            <div class="doc-content">
+                • Analyzing candidate profile...<br>
+                • Extracting key skills...<br>
+                • Matching with job requirements...<br>
+                • Calculating ATS compatibility...<br>
+                • Checking for bias patterns...
             </div>
         </div>
-        """
-        
-        scanner_placeholder.markdown(OPTIMIZED_SCANNER_HTML, unsafe_allow_html=True)
+        <div class="scanner-text">Scanning Resumes... {done}/{total}</div>
+        <div class="progress-bar">
+            <div class="progress-fill"></div>
+        </div>
+    </div>
+    """
 
-        # ✅ Save uploaded file
-        file_path = os.path.join(working_dir, uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+ANALYSIS_CACHE_VERSION = 1  # bump when screen_resume's record or scoring logic changes
 
-        # ✅ Reduced delay for better UX
-        time.sleep(4)
+def candidate_row_from_record(record):
+    """The candidates-table row for a screened resume record"""
+    return (
+        record["Resume Name"],
+        record["Candidate Name"],
+        record["ATS Match %"],
+        record["Education Score"],
+        record["Experience Score"],
+        record["Skills Score"],
+        record["Language Score"],
+        record["Keyword Score"],
+        record["Bias Score (0 = Fair, 1 = Biased)"]
+    )
 
-        # ✅ Extract text from PDF
-        text = extract_text_from_pdf(file_path)
-        if not text:
-            st.warning(f"⚠️ Could not extract text from {uploaded_file.name}. Skipping.")
-            scanner_placeholder.empty()
-            continue
+def screen_resume(uploaded_file, job_title, job_description, replacement_mapping, user_location, weights,
+                  stream_placeholder=None):
+    """
+    Extract, bias-score, rewrite and ATS-score one uploaded resume (runs on the screening pool,
+    or on the script thread with `stream_placeholder` to stream the rewrite as it is generated).
+    Returns (resume record, candidates row, full text, warnings); the record is None when
+    no text could be extracted. Warnings are rendered by the caller on the script thread.
+    Results are cached by file content and screening settings, so an identical re-screen
+    makes no LLM calls.
+    """
+    warnings = []
+    pdf_bytes = bytes(uploaded_file.getbuffer())
+    cache_key = analysis_cache_key(
+        pdf_bytes,
+        version=ANALYSIS_CACHE_VERSION,
+        job_title=job_title or "",
+        job_description=job_description,
+        user_location=user_location or "",
+        weights=weights,
+    )
+    try:
+        cached = get_cached_analysis(cache_key)
+    except Exception as e:
+        cached = None
+        warnings.append(f"⚠️ Analysis cache unavailable, screening from scratch: {e}")
+    if cached:
+        record = dict(cached["record"], **{"Resume Name": uploaded_file.name})
+        return record, candidate_row_from_record(record), cached["full_text"], warnings
+
+    # ✅ Save uploaded file
+    file_path = os.path.join(working_dir, uploaded_file.name)
+    with open(file_path, "wb") as f:
+        f.write(pdf_bytes)
+
+    # ✅ Extract text from PDF
+    text = extract_text_from_pdf(file_path)
+    if not text:
+        return None, None, None, warnings
+    full_text = " ".join(text)
+
+    # ✅ Bias detection: one scan feeds the counts, findings and highlighting
+    bias = analyze_bias(full_text)
+    bias_score = bias["bias_score"]
+    detected_masc, detected_fem = bias["masculine"], bias["feminine"]
+    masc_count, fem_count = len(detected_masc), len(detected_fem)
+
+    # ✅ Rewrite and highlight gender-biased words
+    highlighted_text, rewritten_text, _, _, _, _ = rewrite_and_highlight(
+        full_text, replacement_mapping, user_location,
+        stream_placeholder=stream_placeholder, analysis=bias
+    )
 
-        all_text.append(" ".join(text))
-        full_text = " ".join(text)
+    # ✅ LLM-based ATS Evaluation
+    ats_result, ats_scores = ats_percentage_score(
+        resume_text=full_text,
+        job_description=job_description,
+        job_title=job_title or "Unknown",
+        logic_profile_score=None,
+        stream_placeholder=stream_placeholder,
+        **weights
+    )
 
-        # ✅ Bias detection
-        bias_score, masc_count, fem_count, detected_masc, detected_fem = detect_bias(full_text)
+    # ✅ Extract structured ATS values
+    candidate_name = ats_scores.get("Candidate Name", "Not Found")
+    ats_score = ats_scores.get("ATS Match %", 0)
+    edu_score = ats_scores.get("Education Score", 0)
+    exp_score = ats_scores.get("Experience Score", 0)
+    skills_score = ats_scores.get("Skills Score", 0)
+    lang_score = ats_scores.get("Language Score", 0)
+    keyword_score = ats_scores.get("Keyword Score", 0)
+    formatted_score = ats_scores.get("Formatted Score", "N/A")
+    fit_summary = ats_scores.get("Final Thoughts", "N/A")
+    language_analysis_full = ats_scores.get("Language Analysis", "N/A")
+
+    missing_keywords_raw = ats_scores.get("Missing Keywords", "N/A")
+    missing_skills_raw = ats_scores.get("Missing Skills", "N/A")
+    missing_keywords = [kw.strip() for kw in missing_keywords_raw.split(",") if kw.strip()] if missing_keywords_raw != "N/A" else []
+    missing_skills = [sk.strip() for sk in missing_skills_raw.split(",") if sk.strip()] if missing_skills_raw != "N/A" else []
+
+    domain = ats_scores.get("Job Domain")  # ✅ detected once per job description inside ats_percentage_score
+
+    bias_flag = "🔴 High Bias" if bias_score > 0.6 else "🟢 Fair"
+
+    record = {
+        "Resume Name": uploaded_file.name,
+        "Candidate Name": candidate_name,
+        "ATS Report": ats_result,
+        "ATS Match %": ats_score,
+        "Formatted Score": formatted_score,
+        "Education Score": edu_score,
+        "Experience Score": exp_score,
+        "Skills Score": skills_score,
+        "Language Score": lang_score,
+        "Keyword Score": keyword_score,
+        "Education Analysis": ats_scores.get("Education Analysis", ""),
+        "Experience Analysis": ats_scores.get("Experience Analysis", ""),
+        "Skills Analysis": ats_scores.get("Skills Analysis", ""),
+        "Language Analysis": language_analysis_full,
+        "Keyword Analysis": ats_scores.get("Keyword Analysis", ""),
+        "Final Thoughts": fit_summary,
+        "Missing Keywords": missing_keywords,
+        "Missing Skills": missing_skills,
+        "Bias Score (0 = Fair, 1 = Biased)": bias_score,
+        "Bias Status": bias_flag,
+        "Masculine Words": masc_count,
+        "Feminine Words": fem_count,
+        "Detected Masculine Words": detected_masc,
+        "Detected Feminine Words": detected_fem,
+        "Text Preview": full_text[:300] + "...",
+        "Highlighted Text": highlighted_text,
+        "Rewritten Text": rewritten_text,
+        "Domain": domain
+    }
 
-        # ✅ Rewrite and highlight gender-biased words
-        highlighted_text, rewritten_text, _, _, _, _ = rewrite_and_highlight(
-            full_text, replacement_mapping, user_location
-        )
+    # ✅ Only complete evaluations are cached: a fallback in any LLM stage (domains, grammar,
+    # ATS report, rewrite) is re-tried on the next screen
+    if not ats_scores.get("LLM Fallback") and not rewritten_text.startswith("❌"):
+        try:
+            set_cached_analysis(cache_key, {"record": record, "full_text": full_text})
+        except Exception as e:
+            warnings.append(f"⚠️ Could not cache analysis for {uploaded_file.name}: {e}")
+
+    return record, candidate_row_from_record(record), full_text, warnings
+
+if uploaded_files and job_description:
+    all_text = []
+    pending_files = [f for f in uploaded_files if f.name not in st.session_state.processed_files]
+
+    if pending_files:
+        from concurrent.futures import as_completed
+
+        # ✅ One scanner overlay for the whole batch, updated as resumes finish
+        scanner_placeholder = st.empty()
+        scanner_placeholder.markdown(scanner_overlay_html(job_title, 0, len(pending_files)), unsafe_allow_html=True)
 
-        # ✅ LLM-based ATS Evaluation
-        ats_result, ats_scores = ats_percentage_score(
-            resume_text=full_text,
-            job_description=job_description,
-            logic_profile_score=None,
+        weights = dict(
             edu_weight=edu_weight,
             exp_weight=exp_weight,
             skills_weight=skills_weight,
             lang_weight=lang_weight,
-            keyword_weight=keyword_weight
-        )
-
-        # ✅ Extract structured ATS values
-        candidate_name = ats_scores.get("Candidate Name", "Not Found")
-        ats_score = ats_scores.get("ATS Match %", 0)
-        edu_score = ats_scores.get("Education Score", 0)
-        exp_score = ats_scores.get("Experience Score", 0)
-        skills_score = ats_scores.get("Skills Score", 0)
-        lang_score = ats_scores.get("Language Score", 0)
-        keyword_score = ats_scores.get("Keyword Score", 0)
-        formatted_score = ats_scores.get("Formatted Score", "N/A")
-        fit_summary = ats_scores.get("Final Thoughts", "N/A")
-        language_analysis_full = ats_scores.get("Language Analysis", "N/A")
-
-        missing_keywords_raw = ats_scores.get("Missing Keywords", "N/A")
-        missing_skills_raw = ats_scores.get("Missing Skills", "N/A")
-        missing_keywords = [kw.strip() for kw in missing_keywords_raw.split(",") if kw.strip()] if missing_keywords_raw != "N/A" else []
-        missing_skills = [sk.strip() for sk in missing_skills_raw.split(",") if sk.strip()] if missing_skills_raw != "N/A" else []
-
-        domain = db_manager.detect_domain_llm(
-            job_title,
-            job_description,
-            session=st.session_state  # ✅ pass the Groq API key from session
-        )
-
-        bias_flag = "🔴 High Bias" if bias_score > 0.6 else "🟢 Fair"
-        ats_flag = "⚠️ Low ATS" if ats_score < 50 else "✅ Good ATS"
-
-        # ✅ Store everything in session state
-        st.session_state.resume_data.append({
-            "Resume Name": uploaded_file.name,
-            "Candidate Name": candidate_name,
-            "ATS Report": ats_result,
-            "ATS Match %": ats_score,
-            "Formatted Score": formatted_score,
-            "Education Score": edu_score,
-            "Experience Score": exp_score,
-            "Skills Score": skills_score,
-            "Language Score": lang_score,
-            "Keyword Score": keyword_score,
-            "Education Analysis": ats_scores.get("Education Analysis", ""),
-            "Experience Analysis": ats_scores.get("Experience Analysis", ""),
-            "Skills Analysis": ats_scores.get("Skills Analysis", ""),
-            "Language Analysis": language_analysis_full,
-            "Keyword Analysis": ats_scores.get("Keyword Analysis", ""),
-            "Final Thoughts": fit_summary,
-            "Missing Keywords": missing_keywords,
-            "Missing Skills": missing_skills,
-            "Bias Score (0 = Fair, 1 = Biased)": bias_score,
-            "Bias Status": bias_flag,
-            "Masculine Words": masc_count,
-            "Feminine Words": fem_count,
-            "Detected Masculine Words": detected_masc,
-            "Detected Feminine Words": detected_fem,
-            "Text Preview": full_text[:300] + "...",
-            "Highlighted Text": highlighted_text,
-            "Rewritten Text": rewritten_text,
-            "Domain": domain
-        })
-
-        insert_candidate(
-            (
-                uploaded_file.name,
-                candidate_name,
-                ats_score,
-                edu_score,
-                exp_score,
-                skills_score,
-                lang_score,
-                keyword_score,
-                bias_score
-            ),
-            job_title=job_title,
-            job_description=job_description
+            keyword_weight=keyword_weight,
         )
-
-        st.session_state.processed_files.add(uploaded_file.name)
-
-        # ✅ IMPROVED: Smoother success animation with better transitions
-        SUCCESS_HTML = """
-        <style>
-        .success-overlay {
-            position: fixed;
-            top: 0; left: 0;
-            width: 100vw; height: 100vh;
-            background: linear-gradient(135deg, #0b0c10 0%, #1a1c29 100%);
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            z-index: 9999;
-            animation: fadeIn 0.5s ease-out;
-        }
-        
-        @keyframes fadeIn {
-            0% { opacity: 0; }
-            100% { opacity: 1; }
-        }
-        
-        .success-circle {
-            width: 140px;
-            height: 140px;
-            border: 3px solid #00bfff;
-            border-radius: 50%;
-            position: relative;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            background: radial-gradient(circle, rgba(0,191,255,0.1) 0%, rgba(0,191,255,0.05) 50%, transparent 100%);
-            animation: successPulse 2s ease-in-out infinite;
-        }
-        
-        @keyframes successPulse {
-            0%, 100% { 
-                transform: scale(1);
-                box-shadow: 0 0 20px rgba(0,191,255,0.3);
-            }
-            50% { 
-                transform: scale(1.05);
-                box-shadow: 0 0 30px rgba(0,191,255,0.6);
+        def screening_outcomes():
+            """Yield (index, result or exception) as resumes finish"""
+            if len(pending_files) == 1:
+                # ✅ A single resume is screened on the script thread, so its rewrite
+                # streams into a live preview above the scanner
+                live_placeholder = st.empty()
+                try:
+                    yield 0, screen_resume(pending_files[0], job_title, job_description, replacement_mapping,
+                                           user_location, weights, stream_placeholder=live_placeholder)
+                except Exception as e:
+                    yield 0, e
+                return
+            futures = {
+                submit_llm_stage(screen_resume, uploaded_file, job_title, job_description,
+                                 replacement_mapping, user_location, weights, pool=get_screening_pool()): i
+                for i, uploaded_file in enumerate(pending_files)
             }
-        }
-        
-        .success-checkmark {
-            font-size: 48px;
-            color: #00ff7f;
-            animation: checkmarkPop 0.8s ease-out;
-        }
-        
-        @keyframes checkmarkPop {
-            0% { transform: scale(0) rotate(-45deg); opacity: 0; }
-            50% { transform: scale(1.2) rotate(-10deg); opacity: 0.8; }
-            100% { transform: scale(1) rotate(0deg); opacity: 1; }
-        }
-        
-        .success-text {
-            margin-top: 25px;
-            font-family: 'Orbitron', 'Segoe UI', sans-serif;
-            font-size: 20px;
-            font-weight: 600;
-            color: #00bfff;
-            text-shadow: 0 0 10px rgba(0,191,255,0.5);
-            animation: textSlideUp 0.8s ease-out 0.3s both;
-        }
-        
-        @keyframes textSlideUp {
-            0% { transform: translateY(20px); opacity: 0; }
-            100% { transform: translateY(0); opacity: 1; }
-        }
-        
-        .success-subtitle {
-            margin-top: 10px;
-            font-size: 14px;
-            color: #8e9aaf;
-            animation: textSlideUp 0.8s ease-out 0.5s both;
-        }
-        </style>
-        
-        <div class="success-overlay">
-            <div class="success-circle">
-                <div class="success-checkmark">✓</div>
-            </div>
-            <div class="success-text">Scan Complete!</div>
-            <div class="success-subtitle">Resume analysis ready</div>
-        </div>
-        """
-        
-        # Clear scanner and show success animation
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], e
+
+        results = [None] * len(pending_files)
+        for done, (i, outcome) in enumerate(screening_outcomes(), start=1):
+            if isinstance(outcome, Exception):
+                st.error(f"⚠️ Could not screen {pending_files[i].name}: {outcome}")
+            else:
+                record, candidate_row, full_text, warnings = outcome
+                for warning in warnings:
+                    st.warning(warning)
+                if record is None:
+                    st.warning(f"⚠️ Could not extract text from {pending_files[i].name}. Skipping.")
+                else:
+                    results[i] = (record, candidate_row, full_text)
+            scanner_placeholder.markdown(scanner_overlay_html(job_title, done, len(pending_files)), unsafe_allow_html=True)
         scanner_placeholder.empty()
-        success_placeholder = st.empty()
-        success_placeholder.markdown(SUCCESS_HTML, unsafe_allow_html=True)
 
-        # ⏳ Shorter delay for better UX, then clear and rerun
-        time.sleep(3)
-        success_placeholder.empty()
-        st.rerun()
+        # ✅ Keep upload order, store everything in session state and save the batch at once
+        screened = [(f, result) for f, result in zip(pending_files, results) if result is not None]
+        for uploaded_file, (record, _, full_text) in screened:
+            st.session_state.resume_data.append(record)
+            st.session_state.processed_files.add(uploaded_file.name)
+            all_text.append(full_text)
+
+        if screened:
+            try:
+                _, failed_rows = insert_candidates_batch(
+                    [candidate_row for _, (_, candidate_row, _) in screened],
+                    job_title=job_title,
+                    job_description=job_description
+                )
+                for resume_name, error in failed_rows:
+                    st.error(f"⚠️ Could not save {resume_name}: {error}")
+            except Exception as e:
+                st.error(f"⚠️ Could not save screening results: {e}")
+            st.toast(f"✅ Screened {len(screened)} of {len(pending_files)} resume(s)")
 
     # ✅ Optional vectorstore setup
     if all_text:
@@ -7067,7 +7086,7 @@ Hiring Manager, {company}, {location}
 """
 
         # ✅ Call LLM
-        cover_letter = call_llm(prompt, session=st.session_state).strip()
+        cover_letter = call_llm(prompt, session=st.session_state, family="cover_letter").strip()
 
         # ✅ Store plain text
         st.session_state["cover_letter"] = cover_letter
@@ -7940,7 +7959,7 @@ with tab2:
 
 
             with st.spinner("🧠 Thinking..."):
-                ai_output = call_llm(enhance_prompt, session=st.session_state)
+                ai_output = call_llm(enhance_prompt, session=st.session_state, family="resume_enhance")
                 st.session_state["ai_output"] = ai_output
 
     # ------------------------- PARSE + RENDER -------------------------
@@ -10811,66 +10830,59 @@ with tab3:
             <p>Salary Range: <span style="color:#34d399; font-weight:700;">{role['range']}</span></p>
         </div>
         """, unsafe_allow_html=True)
+QUICK_EVAL_TEMPLATE = register_template("interview_eval_quick", family="interview_eval", system="""
+You are an expert technical interview evaluator.
+
+### Task:
+Evaluate the candidate's answer to the question given by the user.
+Be STRICT. Only give high scores if the answer is technically correct, relevant, and detailed.
+
+### Strict Scoring Rubric:
+- 5 = Exceptional: Fully correct, highly relevant, clear, detailed, technically accurate.
+- 4 = Good: Mostly correct and relevant, but missing some depth/clarity.
+- 3 = Average: Partially correct OR generic, but somewhat relevant.
+- 2 = Weak: Mostly irrelevant, shallow, or major gaps in correctness.
+- 1 = Poor: Completely irrelevant, incoherent, or very wrong.
+- 0 = No answer / total nonsense.
+
+### Output:
+Give the score (0–5) and constructive feedback in 1–2 sentences.
+""", user="""
+### Question:
+{question}
+
+### Candidate Answer:
+{answer}
+""")
+
+class QuickEvaluation(BaseModel):
+    score: int = Field(description="Strict score between 0 and 5")
+    feedback: str = Field(description="Constructive feedback in 1-2 sentences")
+
 def evaluate_interview_answer(answer: str, question: str = None):
     """
     Uses an LLM to strictly evaluate an interview answer.
     Returns (score out of 5, feedback string).
     """
-    from llm_manager import call_llm
-    import re
     import streamlit as st
 
     # Empty check
     if not answer.strip():
         return 0, "⚠️ No answer provided."
 
-    # 🔹 LLM Prompt (STRICTER)
-    prompt = f"""
-    You are an expert technical interview evaluator.
-
-    ### Task:
-    Evaluate the candidate's answer to the question below.
-    Be STRICT. Only give high scores if the answer is technically correct, relevant, and detailed.
-
-    ### Question:
-    {question if question else "N/A"}
-
-    ### Candidate Answer:
-    {answer}
-
-    ### Strict Scoring Rubric:
-    - 5 = Exceptional: Fully correct, highly relevant, clear, detailed, technically accurate.
-    - 4 = Good: Mostly correct and relevant, but missing some depth/clarity.
-    - 3 = Average: Partially correct OR generic, but somewhat relevant.
-    - 2 = Weak: Mostly irrelevant, shallow, or major gaps in correctness.
-    - 1 = Poor: Completely irrelevant, incoherent, or very wrong.
-    - 0 = No answer / total nonsense.
-
-    ### Output Format:
-    Score: <number between 0 and 5>
-    Feedback: <constructive feedback in 1–2 sentences>
-    """
+    # 🔹 LLM Prompt (STRICTER): static rubric + this question/answer
+    prompt = QUICK_EVAL_TEMPLATE.render(question=question if question else "N/A", answer=answer)
 
     try:
-        # Call LLM
-        response = call_llm(prompt, session=st.session_state).strip()
-
-        # Extract Score
-        score_match = re.search(r"Score:\s*(\d+)", response)
-        score = int(score_match.group(1)) if score_match else 1  # stricter fallback
-
-        # Extract Feedback
-        feedback_match = re.search(r"Feedback:\s*(.+)", response)
-        feedback = feedback_match.group(1).strip() if feedback_match else "Answer was unclear or irrelevant."
-
-        # ✅ Keep score in 0–5 range
-        score = max(0, min(score, 5))
-
+        result = call_llm_structured(prompt, QuickEvaluation, session=st.session_state,
+                                     family="interview_eval")
     except Exception as e:
-        score = 1
-        feedback = f"⚠️ Evaluation fallback due to error: {e}"
+        return 1, f"⚠️ Evaluation fallback due to error: {e}"
+    if result is None:
+        return 1, "Answer was unclear or irrelevant."  # stricter fallback
 
-    return score, feedback
+    # ✅ Keep score in 0–5 range
+    return max(0, min(result.score, 5)), result.feedback.strip()
 
 
 def format_score(score) -> str:
@@ -10892,6 +10904,82 @@ def format_score(score) -> str:
         return "N/A"
 
 
+def _interview_eval_instructions(difficulty, guidance, **_):
+    """Static evaluation instructions for one difficulty tier"""
+    return f"""You are an expert technical interviewer evaluating a candidate's answer.
+The role context, question, answer and difficulty level are given by the user.
+
+EVALUATION APPROACH — {difficulty.upper()} MODE ({guidance['tone']}):
+What to expect: {guidance['expectations']}
+Scoring guide: {guidance['scoring']}
+Feedback style: {guidance['feedback_style']}
+Expected answer scope: {guidance['answer_scope']}
+
+STEP-BY-STEP EVALUATION PROCESS:
+
+STEP 1 — IDENTIFY THE QUESTION'S CORE CHALLENGE:
+State in one sentence what this question is actually testing (concept recall / scenario reasoning / focused technical analysis).
+List 3-5 key concepts or reasoning moves a strong answer must include.
+
+STEP 2 — ANALYSE THE CANDIDATE'S ANSWER:
+✅ WHAT THEY GOT RIGHT: Which key concepts did they cover? What reasoning was correct or well-expressed?
+⚠️ WHAT IS MISSING OR WEAK: Which expected concepts or reasoning steps are absent, shallow, or wrong?
+🔴 SCOPE CHECK: Did the answer stay within the question's scope, or did it over-engineer / under-explain?
+
+STEP 3 — SCORE ON 3 DIMENSIONS (1-10 each):
+- Knowledge: Correctness and depth of technical content for THIS difficulty tier.
+- Communication: Clarity, logical structure, and how easy it is to follow the reasoning.
+- Relevance: How directly the answer addresses the specific question asked — not adjacent topics.
+
+STEP 4 — WRITE FEEDBACK ({guidance['answer_scope']} equivalent):
+Write {{"Easy": "2-3", "Medium": "3-4", "Hard": "4-5"}}.get(difficulty, "3-4") flowing paragraphs that:
+1. Start with what the candidate did well (be specific — quote or paraphrase their answer)
+2. Identify the ONE or TWO most important gaps for this difficulty level
+3. Give a concrete, actionable suggestion — what would a stronger answer have included?
+4. For Hard: note whether the answer stayed text-answerable and focused, or drifted into vague system design
+
+Do NOT write bullet points. Write as a knowledgeable interviewer giving verbal feedback.
+
+{"STEP 5 — FOLLOW-UP: Generate ONE tightly scoped follow-up question. It must: (a) directly reference something in their answer, (b) probe ONE specific gap identified above, (c) be answerable in 4-6 paragraphs of text — not a whiteboard exercise. Choose from: Metric Justification, Tradeoff Challenge, Edge Case Scenario, Failure Handling, Constraint Injection, or Depth Probe." if difficulty == "Hard" else ""}
+
+OUTPUT FORMAT (strict JSON):
+{{
+  "key_concepts": ["concept1", "concept2", "concept3"],
+  "strengths": ["strength1", "strength2"],
+  "gaps": ["gap1", "gap2"],
+  "knowledge": <number 1-10>,
+  "communication": <number 1-10>,
+  "relevance": <number 1-10>,
+  "feedback": "Detailed, comprehensive feedback in 2-4 flowing paragraphs. Be specific about what the candidate did well, what they missed, and how they can improve. Reference actual content from their answer. Make it constructive, actionable, and personalized."{',\n  "followup": "One probing follow-up question"' if difficulty == "Hard" else ''}
+}}
+
+IMPORTANT RULES:
+- If answer is off-topic or from wrong domain, set relevance to 0-2
+- If answer is junk/minimal, set all scores to 0-2
+- Feedback must be specific to THIS answer, not generic templates
+- Reference actual content from the candidate's answer in feedback
+- Each feedback point should feel personalized and human
+
+Provide ONLY the JSON output, no additional text."""
+
+class InterviewEvaluation(BaseModel):
+    key_concepts: list[str] = Field(default_factory=list)
+    strengths: list[str] = Field(default_factory=list)
+    gaps: list[str] = Field(default_factory=list)
+    knowledge: int = Field(description="Score 1-10")
+    communication: int = Field(description="Score 1-10")
+    relevance: int = Field(description="Score 1-10")
+    feedback: str | list[str] = Field(description="Detailed feedback in flowing paragraphs")
+    followup: str = Field(default="", description="Follow-up question (Hard difficulty only)")
+
+INTERVIEW_EVAL_TEMPLATE = register_template(
+    "interview_eval", system=_interview_eval_instructions, user="""
+{context_line}QUESTION: {question}
+CANDIDATE'S ANSWER: {answer}
+DIFFICULTY LEVEL: {difficulty}
+""")
+
+
 def evaluate_interview_answer_for_scores(answer: str, question: str, difficulty: str, role: str = "", domain: str = ""):
     """
     UPGRADED: Intelligent evaluation with chain-of-thought reasoning and structured feedback.
@@ -10905,8 +10993,6 @@ def evaluate_interview_answer_for_scores(answer: str, question: str, difficulty:
     - Difficulty calibration: Easy (encouraging), Medium (balanced), Hard (strict)
     - JSON-based parsing for reliability
     """
-    from llm_manager import call_llm
-    import json
     import streamlit as st
 
     # Empty check or junk answers
@@ -11008,97 +11094,31 @@ def evaluate_interview_answer_for_scores(answer: str, question: str, difficulty:
     guidance = difficulty_guidance.get(difficulty, difficulty_guidance["Medium"])
 
     # Build context for relevance checking
-    context_info = f" for {role} in {domain}" if role and domain else ""
-
-    # UPGRADED CHAIN-OF-THOUGHT EVALUATION PROMPT
-    prompt = f"""You are an expert technical interviewer evaluating a candidate's answer{context_info}.
-
-QUESTION: {question}
-CANDIDATE'S ANSWER: {answer}
-DIFFICULTY LEVEL: {difficulty}
-
-EVALUATION APPROACH — {difficulty.upper()} MODE ({guidance['tone']}):
-What to expect: {guidance['expectations']}
-Scoring guide: {guidance['scoring']}
-Feedback style: {guidance['feedback_style']}
-Expected answer scope: {guidance['answer_scope']}
-
-STEP-BY-STEP EVALUATION PROCESS:
-
-STEP 1 — IDENTIFY THE QUESTION'S CORE CHALLENGE:
-State in one sentence what this question is actually testing (concept recall / scenario reasoning / focused technical analysis).
-List 3-5 key concepts or reasoning moves a strong answer must include.
-
-STEP 2 — ANALYSE THE CANDIDATE'S ANSWER:
-✅ WHAT THEY GOT RIGHT: Which key concepts did they cover? What reasoning was correct or well-expressed?
-⚠️ WHAT IS MISSING OR WEAK: Which expected concepts or reasoning steps are absent, shallow, or wrong?
-🔴 SCOPE CHECK: Did the answer stay within the question's scope, or did it over-engineer / under-explain?
-
-STEP 3 — SCORE ON 3 DIMENSIONS (1-10 each):
-- Knowledge: Correctness and depth of technical content for THIS difficulty tier.
-- Communication: Clarity, logical structure, and how easy it is to follow the reasoning.
-- Relevance: How directly the answer addresses the specific question asked — not adjacent topics.
-
-STEP 4 — WRITE FEEDBACK ({guidance['answer_scope']} equivalent):
-Write {{"Easy": "2-3", "Medium": "3-4", "Hard": "4-5"}}.get(difficulty, "3-4") flowing paragraphs that:
-1. Start with what the candidate did well (be specific — quote or paraphrase their answer)
-2. Identify the ONE or TWO most important gaps for this difficulty level
-3. Give a concrete, actionable suggestion — what would a stronger answer have included?
-4. For Hard: note whether the answer stayed text-answerable and focused, or drifted into vague system design
-
-Do NOT write bullet points. Write as a knowledgeable interviewer giving verbal feedback.
-
-{"STEP 5 — FOLLOW-UP: Generate ONE tightly scoped follow-up question. It must: (a) directly reference something in their answer, (b) probe ONE specific gap identified above, (c) be answerable in 4-6 paragraphs of text — not a whiteboard exercise. Choose from: Metric Justification, Tradeoff Challenge, Edge Case Scenario, Failure Handling, Constraint Injection, or Depth Probe." if difficulty == "Hard" else ""}
-
-OUTPUT FORMAT (strict JSON):
-{{
-  "key_concepts": ["concept1", "concept2", "concept3"],
-  "strengths": ["strength1", "strength2"],
-  "gaps": ["gap1", "gap2"],
-  "knowledge": <number 1-10>,
-  "communication": <number 1-10>,
-  "relevance": <number 1-10>,
-  "feedback": "Detailed, comprehensive feedback in 2-4 flowing paragraphs. Be specific about what the candidate did well, what they missed, and how they can improve. Reference actual content from their answer. Make it constructive, actionable, and personalized."{',\n  "followup": "One probing follow-up question"' if difficulty == "Hard" else ''}
-}}
-
-IMPORTANT RULES:
-- If answer is off-topic or from wrong domain, set relevance to 0-2
-- If answer is junk/minimal, set all scores to 0-2
-- Feedback must be specific to THIS answer, not generic templates
-- Reference actual content from the candidate's answer in feedback
-- Each feedback point should feel personalized and human
-
-Provide ONLY the JSON output, no additional text."""
+    context_line = f"ROLE: {role} in {domain}\n" if role and domain else ""
+
+    # UPGRADED CHAIN-OF-THOUGHT EVALUATION PROMPT (static per difficulty + this answer)
+    prompt = INTERVIEW_EVAL_TEMPLATE.render(
+        difficulty=difficulty,
+        guidance=guidance,
+        context_line=context_line,
+        question=question,
+        answer=answer,
+    )
 
     try:
-        response = call_llm(prompt, session=st.session_state).strip()
-
-        # Clean response - remove markdown code blocks if present
-        if response.startswith("```"):
-            response = response.split("```")[1]
-            if response.startswith("json"):
-                response = response[4:]
-            response = response.strip()
-
-        # Parse JSON response
-        result = json.loads(response)
-
-        # Extract and validate scores
-        knowledge = int(result.get("knowledge", 1))
-        communication = int(result.get("communication", 1))
-        relevance = int(result.get("relevance", 1))
+        result = call_llm_structured(prompt, InterviewEvaluation, session=st.session_state,
+                                     family="interview_eval")
+    except Exception:
+        result = None
 
+    if result is not None:
         # Clamp scores to 0-10 range
-        knowledge = max(0, min(10, knowledge))
-        communication = max(0, min(10, communication))
-        relevance = max(0, min(10, relevance))
+        knowledge = max(0, min(10, result.knowledge))
+        communication = max(0, min(10, result.communication))
+        relevance = max(0, min(10, result.relevance))
 
-        # Extract feedback (should be a detailed string, not a list)
-        feedback = result.get("feedback", "")
-
-        # If feedback comes as a list (fallback), join it into paragraphs
-        if isinstance(feedback, list):
-            feedback = "\n\n".join(feedback)
+        # Feedback should be a detailed string; join paragraphs if it came as a list
+        feedback = result.feedback if isinstance(result.feedback, str) else "\n\n".join(result.feedback[:5])
 
         # Ensure we have substantial feedback
         if not feedback or len(feedback.strip()) < 50:
@@ -11132,75 +11152,14 @@ Provide ONLY the JSON output, no additional text."""
             relevance = max(0, min(relevance, relevance - 1))
         # ─────────────────────────────────────────────────────────────────────────
 
-        # Extract follow-up question
-        followup = result.get("followup", "") if difficulty == "Hard" else ""
-
         return {
             "knowledge": knowledge,
             "communication": communication,
             "relevance": relevance,
             "feedback": feedback,  # Now a string, not a list
-            "followup": followup
+            "followup": result.followup if difficulty == "Hard" else ""
         }
 
-    except json.JSONDecodeError as e:
-        # Fallback: try to extract scores from non-JSON response
-        import re
-        try:
-            knowledge = int(re.search(r'"?knowledge"?\s*:\s*(\d+)', response, re.IGNORECASE).group(1))
-            communication = int(re.search(r'"?communication"?\s*:\s*(\d+)', response, re.IGNORECASE).group(1))
-            relevance = int(re.search(r'"?relevance"?\s*:\s*(\d+)', response, re.IGNORECASE).group(1))
-
-            # Extract feedback (try both string and array format)
-            feedback_match = re.search(r'"feedback"\s*:\s*"([^"]+)"', response, re.DOTALL)
-            if feedback_match:
-                feedback = feedback_match.group(1)
-            else:
-                # Fallback: try array format and join
-                feedback_array_match = re.search(r'"feedback"\s*:\s*\[(.*?)\]', response, re.DOTALL)
-                if feedback_array_match:
-                    feedback_text = feedback_array_match.group(1)
-                    feedback_items = [f.strip(' "\'') for f in re.findall(r'"([^"]+)"', feedback_text)]
-                    feedback = "\n\n".join(feedback_items) if feedback_items else "Answer evaluated but formatting unclear. Provide more structured responses with clear examples and explanations."
-                else:
-                    feedback = "Answer evaluated but formatting unclear. Provide more structured responses with clear examples and explanations."
-
-            # Apply same post-processing calibration to fallback path
-            knowledge = max(0, min(10, knowledge))
-            communication = max(0, min(10, communication))
-            relevance = max(0, min(10, relevance))
-
-            key_terms_fb = [kw.lower() for kw in question.split() if len(kw) > 3]
-            match_count_fb = sum(1 for t in key_terms_fb if t in answer.lower())
-            if key_terms_fb and match_count_fb < max(2, len(key_terms_fb) // 10):
-                knowledge = min(knowledge, 3)
-                relevance = min(relevance, 3)
-            if "off-topic" in feedback.lower() if isinstance(feedback, str) else False or relevance < 4:
-                knowledge = min(knowledge, 4)
-                relevance = min(relevance, 4)
-            raw_avg_fb = (knowledge + communication + relevance) / 3
-            if relevance <= 2 and raw_avg_fb > 4.0:
-                knowledge = min(knowledge, 2)
-                communication = min(communication, 2)
-                relevance = min(relevance, 2)
-            elif relevance < 4 and raw_avg_fb > 5.0:
-                excess_fb = raw_avg_fb - 5.0
-                knowledge = max(0, min(knowledge, knowledge - int(excess_fb * 1.5 + 0.5)))
-                relevance = max(0, min(relevance, relevance - 1))
-
-            return {
-                "knowledge": knowledge,
-                "communication": communication,
-                "relevance": relevance,
-                "feedback": feedback if isinstance(feedback, str) else "\n\n".join(feedback[:5]),
-                "followup": ""
-            }
-        except:
-            pass
-
-    except Exception as e:
-        pass
-
     # Final fallback based on difficulty
     fallback_scores = {"Easy": 3, "Medium": 2, "Hard": 1}
     fallback_score = fallback_scores.get(difficulty, 2)
@@ -13507,7 +13466,7 @@ Output ONLY the follow-up question. No numbering, labels, or explanations.
 Follow-up question:"""
 
     try:
-        return call_llm(prompt, session=st.session_state).strip()
+        return call_llm(prompt, session=st.session_state, family="followup").strip()
     except Exception:
         first_words = " ".join(answer.split()[:6]) if answer and answer.split() else "your described approach"
         return f'You mentioned "{first_words}..." — what is the ONE failure mode in that approach you would be most concerned about, and how would you detect it before it caused user impact?'
@@ -13517,6 +13476,54 @@ Follow-up question:"""
 # DOMAIN-AWARE QUESTION GENERATORS (upgraded wrappers)
 # =============================================================================
 
+# Question-generation prompts: the domain authority, difficulty contract and rules are
+# fixed for an interview session, so they form the static prefix.
+RESUME_QUESTIONS_TEMPLATE = register_template("question_gen_resume", family="question_gen", system="""You are a senior technical interviewer.
+
+{interview_type_block}
+
+{domain_block}
+
+{difficulty_block}
+
+Each question you generate MUST:
+1. Be about {domain} — not the candidate's previous domain if it differs
+2. Reference their resume only if resume content is relevant to {domain}
+3. Match the difficulty type specified above (structural enforcement, not just tone)
+4. Be a single, clear question (1-2 sentences)
+5. Reflect the interview type above — technical questions probe implementation/tradeoffs; behavioral questions probe experience/judgment
+
+Output ONLY the questions, one per line, no numbering or prefixes.""", user="""RESUME CONTEXT (filtered for domain relevance):
+- Skills: {skills}
+- Projects: {projects}
+- Experience: {experience}
+- Technologies: {technologies}
+
+{bias_instruction}
+
+Generate EXACTLY {num_questions} interview questions.
+
+{variation_hint}
+
+Questions:""")
+
+DOMAIN_QUESTIONS_TEMPLATE = register_template("question_gen_domain", family="question_gen", system="""You are an expert interviewer at a top-tier tech company.
+
+{domain_block}
+
+{difficulty_block}
+
+RULES:
+- Every question MUST be about {domain} — no exceptions
+- Match the exact difficulty type defined above (not just tone)
+- Avoid duplicates and generic filler questions
+- Keep each question concise: 1-2 sentences maximum
+- Output ONLY the questions, one per line
+- NO numbering, bullets, prefixes, or explanatory text""", user="""Generate EXACTLY {num_questions} unique {interview_type} interview questions for a {role} candidate.
+
+Generate {num_questions} questions now:""")
+
+
 def generate_resume_based_questions_domain_aware(
     resume_context: dict, role: str, domain: str,
     difficulty: str, num_questions: int = 3, weakness_bias: str = "balanced",
@@ -13569,37 +13576,22 @@ def generate_resume_based_questions_domain_aware(
     }
     bias_instruction = bias_map.get(weakness_bias, "")
 
-    prompt = f"""You are a senior technical interviewer.
-
-{interview_type_block}
-
-{domain_block}
-
-{difficulty_block}
-
-RESUME CONTEXT (filtered for domain relevance):
-- Skills: {', '.join(skills[:5]) if skills else 'None relevant to ' + domain}
-- Projects: {', '.join(projects[:3]) if projects else 'None specified'}
-- Experience: {', '.join(experience[:3]) if experience else 'None specified'}
-- Technologies: {', '.join(technologies[:5]) if technologies else 'None relevant to ' + domain}
-
-{bias_instruction}
-
-Generate EXACTLY {num_questions} interview questions. Each question MUST:
-1. Be about {domain} — not the candidate's previous domain if it differs
-2. Reference their resume only if resume content is relevant to {domain}
-3. Match the difficulty type specified above (structural enforcement, not just tone)
-4. Be a single, clear question (1-2 sentences)
-5. Reflect the interview type above — technical questions probe implementation/tradeoffs; behavioral questions probe experience/judgment
-
-Output ONLY the questions, one per line, no numbering or prefixes.
-
-{variation_hint}
-
-Questions:"""
+    prompt = RESUME_QUESTIONS_TEMPLATE.render(
+        interview_type_block=interview_type_block,
+        domain_block=domain_block,
+        difficulty_block=difficulty_block,
+        domain=domain,
+        skills=', '.join(skills[:5]) if skills else 'None relevant to ' + domain,
+        projects=', '.join(projects[:3]) if projects else 'None specified',
+        experience=', '.join(experience[:3]) if experience else 'None specified',
+        technologies=', '.join(technologies[:5]) if technologies else 'None relevant to ' + domain,
+        bias_instruction=bias_instruction,
+        num_questions=num_questions,
+        variation_hint=variation_hint,
+    )
 
     try:
-        response = call_llm(prompt, session=st.session_state)
+        response = call_llm(prompt, session=st.session_state, family="question_gen")
         raw = [q.strip() for q in response.split("\n") if q.strip()]
         cleaned = []
         for q in raw:
@@ -13641,26 +13633,17 @@ def generate_domain_questions_with_llm(
     domain_block = build_domain_authority_block(domain, role)
     difficulty_block = get_difficulty_instruction_block(difficulty)
 
-    prompt = f"""You are an expert interviewer at a top-tier tech company.
-
-{domain_block}
-
-{difficulty_block}
-
-Generate EXACTLY {num_questions} unique {interview_type} interview questions for a {role} candidate.
-
-RULES:
-- Every question MUST be about {domain} — no exceptions
-- Match the exact difficulty type defined above (not just tone)
-- Avoid duplicates and generic filler questions
-- Keep each question concise: 1-2 sentences maximum
-- Output ONLY the questions, one per line
-- NO numbering, bullets, prefixes, or explanatory text
-
-Generate {num_questions} questions now:"""
+    prompt = DOMAIN_QUESTIONS_TEMPLATE.render(
+        domain_block=domain_block,
+        difficulty_block=difficulty_block,
+        domain=domain,
+        role=role,
+        interview_type=interview_type,
+        num_questions=num_questions,
+    )
 
     try:
-        response = call_llm(prompt, session=st.session_state)
+        response = call_llm(prompt, session=st.session_state, family="question_gen")
         raw = [q.strip() for q in response.split('\n') if q.strip()]
         cleaned = []
         for q in raw:
@@ -13810,7 +13793,7 @@ JSON:
 """
 
     try:
-        response = call_llm(prompt, session=st.session_state).strip()
+        response = call_llm(prompt, session=st.session_state, family="resume_analysis").strip()
 
         # Clean markdown if present
         if response.startswith("```"):
@@ -13881,7 +13864,7 @@ Generate now:
 """
 
     try:
-        response = call_llm(prompt, session=st.session_state)
+        response = call_llm(prompt, session=st.session_state, family="question_gen")
         raw_questions = [q.strip() for q in response.split("\n") if q.strip()]
 
         cleaned_questions = []
@@ -14127,7 +14110,7 @@ QUESTION FOCUS RULES:
 Generate {num_questions} questions:"""
 
     try:
-        response = call_llm(prompt, session=st.session_state)
+        response = call_llm(prompt, session=st.session_state, family="question_gen")
         raw = [q.strip() for q in response.split("\n") if q.strip()]
         cleaned = []
         for q in raw:
@@ -15164,7 +15147,7 @@ Generate {num_questions} questions now:
 """
 
         try:
-            response = call_llm(prompt, session=st.session_state)
+            response = call_llm(prompt, session=st.session_state, family="question_gen")
 
             # Split by newlines and clean up
             raw_questions = [q.strip() for q in response.split('\n') if q.strip()]
@@ -18471,6 +18454,76 @@ if tab5:
 			except Exception as e:
 				st.error(f"Error loading performance deep dive: {e}")
 
+		with st.expander("🤖 LLM Performance", expanded=False):
+			try:
+				metrics = get_llm_metrics(hours=24)
+				if metrics:
+					df_llm = pd.DataFrame(metrics)
+					total_calls = len(df_llm)
+					cache_rate = (df_llm["cache"] != "miss").mean() * 100
+					tokens_used = int(df_llm["prompt_tokens"].fillna(0).sum() + df_llm["completion_tokens"].fillna(0).sum())
+
+					col1, col2, col3, col4 = st.columns(4)
+					col1.metric("Calls (24h)", total_calls)
+					col2.metric("Cache Hit Rate", f"{cache_rate:.1f}%")
+					col3.metric("Error Rate", f"{(1 - df_llm['ok'].mean()) * 100:.1f}%")
+					col4.metric("Tokens Used", f"{tokens_used:,}")
+
+					# Latency percentiles per prompt family (upstream calls only)
+					upstream = df_llm[df_llm["cache"] == "miss"]
+					if not upstream.empty:
+						latency = upstream.groupby("family")["latency_ms"].quantile([0.5, 0.95, 0.99]).unstack()
+						latency.columns = ["p50", "p95", "p99"]
+						latency_long = latency.reset_index().melt(id_vars="family", var_name="percentile", value_name="latency_ms")
+						fig = px.bar(latency_long, x="family", y="latency_ms", color="percentile",
+									 barmode="group", title="LLM Latency by Prompt Family (ms)")
+						fig.update_layout(height=400)
+						st.plotly_chart(fig, use_container_width=True)
+
+					# Per-family breakdown
+					summary = df_llm.groupby("family").agg(
+						calls=("ok", "size"),
+						cache_hit_rate=("cache", lambda c: (c != "miss").mean() * 100),
+						avg_latency_ms=("latency_ms", "mean"),
+						prompt_tokens=("prompt_tokens", "sum"),
+						cached_prompt_tokens=("cached_tokens", "sum"),
+						completion_tokens=("completion_tokens", "sum"),
+						retries=("retries", "sum"),
+						errors=("ok", lambda ok: int((ok == 0).sum())),
+					).sort_values("calls", ascending=False)
+					st.dataframe(summary.style.format({
+						"cache_hit_rate": "{:.1f}%",
+						"avg_latency_ms": "{:.0f}",
+						"prompt_tokens": "{:,.0f}",
+						"cached_prompt_tokens": "{:,.0f}",
+						"completion_tokens": "{:,.0f}",
+					}), use_container_width=True)
+				else:
+					st.info("ℹ️ No LLM calls recorded in the last 24 hours.")
+
+				# Daily quota and circuit-breaker state per admin key
+				key_usage = get_key_usage()
+				if key_usage:
+					st.markdown("#### Groq Key Usage (today, UTC)")
+					df_keys = pd.DataFrame(key_usage).set_index("key")
+					df_keys["quota_used"] = df_keys["used_today"] / df_keys["daily_limit"] * 100
+					st.dataframe(df_keys.style.format({"quota_used": "{:.1f}%"}), use_container_width=True)
+
+				# Static prefix vs per-call content of the registered prompt templates
+				template_stats = get_template_stats()
+				if template_stats:
+					st.markdown("#### Prompt Templates (since restart)")
+					st.dataframe(pd.DataFrame(template_stats).set_index("template"), use_container_width=True)
+
+				cache_stats = get_cache_stats()
+				st.caption(
+					f"Response cache since restart: {cache_stats['memory_entries']} in memory · "
+					f"memory hits {cache_stats['memory_hits']} · SQLite hits {cache_stats['sqlite_hits']} · "
+					f"misses {cache_stats['misses']} · hit rate {cache_stats['hit_rate'] * 100:.1f}%"
+				)
+			except Exception as e:
+				st.error(f"Error loading LLM performance metrics: {e}")
+
 		# Footer with system information
 		st.markdown("<hr style='border-top: 1px solid #ddd; margin: 2rem 0;'>", unsafe_allow_html=True)
 		st.markdown("""
@@ -0,0 +1,105 @@
+"""Prompt templates: a static system prefix plus per-call dynamic content.
+
+The long instruction blocks (rubrics, output formats, difficulty contracts) change
+only with settings such as the sidebar weights or the interview difficulty, while
+the resume / answer text changes on every call. Rendering them as separate system
+and human messages keeps the prefix byte-identical between calls, so providers that
+cache prompt prefixes (Groq does this automatically on supported models) can skip
+re-reading it, and lets the prefix be compacted once instead of per call.
+
+call_llm accepts the rendered [(role, content), ...] list directly.
+"""
+
+import re
+import threading
+from functools import lru_cache
+
+_RULE_LINE = re.compile(r"^[ \t]*([═━─=~*_-])\1{7,}[ \t]*\n?", re.MULTILINE)
+_TRAILING_SPACE = re.compile(r"[ \t]+$", re.MULTILINE)
+_BLANK_RUN = re.compile(r"\n{3,}")
+
+
+def count_tokens(text):
+    """Approximate token count (~4 characters per token, as in llm_manager's rate estimates)"""
+    return (len(text) + 3) // 4
+
+
+@lru_cache(maxsize=256)
+def compact_prompt(text):
+    """Drop decorative rule lines, trailing spaces and repeated blank lines"""
+    text = _RULE_LINE.sub("", text)
+    text = _TRAILING_SPACE.sub("", text)
+    return _BLANK_RUN.sub("\n\n", text).strip()
+
+
+class PromptTemplate:
+    """A named prompt split into a static system prefix and a dynamic user part
+
+    `system` and `user` are str.format templates or callables taking the render
+    fields as keyword arguments (callables should accept **_ for fields they ignore).
+    """
+
+    def __init__(self, name, system, user, family=None):
+        self.name = name
+        self.system = system
+        self.user = user
+        self.family = family or name
+        self.calls = 0
+        self.raw_prefix_tokens = 0
+        self.prefix_tokens = 0
+        self.dynamic_tokens = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fill(part, fields):
+        return part(**fields) if callable(part) else part.format(**fields)
+
+    def render(self, **fields):
+        """Return [("system", prefix), ("human", content)] for call_llm"""
+        raw_prefix = self._fill(self.system, fields)
+        prefix = compact_prompt(raw_prefix)
+        content = self._fill(self.user, fields).strip()
+        with self._lock:
+            self.calls += 1
+            self.raw_prefix_tokens = count_tokens(raw_prefix)
+            self.prefix_tokens = count_tokens(prefix)
+            self.dynamic_tokens += count_tokens(content)
+        return [("system", prefix), ("human", content)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "template": self.name,
+                "family": self.family,
+                "calls": self.calls,
+                "prefix_tokens": self.prefix_tokens,
+                "compaction_saved_tokens": self.raw_prefix_tokens - self.prefix_tokens,
+                "avg_dynamic_tokens": round(self.dynamic_tokens / self.calls) if self.calls else 0,
+            }
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def register_template(name, system, user, family=None):
+    """Register a template and return it; re-registering (Streamlit reruns) keeps its stats"""
+    with _templates_lock:
+        template = _templates.get(name)
+        if template is None:
+            template = _templates[name] = PromptTemplate(name, system, user, family)
+        else:
+            template.system, template.user = system, user
+            template.family = family or name
+        return template
+
+
+def get_template(name):
+    return _templates[name]
+
+
+def get_template_stats():
+    """Per-template call counts and static / dynamic token sizes (this process only)"""
+    with _templates_lock:
+        templates = list(_templates.values())
+    return [t.stats() for t in templates]
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# llm_manager opens its cache database at import: keep it out of the working tree
+# and make sure no test can reach Groq
+os.environ.setdefault("LLM_DB_FILE", os.path.join(tempfile.mkdtemp(prefix="llm-tests-"), "llm_data.sqlite"))
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("LLM_FAKE_LATENCY_MS", "0")
+
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_buckets(monkeypatch):
+    """Each test starts with full token buckets, however many calls earlier tests made"""
+    import llm_manager
+    monkeypatch.setattr(llm_manager, "_rate_buckets", {})
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    """Point llm_manager at an empty database, for tests that look at whole tables"""
+    import llm_manager
+    with llm_manager._conn_lock:
+        saved = llm_manager.DB_FILE, llm_manager._conn, llm_manager._read_local
+        llm_manager.DB_FILE = str(tmp_path / "llm_data.sqlite")
+        llm_manager._conn, llm_manager._read_local = None, threading.local()
+    llm_manager.init_db()
+    yield llm_manager.DB_FILE
+    with llm_manager._conn_lock:
+        llm_manager._conn.close()
+        llm_manager.DB_FILE, llm_manager._conn, llm_manager._read_local = saved
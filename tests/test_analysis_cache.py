@@ -0,0 +1,46 @@
+import pytest
+
+import llm_manager
+from llm_manager import analysis_cache_key
+
+
+PINNED_KEY = "9e5cf89b84cab942cf1bbc6a6319e3fe9a659d508f22005acff88605f7504ac2"
+
+SETTINGS = dict(version=1, job_title="Data Scientist", job_description="Python, SQL\nand ML.",
+                user_location="Pune", weights={"edu_weight": 20, "exp_weight": 35})
+
+
+def test_analysis_cache_key_is_stable():
+    key = analysis_cache_key(b"%PDF-1.4 resume", **SETTINGS)
+    assert key == analysis_cache_key(b"%PDF-1.4 resume", **dict(reversed(list(SETTINGS.items()))))
+    assert len(key) == 64 and int(key, 16) >= 0
+    # Pinned so that refactors cannot silently invalidate every stored analysis
+    assert key == PINNED_KEY
+
+
+def test_analysis_cache_key_ignores_whitespace_only_edits():
+    edited = dict(SETTINGS, job_title="  Data   Scientist ", job_description="Python,  SQL and\tML.  ")
+    assert analysis_cache_key(b"pdf", **edited) == analysis_cache_key(b"pdf", **SETTINGS)
+
+
+@pytest.mark.parametrize("change", [
+    {"version": 2},
+    {"job_title": "Data Engineer"},
+    {"job_description": "Python, SQL and DL."},
+    {"user_location": "Mumbai"},
+    {"weights": {"edu_weight": 25, "exp_weight": 30}},
+])
+def test_analysis_cache_key_changes_with_inputs(change):
+    assert analysis_cache_key(b"pdf", **dict(SETTINGS, **change)) != analysis_cache_key(b"pdf", **SETTINGS)
+
+
+def test_analysis_cache_key_changes_with_content():
+    assert analysis_cache_key(b"pdf-a", **SETTINGS) != analysis_cache_key(b"pdf-b", **SETTINGS)
+
+
+def test_analysis_cache_round_trip():
+    document = {"record": {"Resume Name": "a.pdf", "Bias Score (0 = Fair, 1 = Biased)": 0.35},
+                "full_text": "text " * 200}
+    llm_manager.set_cached_analysis("test-key", document)
+    assert llm_manager.get_cached_analysis("test-key") == document
+    assert llm_manager.get_cached_analysis("missing-key") is None
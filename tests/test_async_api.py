@@ -0,0 +1,59 @@
+import asyncio
+import uuid
+
+import pytest
+
+import llm_manager
+from llm_backends import FakeBackend, GENERIC_RESPONSE
+
+
+@pytest.fixture
+def slow_backend(monkeypatch):
+    monkeypatch.setattr(llm_manager, "_offline_backend", FakeBackend(latency_ms=20, sigma=0))
+    monkeypatch.setattr(llm_manager, "_llm_clients", {})
+
+
+def test_call_llm_many_bounds_concurrency_and_keeps_order(slow_backend, monkeypatch):
+    in_flight = peak = 0
+    original = llm_manager.try_call_llm_async
+
+    async def counting(*args):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await original(*args)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(llm_manager, "try_call_llm_async", counting)
+    run = uuid.uuid4().hex
+    prompts = [f"Say hello {run} {i}" for i in range(9)]
+    prompts[4] = f"Please classify the most relevant professional domain {run}"
+    responses = asyncio.run(llm_manager.call_llm_many(prompts, {}, max_concurrency=3))
+
+    assert peak == 3
+    assert responses[4] == "Software Engineering"
+    assert responses[:4] + responses[5:] == [GENERIC_RESPONSE] * 8
+
+
+def test_call_llm_async_shares_the_sync_cache(slow_backend):
+    prompt = f"Say hello {uuid.uuid4().hex}"
+    first = asyncio.run(llm_manager.call_llm_async(prompt, {}, model=llm_manager.DEFAULT_MODEL))
+    assert llm_manager.get_cached_response(prompt, llm_manager.DEFAULT_MODEL) == first
+    assert llm_manager.call_llm(prompt, {}, model=llm_manager.DEFAULT_MODEL) == first
+
+
+def test_async_http_client_is_closed_with_its_loop(monkeypatch):
+    httpx = pytest.importorskip("httpx")
+    monkeypatch.setattr(llm_manager, "LLM_BACKEND", "groq")
+
+    async def use_client():
+        llm = await llm_manager._get_async_llm_client("gsk-test", llm_manager.DEFAULT_MODEL, 0)
+        assert llm is await llm_manager._get_async_llm_client("gsk-test", llm_manager.DEFAULT_MODEL, 0)
+        return llm_manager._async_llm_clients[asyncio.get_running_loop()][0]
+
+    http_client = asyncio.run(use_client())
+    assert isinstance(http_client, httpx.AsyncClient)
+    assert http_client.is_closed
+    assert len(llm_manager._async_llm_clients) == 0
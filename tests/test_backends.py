@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from llm_backends import GENERIC_RESPONSE, FakeBackend, OfflineClient
+
+
+def backend(**kwargs):
+    return FakeBackend(latency_ms=kwargs.pop("latency_ms", 0), sigma=0, **kwargs)
+
+
+def test_structured_prompts_get_their_schema_template():
+    for title in ("AtsReport", "GrammarReport", "QuickEvaluation", "InterviewEvaluation"):
+        prompt = [("system", f'Respond with JSON ... {{"title":"{title}","type":"object"}}'), ("human", "x")]
+        response, _ = backend().respond(prompt, "model", "key")
+        assert isinstance(json.loads(response), dict), title
+    response, _ = backend().respond('{"title":"GrammarReport"}', "model", "key")
+    assert set(json.loads(response)) == {"score", "feedback", "suggestions"}
+
+
+def test_domain_and_generic_prompts():
+    response, _ = backend().respond("Please classify the most relevant professional domain", "m", "k")
+    assert response == "Software Engineering"
+    assert backend().respond("Say hello", "m", "k")[0] == GENERIC_RESPONSE
+
+
+def test_custom_templates_are_tried_first():
+    custom = backend(templates=[(r"classify", "Data Science")])
+    assert custom.respond("classify the most relevant professional domain", "m", "k")[0] == "Data Science"
+
+
+def test_latency_and_failures_are_seeded_by_prompt():
+    jittery = FakeBackend(latency_ms=800, sigma=0.5)
+    assert jittery.respond("same prompt", "m", "k") == jittery.respond("same prompt", "m", "k")
+    assert backend(latency_ms=250).respond("p", "m", "k")[1] == 0.25
+    with pytest.raises(RuntimeError, match="429"):
+        backend(error_rate=1.0).respond("p", "m", "k")
+
+
+def test_offline_client_invoke_and_stream():
+    client = OfflineClient(backend(), "key", "model-x")
+    message = client.invoke("Say hello", response_format={"type": "json_object"})
+    assert message.content == GENERIC_RESPONSE
+    assert message.response_metadata["model_name"] == "model-x"
+    assert message.response_metadata["token_usage"]["total_tokens"] > 0
+    assert "".join(chunk.content for chunk in client.stream("Say hello")) == GENERIC_RESPONSE
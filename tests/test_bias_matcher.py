@@ -0,0 +1,105 @@
+import random
+import re
+
+import pytest
+
+from bias_matcher import PhraseMatcher
+
+MASCULINE = ["leader", "lead", "self-reliant", "self-confident", "aggressive", "ambitious",
+             "competitive", "dominant", "decisive", "strong", "driven", "ninja", "rockstar",
+             "head", "headstrong", "hands-on", "take charge"]
+FEMININE = ["team player", "player", "supportive", "collaborative", "empathetic", "understanding",
+            "caring", "connect", "connect with", "nurture", "together", "togetherness", "share",
+            "sharing", "open-minded"]
+PHRASES = ([(w, "masculine") for w in sorted(MASCULINE, key=len, reverse=True)] +
+           [(w, "feminine") for w in sorted(FEMININE, key=len, reverse=True)])
+
+CORPUS = [
+    "A strong, self-reliant Leader who can take charge.",
+    "Team player with a caring, supportive and collaborative attitude.",
+    "Headstrong HEAD of engineering; hands-on and DRIVEN.",
+    "We connect with customers and share knowledge, sharing is caring.",
+    "Togetherness matters: together we lead, and the leader leads.",
+    "Self-Confident ninja/rockstar, open-minded and team-player friendly.",
+    "leadership, strongly, players, connected and headed are not whole words.",
+    "She led the team_player initiative and a lead_engineer role.",
+    "",
+    "   ",
+]
+
+
+def regex_matches(phrases, text):
+    """The pre-automaton implementation: one IGNORECASE regex per phrase, in rank order"""
+    accepted, spans = [], []
+    seen = set()
+    rank = 0
+    for phrase, _ in phrases:
+        if phrase.lower() in seen:
+            continue
+        seen.add(phrase.lower())
+        for match in re.finditer(rf"\b{re.escape(phrase)}\b", text, re.IGNORECASE):
+            start, end = match.span()
+            if not any(start < e and end > s for s, e in spans):
+                spans.append((start, end))
+                accepted.append((rank, start, end))
+        rank += 1
+    return accepted
+
+
+def random_corpus(n=500, seed=7):
+    rng = random.Random(seed)
+    words = MASCULINE + FEMININE + ["the", "a", "team", "of", "engineer", "x", "lead-", "_", "-"]
+    separators = [" ", "", ", ", ". ", "-", "\n", "  "]
+    for _ in range(n):
+        tokens = [rng.choice(words) for _ in range(rng.randint(0, 25))]
+        yield "".join(rng.choice(separators) + (t.upper() if rng.random() < 0.2 else t.title()
+                                                if rng.random() < 0.2 else t) for t in tokens)
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return PhraseMatcher(PHRASES)
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_matches_agree_with_regex_implementation(matcher, text):
+    assert matcher.matches(text) == regex_matches(PHRASES, text)
+    assert matcher.matches(text.lower()) == regex_matches(PHRASES, text.lower())
+
+
+def test_matches_agree_on_random_corpus(matcher):
+    for text in random_corpus():
+        assert matcher.matches(text) == regex_matches(PHRASES, text), text
+
+
+def test_overlapping_phrases_prefer_rank_order(matcher):
+    text = "team player and take charge leader"
+    found = [(matcher.phrases[rank][0], text[start:end]) for rank, start, end in matcher.matches(text)]
+    # "team player" outranks "player" (feminine list, longer first); "leader" outranks "lead"
+    assert ("team player", "team player") in found
+    assert all(phrase != "player" for phrase, _ in found)
+    assert ("leader", "leader") in found
+    assert all(phrase != "lead" for phrase, _ in found)
+
+
+def test_counts_and_spans_for_mixed_case(matcher):
+    text = "LEAD, Lead and lead. A Strong lead!"
+    counts = {}
+    for rank, start, end in matcher.matches(text):
+        phrase = matcher.phrases[rank][0]
+        counts[phrase] = counts.get(phrase, 0) + 1
+        assert text[start:end].lower() == phrase
+    assert counts == {"strong": 1, "lead": 4}
+
+
+def test_word_boundaries(matcher):
+    assert matcher.matches("leadership strongly players") == []
+    assert matcher.occurrences("lead_engineer") == []
+    spans = matcher.matches("co-lead")
+    assert [("lead", 3, 7)] == [(matcher.phrases[r][0], s, e) for r, s, e in spans]
+
+
+def test_duplicate_phrases_are_dropped():
+    matcher = PhraseMatcher([("Lead", "masculine"), ("lead", "feminine"), ("share", "feminine")])
+    assert matcher.phrases == [("Lead", "masculine"), ("share", "feminine")]
+    assert matcher.matches("lead and share") == [(0, 0, 4), (1, 9, 14)]
@@ -0,0 +1,84 @@
+import random
+import string
+import zlib
+
+import pytest
+
+import llm_manager
+from llm_manager import _compress_response, _decompress_response, DEFAULT_MODEL
+
+
+def text(n, seed):
+    rng = random.Random(seed)
+    return "".join(rng.choice(string.ascii_letters + " ") for _ in range(n))
+
+
+def test_short_responses_stay_plain_text():
+    assert _compress_response("Data Science") == "Data Science"
+    assert _decompress_response("Data Science") == "Data Science"
+
+
+def test_long_responses_are_compressed_and_tagged():
+    response = "Strong Python and SQL background. " * 40
+    stored = _compress_response(response)
+    assert isinstance(stored, bytes) and stored[:2] in (b"zs", b"zl")
+    assert len(stored) < len(response) / 4
+    assert _decompress_response(stored) == response
+    assert _decompress_response(memoryview(stored)) == response  # psycopg2 BYTEA
+
+
+def test_every_codec_tag_decodes():
+    assert _decompress_response(b"pt" + "plain é".encode("utf-8")) == "plain é"
+    assert _decompress_response(b"zl" + zlib.compress(b"zlib row")) == "zlib row"
+
+
+def cache_rows(conn):
+    return [row[0] for row in conn.execute("SELECT prompt_hash FROM llm_cache ORDER BY prompt_hash")]
+
+
+def fill(count, size=20000):
+    prompts = [f"prompt {i}" for i in range(count)]
+    for i, prompt in enumerate(prompts):
+        llm_manager.set_cached_response(prompt, DEFAULT_MODEL, text(size, i))
+    with llm_manager._db(write=True) as conn:
+        for i, prompt in enumerate(prompts):  # prompt 0 is the least recently used
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE prompt_hash = ?",
+                         (f"2026-01-01 00:00:{i:02d}", llm_manager.hash_prompt(prompt, DEFAULT_MODEL)))
+    with llm_manager._db() as conn:
+        size = conn.execute("SELECT MAX(size) FROM llm_cache").fetchone()[0]
+    return prompts, size
+
+
+def test_under_budget_evicts_nothing(fresh_db):
+    fill(3)
+    assert llm_manager.enforce_cache_size(max_mb=1) == 0
+
+
+def test_least_recently_used_rows_are_evicted_first(fresh_db):
+    prompts, size = fill(5)
+    assert llm_manager.enforce_cache_size(max_mb=3 * size / 1024 / 1024) == 2
+
+    kept = {llm_manager.hash_prompt(p, DEFAULT_MODEL) for p in prompts[2:]}
+    with llm_manager._db() as conn:
+        assert set(cache_rows(conn)) == kept
+    assert llm_manager.get_cached_response(prompts[0], DEFAULT_MODEL) is None  # memory tier dropped too
+
+
+def test_a_cache_hit_protects_its_row(fresh_db):
+    prompts, size = fill(5)
+    assert llm_manager.get_cached_response(prompts[0], DEFAULT_MODEL)
+    llm_manager.flush_cache_access_times()
+    llm_manager.enforce_cache_size(max_mb=3 * size / 1024 / 1024)
+
+    with llm_manager._db() as conn:
+        rows = set(cache_rows(conn))
+    assert llm_manager.hash_prompt(prompts[0], DEFAULT_MODEL) in rows
+    assert llm_manager.hash_prompt(prompts[1], DEFAULT_MODEL) not in rows
+
+
+def test_eviction_returns_pages_to_the_filesystem(fresh_db):
+    _, size = fill(6)
+    llm_manager.enforce_cache_size(max_mb=size / 1024 / 1024)
+    with llm_manager._db() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
@@ -0,0 +1,69 @@
+import itertools
+from contextlib import contextmanager, nullcontext
+
+import pytest
+
+for _dependency in ("psycopg2", "pandas", "pytz", "streamlit"):
+    pytest.importorskip(_dependency)
+
+import db_manager as dbm
+from db_manager import DatabaseManager
+
+
+def candidate(name, ats=80, bias=0.2):
+    return (name, name.split(".")[0].title(), ats, 70, 60, 75, 80, 65, bias)
+
+
+class FakeConnection:
+    def cursor(self):
+        return nullcontext(object())
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """A DatabaseManager whose statements go to an in-memory fake instead of Supabase"""
+    manager = DatabaseManager.__new__(DatabaseManager)  # skips schema setup
+    manager.batches = []
+    ids = itertools.count(1)
+
+    @contextmanager
+    def get_connection():
+        yield FakeConnection()
+
+    def execute_values(cur, sql, values, page_size=100, fetch=False):
+        manager.batches.append([v[0] for v in values])
+        if any(v[0] == "poison.pdf" for v in values):
+            raise RuntimeError("value too long for type character varying")
+        return [(next(ids),) for _ in values]
+
+    monkeypatch.setattr(manager, "get_connection", get_connection)
+    monkeypatch.setattr(manager, "detect_domain_from_title_and_description", lambda title, jd: "Data Science")
+    monkeypatch.setattr(dbm.psycopg2.extras, "execute_values", execute_values)
+    return manager
+
+
+def test_valid_rows_are_inserted_in_one_statement(manager):
+    ids, failures = manager.insert_candidates_batch([candidate("a.pdf"), candidate("b.pdf"), candidate("c.pdf")])
+    assert ids == [1, 2, 3] and failures == []
+    assert manager.batches == [["a.pdf", "b.pdf", "c.pdf"]]
+
+
+def test_invalid_rows_are_skipped_before_the_batch(manager):
+    rows = [candidate("a.pdf"), candidate("b.pdf", ats=150), candidate("c.pdf", bias=1.5)]
+    ids, failures = manager.insert_candidates_batch(rows)
+    assert ids == [1, None, None]
+    assert [name for name, _ in failures] == ["b.pdf", "c.pdf"]
+    assert manager.batches == [["a.pdf"]]
+
+
+def test_failed_batch_is_retried_row_by_row(manager):
+    rows = [candidate("a.pdf"), candidate("poison.pdf"), candidate("c.pdf")]
+    ids, failures = manager.insert_candidates_batch(rows)
+    assert manager.batches == [["a.pdf", "poison.pdf", "c.pdf"], ["a.pdf"], ["poison.pdf"], ["c.pdf"]]
+    assert ids == [1, None, 2]  # aligned with rows
+    assert failures == [("poison.pdf", "value too long for type character varying")]
+
+
+def test_empty_batch_touches_nothing(manager):
+    assert manager.insert_candidates_batch([]) == ([], [])
+    assert manager.batches == []
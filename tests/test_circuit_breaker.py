@@ -0,0 +1,101 @@
+import time
+import uuid
+
+import pytest
+
+import llm_manager
+from llm_backends import FakeBackend
+from llm_manager import _claim_key, _key_admits, clear_key_failure, mark_key_failure
+
+
+@pytest.fixture
+def key():
+    return f"gsk-{uuid.uuid4().hex}"
+
+
+def state(api_key):
+    with llm_manager._key_states_lock:
+        return llm_manager._key_state(api_key)
+
+
+def expire_cooldown(api_key):
+    state(api_key).cooldown_until = time.time() - 1
+
+
+def test_failure_opens_the_circuit_for_the_base_cooldown(key):
+    assert _key_admits(key)
+    mark_key_failure(key, "error")
+    assert not _key_admits(key)
+    assert state(key).cooldown_until - time.time() == pytest.approx(15, abs=1)
+
+
+def test_cooldown_doubles_per_consecutive_failure_up_to_the_cap(key):
+    for failures in (1, 2, 3):
+        expire_cooldown(key)
+        mark_key_failure(key, "quota")
+        assert state(key).failures == failures
+        assert state(key).cooldown_until - time.time() == pytest.approx(60 * 2 ** (failures - 1), abs=1)
+    assert llm_manager._cooldown_seconds("error", 50) == llm_manager.FAILURE_COOLDOWN_MINUTES * 60
+    assert llm_manager._cooldown_seconds("auth", 50) == llm_manager.AUTH_COOLDOWN_HOURS * 3600
+
+
+def test_failures_while_open_do_not_extend_the_backoff(key):
+    mark_key_failure(key, "error")
+    mark_key_failure(key, "error")  # a request that was already in flight
+    assert state(key).failures == 1
+
+
+def test_retry_after_sets_the_cooldown_exactly(key):
+    mark_key_failure(key, "quota", retry_after=7)
+    assert state(key).cooldown_until - time.time() == pytest.approx(7, abs=0.5)
+
+
+def test_half_open_admits_a_single_probe(key):
+    mark_key_failure(key, "error")
+    assert not _claim_key(key)
+    expire_cooldown(key)
+    assert _claim_key(key)
+    assert not _claim_key(key)  # probe in flight
+    state(key).probe_started -= llm_manager.CIRCUIT_PROBE_TIMEOUT_SECONDS
+    assert _claim_key(key)  # the stuck probe no longer holds the key
+
+
+def test_successful_probe_closes_the_circuit(key):
+    mark_key_failure(key, "error")
+    expire_cooldown(key)
+    assert _claim_key(key)
+    clear_key_failure(key)
+    assert state(key).reason is None and state(key).failures == 0
+    assert _key_admits(key)
+
+
+def test_failed_probe_reopens_for_longer(key):
+    mark_key_failure(key, "error")
+    expire_cooldown(key)
+    assert _claim_key(key)
+    mark_key_failure(key, "error")
+    assert state(key).failures == 2 and state(key).probe_started is None
+    assert state(key).cooldown_until - time.time() == pytest.approx(30, abs=1)
+
+
+def test_rejected_request_does_not_trip_the_key(key):
+    mark_key_failure(key, "error")
+    expire_cooldown(key)
+    assert _claim_key(key)
+    error = RuntimeError("context length exceeded")
+    error.status_code = 400
+    assert llm_manager._handle_key_error(key, error) is False  # stop rotating keys
+    assert state(key).failures == 1 and state(key).probe_started is None
+
+
+def test_upstream_429s_open_every_key_tried(monkeypatch):
+    keys = [f"gsk-{uuid.uuid4().hex}" for _ in range(2)]
+    monkeypatch.setattr(llm_manager, "_offline_backend", FakeBackend(latency_ms=0, sigma=0, error_rate=1.0))
+    monkeypatch.setattr(llm_manager, "_llm_clients", {})
+    monkeypatch.setattr(llm_manager, "_candidate_keys", lambda session: (list(keys), None))
+
+    response = llm_manager.call_llm(f"Say hello {uuid.uuid4().hex}", {}, model=llm_manager.DEFAULT_MODEL)
+
+    assert response.startswith("❌ LLM unavailable")
+    assert [state(k).reason for k in keys] == ["quota", "quota"]
+    assert not any(_key_admits(k) for k in keys)
@@ -0,0 +1,67 @@
+import sqlite3
+import threading
+
+import pytest
+
+import llm_manager
+
+
+def read_connection():
+    with llm_manager._db() as conn:
+        return conn
+
+
+def test_each_thread_reuses_its_own_read_connection():
+    mine = read_connection()
+    assert read_connection() is mine
+    other = []
+    thread = threading.Thread(target=lambda: other.append(read_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not mine
+
+
+def test_reads_do_not_wait_for_an_open_write_block():
+    llm_manager.set_cached_analysis("connection-layer", {"v": 1})
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_write():
+        with llm_manager._db(write=True) as conn:
+            conn.execute("UPDATE analysis_cache SET payload = ? WHERE analysis_key = ?",
+                         (llm_manager._compress_response('{"v": 2}'), "connection-layer"))
+            writing.set()
+            release.wait(5)
+
+    writer = threading.Thread(target=slow_write)
+    writer.start()
+    try:
+        assert writing.wait(5)
+        # Runs while the writer holds the lock and its transaction: sees the committed row
+        assert llm_manager.get_cached_analysis("connection-layer") == {"v": 1}
+    finally:
+        release.set()
+        writer.join()
+    assert llm_manager.get_cached_analysis("connection-layer") == {"v": 2}
+
+
+def test_read_connections_are_read_only():
+    with pytest.raises(sqlite3.OperationalError):
+        with llm_manager._db() as conn:
+            conn.execute("DELETE FROM analysis_cache")
+
+
+def test_failed_write_block_is_rolled_back():
+    llm_manager.set_cached_analysis("rollback", {"v": 1})
+    with pytest.raises(RuntimeError):
+        with llm_manager._db(write=True) as conn:
+            conn.execute("DELETE FROM analysis_cache WHERE analysis_key = ?", ("rollback",))
+            raise RuntimeError("boom")
+    assert llm_manager.get_cached_analysis("rollback") == {"v": 1}
+
+
+def test_rejected_write_does_not_pin_the_read_snapshot():
+    with pytest.raises(sqlite3.OperationalError):
+        with llm_manager._db() as conn:
+            conn.execute("DELETE FROM analysis_cache")
+    llm_manager.set_cached_analysis("after-rejected-write", {"v": 1})
+    assert llm_manager.get_cached_analysis("after-rejected-write") == {"v": 1}
@@ -0,0 +1,58 @@
+import time
+import uuid
+
+import pytest
+
+import llm_manager
+from llm_backends import GENERIC_RESPONSE, FakeBackend
+
+
+class KeyLatencyBackend(FakeBackend):
+    """Fake backend whose latency depends only on the API key"""
+
+    def __init__(self, latencies):
+        super().__init__(latency_ms=0, sigma=0)
+        self.latencies = latencies
+        self.calls = []
+
+    def respond(self, prompt, model, api_key):
+        self.calls.append(api_key)
+        response, _ = super().respond(prompt, model, api_key)
+        return response, self.latencies[api_key]
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    slow, fast = f"slow-{uuid.uuid4().hex}", f"fast-{uuid.uuid4().hex}"
+    monkeypatch.setattr(llm_manager, "_llm_clients", {})
+    monkeypatch.setattr(llm_manager, "_candidate_keys", lambda session: ([slow, fast], slow))
+    monkeypatch.setattr(llm_manager, "_hedge_deadline", lambda api_key: 0.05)
+    return slow, fast
+
+
+def test_hedge_wins_when_the_first_key_is_slow(keys, monkeypatch):
+    slow, fast = keys
+    backend = KeyLatencyBackend({slow: 1.0, fast: 0.0})
+    monkeypatch.setattr(llm_manager, "_offline_backend", backend)
+
+    started = time.monotonic()
+    response = llm_manager.call_llm(f"Say hello {uuid.uuid4().hex}", {}, model=llm_manager.DEFAULT_MODEL, hedge=True)
+
+    assert response == GENERIC_RESPONSE
+    assert time.monotonic() - started < 0.5
+    assert backend.calls == [slow, fast]
+
+
+def test_hedge_is_skipped_without_waiting_when_no_key_has_headroom(keys, monkeypatch):
+    slow, fast = keys
+    backend = KeyLatencyBackend({slow: 0.3, fast: 0.0})
+    monkeypatch.setattr(llm_manager, "_offline_backend", backend)
+    with llm_manager._rate_lock:
+        llm_manager._bucket(fast, llm_manager.DEFAULT_MODEL).requests = 0
+
+    started = time.monotonic()
+    response = llm_manager.call_llm(f"Say hello {uuid.uuid4().hex}", {}, model=llm_manager.DEFAULT_MODEL, hedge=True)
+
+    assert response == GENERIC_RESPONSE
+    assert time.monotonic() - started < 1.0  # not RATE_LIMIT_MAX_WAIT_SECONDS
+    assert backend.calls == [slow]
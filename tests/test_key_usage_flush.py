@@ -0,0 +1,97 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import llm_manager
+from llm_manager import flush_key_states, increment_key_usage, mark_key_failure, clear_key_failure
+
+
+@pytest.fixture
+def key(fresh_db):
+    return f"gsk-{uuid.uuid4().hex}"
+
+
+def today():
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def stored_usage(api_key):
+    with llm_manager._db() as conn:
+        return conn.execute("SELECT usage_count, last_reset FROM key_usage WHERE api_key = ?",
+                            (api_key,)).fetchone()
+
+
+def state(api_key):
+    with llm_manager._key_states_lock:
+        return llm_manager._key_state(api_key)
+
+
+def test_usage_is_flushed_as_deltas(key):
+    for _ in range(3):
+        increment_key_usage(key)
+    flush_key_states()
+    assert stored_usage(key) == (3, today())
+    increment_key_usage(key)
+    increment_key_usage(key)
+    flush_key_states()
+    assert stored_usage(key) == (5, today())
+    assert state(key).usage_delta == 0
+
+
+def test_deltas_from_other_processes_add_up(key):
+    increment_key_usage(key)
+    flush_key_states()
+    with llm_manager._db(write=True) as conn:  # another worker flushed 10 calls meanwhile
+        conn.execute("UPDATE key_usage SET usage_count = usage_count + 10 WHERE api_key = ?", (key,))
+    increment_key_usage(key)
+    flush_key_states()
+    assert stored_usage(key) == (12, today())
+    assert state(key).usage_count == 12  # DAILY_KEY_LIMIT sees every process's calls
+
+
+def test_a_new_day_resets_the_stored_count(key):
+    yesterday = (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d")
+    with llm_manager._db(write=True) as conn:
+        conn.execute("INSERT INTO key_usage (api_key, usage_count, last_reset) VALUES (?, ?, ?)",
+                     (key, 700, yesterday))
+    increment_key_usage(key)
+    flush_key_states()
+    assert stored_usage(key) == (1, today())
+
+
+def test_failed_write_keeps_the_deltas(key, monkeypatch):
+    increment_key_usage(key)
+    increment_key_usage(key)
+    mark_key_failure(key, "error")
+
+    def broken_write(failures, usage):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(llm_manager, "_write_key_states", broken_write)
+    with pytest.raises(RuntimeError):
+        flush_key_states()
+    assert state(key).usage_delta == 2 and state(key).failure_dirty
+    increment_key_usage(key)
+
+    monkeypatch.undo()
+    flush_key_states()
+    assert stored_usage(key) == (3, today())
+    with llm_manager._db() as conn:
+        assert conn.execute("SELECT reason FROM key_failures WHERE api_key = ?", (key,)).fetchone() == ("error",)
+
+
+def test_breaker_state_is_shared_through_key_failures(key):
+    mark_key_failure(key, "quota")
+    flush_key_states()
+    clear_key_failure(key)
+    flush_key_states()
+    with llm_manager._db() as conn:
+        assert conn.execute("SELECT 1 FROM key_failures WHERE api_key = ?", (key,)).fetchone() is None
+
+    with llm_manager._db(write=True) as conn:  # another worker tripped the key
+        conn.execute("INSERT INTO key_failures (api_key, fail_time, reason, failures, retry_at) "
+                     "VALUES (?, ?, 'auth', 1, NULL)", (key, llm_manager._utc_str(llm_manager.time.time())))
+    flush_key_states()
+    assert state(key).reason == "auth"
+    assert not llm_manager._key_admits(key)
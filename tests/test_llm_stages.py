@@ -0,0 +1,74 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pytest
+
+import llm_stages
+from llm_stages import LLM_STAGE_WORKERS, submit_llm_stage
+
+
+def all_slots_free(timeout=2):
+    """Slots are released by a done-callback, which may run just after wait() returns"""
+    deadline = time.monotonic() + timeout
+    while llm_stages._stage_slots._value != LLM_STAGE_WORKERS:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_stage_result_and_arguments():
+    assert submit_llm_stage(lambda a, b=0: a + b, 2, b=3).result(timeout=5) == 5
+
+
+def test_submissions_wait_for_a_free_stage_worker():
+    release = threading.Event()
+    running, peak, lock = 0, 0, threading.Lock()
+    submitted = []
+
+    def stage():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        release.wait(5)
+        with lock:
+            running -= 1
+
+    def submitter():
+        for _ in range(LLM_STAGE_WORKERS + 4):
+            submitted.append(submit_llm_stage(stage))
+
+    thread = threading.Thread(target=submitter)
+    thread.start()
+    time.sleep(0.2)
+    assert len(submitted) == LLM_STAGE_WORKERS  # the next submission is blocked, not queued
+    assert thread.is_alive()
+
+    release.set()
+    thread.join(5)
+    wait(submitted, timeout=5)
+    assert peak == LLM_STAGE_WORKERS
+    assert all_slots_free()
+
+
+def test_failed_stage_releases_its_slot():
+    def fail():
+        raise ValueError("stage failed")
+
+    futures = [submit_llm_stage(fail) for _ in range(LLM_STAGE_WORKERS * 2)]
+    wait(futures, timeout=5)
+    assert all(isinstance(f.exception(), ValueError) for f in futures)
+    assert all_slots_free()
+
+
+def test_other_pools_are_not_limited_by_stage_slots():
+    release = threading.Event()
+    blockers = [submit_llm_stage(release.wait, 5) for _ in range(LLM_STAGE_WORKERS)]
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            assert submit_llm_stage(lambda: "screened", pool=pool).result(timeout=1) == "screened"
+    finally:
+        release.set()
+        wait(blockers, timeout=5)
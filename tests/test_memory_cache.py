@@ -0,0 +1,61 @@
+import time
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+import llm_manager
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    monkeypatch.setattr(llm_manager, "MEMORY_CACHE_MAX_ENTRIES", 3)
+    monkeypatch.setattr(llm_manager, "_memory_cache", OrderedDict())
+    monkeypatch.setattr(llm_manager, "_cache_stats", dict.fromkeys(llm_manager._cache_stats, 0))
+    return llm_manager._memory_cache
+
+
+def test_least_recently_used_entry_is_evicted(memory):
+    expires = time.time() + 60
+    for key in "abc":
+        llm_manager._memory_put(key, key.upper(), expires)
+    assert llm_manager._memory_get("a") == "A"  # "b" is now the least recently used
+    llm_manager._memory_put("d", "D", expires)
+
+    assert list(memory) == ["c", "a", "d"]
+    assert llm_manager._memory_get("b") is None
+    assert llm_manager._cache_stats["evictions"] == 1
+
+
+def test_expired_entry_is_dropped(memory):
+    llm_manager._memory_put("old", "stale", time.time() - 1)
+    assert llm_manager._memory_get("old") is None
+    assert "old" not in memory
+
+
+def test_sqlite_hit_is_promoted_with_its_remaining_ttl(memory):
+    prompt, model = f"prompt {uuid.uuid4().hex}", llm_manager.DEFAULT_MODEL
+    llm_manager.set_cached_response(prompt, model, "answer")
+    memory.clear()  # as in a freshly started process
+
+    assert llm_manager.get_cached_response(prompt, model) == "answer"
+    assert llm_manager.get_cached_response(prompt, model) == "answer"
+    stats = llm_manager.get_cache_stats()
+    assert (stats["sqlite_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+    _, expires_at = memory[llm_manager.hash_prompt(prompt, model)]
+    assert 0 < expires_at - time.time() <= llm_manager.CACHE_EXPIRY_HOURS * 3600
+
+
+def test_writes_go_through_to_sqlite(memory):
+    prompt, model = f"prompt {uuid.uuid4().hex}", llm_manager.DEFAULT_MODEL
+    llm_manager.set_cached_response(prompt, model, "answer")
+    assert llm_manager.hash_prompt(prompt, model) in memory
+    with llm_manager._db() as conn:
+        row = conn.execute("SELECT response FROM llm_cache WHERE prompt_hash = ?",
+                           (llm_manager.hash_prompt(prompt, model),)).fetchone()
+    assert row == ("answer",)
+
+
+def test_miss_is_counted(memory):
+    assert llm_manager.get_cached_response(f"never stored {uuid.uuid4().hex}", "m") is None
+    assert llm_manager.get_cache_stats()["misses"] == 1
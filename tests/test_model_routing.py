@@ -0,0 +1,65 @@
+import uuid
+
+import pytest
+
+import llm_manager
+from llm_backends import FakeBackend
+from llm_manager import DEFAULT_MODEL, SMALL_MODEL
+
+
+class ModelBackend(FakeBackend):
+    """Fake backend answering per model: the small model gives an off-list domain"""
+
+    def __init__(self):
+        super().__init__(latency_ms=0, sigma=0)
+        self.calls = []
+
+    def respond(self, prompt, model, api_key):
+        self.calls.append(model)
+        return ("Probably software?" if model == SMALL_MODEL else "Data Science"), 0.0
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = ModelBackend()
+    monkeypatch.setattr(llm_manager, "_offline_backend", backend)
+    monkeypatch.setattr(llm_manager, "_llm_clients", {})
+    return backend
+
+
+def classify(prompt):
+    return llm_manager.call_llm(prompt, {}, family="domain_detect",
+                                validator=lambda r: r.strip() in {"Data Science", "Software Engineering"})
+
+
+def test_rejected_small_model_answer_is_not_cached(backend):
+    prompt = f"Classify the domain {uuid.uuid4().hex}"
+    assert llm_manager.resolve_model("domain_detect") == SMALL_MODEL
+
+    assert classify(prompt) == "Data Science"
+    assert backend.calls == [SMALL_MODEL, DEFAULT_MODEL]
+    assert llm_manager.get_cached_response(prompt, SMALL_MODEL) is None
+    assert llm_manager.get_cached_response(prompt, DEFAULT_MODEL) == "Data Science"
+
+
+def test_escalated_prompt_is_answered_from_the_default_model_cache(backend):
+    prompt = f"Classify the domain {uuid.uuid4().hex}"
+    classify(prompt)
+    assert classify(prompt) == "Data Science"
+    assert backend.calls == [SMALL_MODEL, DEFAULT_MODEL]  # no second round-trip
+
+
+def test_valid_small_model_answer_is_kept(monkeypatch):
+    monkeypatch.setattr(llm_manager, "_offline_backend", FakeBackend(latency_ms=0, sigma=0))
+    monkeypatch.setattr(llm_manager, "_llm_clients", {})
+    prompt = f"Please classify the most relevant professional domain {uuid.uuid4().hex}"
+    assert classify(prompt) == "Software Engineering"
+    assert llm_manager.get_cached_response(prompt, SMALL_MODEL) == "Software Engineering"
+
+
+def test_semantic_source_of_a_rejected_answer_is_dropped():
+    neighbour = f"Classify the domain {uuid.uuid4().hex}"
+    llm_manager.set_cached_response(neighbour, SMALL_MODEL, "Probably software?")
+    trace = {"source_key": llm_manager.hash_prompt(neighbour, SMALL_MODEL)}
+    llm_manager._uncache_rejected(f"Classify the domain {uuid.uuid4().hex}", SMALL_MODEL, trace)
+    assert llm_manager.get_cached_response(neighbour, SMALL_MODEL) is None
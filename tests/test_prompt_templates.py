@@ -0,0 +1,38 @@
+from prompt_templates import PromptTemplate, compact_prompt, count_tokens, register_template, get_template
+
+
+def test_compact_prompt_drops_rules_trailing_space_and_blank_runs():
+    text = "Title   \n════════════════\nBody\n\n\n\nMore\n---\n  ========  \nEnd"
+    assert compact_prompt(text) == "Title\nBody\n\nMore\n---\nEnd"
+
+
+def test_compact_prompt_keeps_content_lines():
+    text = "- bullet\n**bold** -- dash\nscore: 10/20"
+    assert compact_prompt(text) == text
+
+
+def test_render_splits_static_prefix_and_dynamic_content():
+    template = PromptTemplate("t", system="Score out of {max_score}.\n═════════════\n", user="  {text}  ")
+    first = template.render(max_score=5, text="resume one")
+    second = template.render(max_score=5, text="resume two")
+    assert first == [("system", "Score out of 5."), ("human", "resume one")]
+    assert first[0] == second[0]  # byte-identical prefix across calls
+    stats = template.stats()
+    assert stats["calls"] == 2
+    assert stats["prefix_tokens"] == count_tokens("Score out of 5.")
+    assert stats["compaction_saved_tokens"] > 0
+
+
+def test_callable_parts_receive_all_fields():
+    template = PromptTemplate("c", system=lambda weight, **_: f"Weight {weight}", user=lambda text, **_: text)
+    assert template.render(weight=3, text="x") == [("system", "Weight 3"), ("human", "x")]
+
+
+def test_register_template_keeps_stats_across_reruns():
+    first = register_template("rerun-test", system="A {x}", user="{y}")
+    first.render(x=1, y=2)
+    second = register_template("rerun-test", system="B {x}", user="{y}", family="grammar")
+    assert second is first and get_template("rerun-test") is first
+    assert second.stats()["calls"] == 1
+    assert second.family == "grammar"
+    assert second.render(x=1, y=2)[0] == ("system", "B 1")
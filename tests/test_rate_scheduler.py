@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+import llm_manager
+from llm_manager import _RateBucket, _refund_key, _reserve_key, acquire_key
+
+MODEL = "model-a"
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(llm_manager, "_key_limits", {})
+    return llm_manager._key_limits
+
+
+def drain(key, model=MODEL, requests=0.0):
+    with llm_manager._rate_lock:
+        llm_manager._bucket(key, model).requests = requests
+
+
+def test_bucket_refills_continuously():
+    bucket = _RateBucket(rpm=60, tpm=6000)
+    bucket.requests, bucket.tokens = 0.0, 0.0
+    assert bucket.wait_time(100) == pytest.approx(1.0)  # 1 request/s and 100 tokens/s
+    bucket.refill(bucket.updated + 0.5)
+    assert (bucket.requests, bucket.tokens) == (pytest.approx(0.5), pytest.approx(50))
+    bucket.refill(bucket.updated + 120)
+    assert (bucket.requests, bucket.tokens) == (60, 6000)  # capped at the budget
+
+
+def test_preferred_key_wins_while_it_has_headroom(limits):
+    drain("user", requests=1.0)
+    assert _reserve_key(["admin", "user"], MODEL, 100, preferred="user") == ("user", None)
+    # Drained now: the admin key takes over without waiting
+    assert _reserve_key(["admin", "user"], MODEL, 100, preferred="user") == ("admin", None)
+
+
+def test_key_with_most_headroom_is_picked(limits):
+    drain("a", requests=5.0)
+    assert _reserve_key(["a", "b"], MODEL, 100)[0] == "b"
+
+
+def test_drained_keys_report_the_shortest_wait(limits):
+    limits.update({"a": {"rpm": 60, "tpm": 100000}, "b": {"rpm": 30, "tpm": 100000}})
+    drain("a")
+    drain("b")
+    key, wait = _reserve_key(["a", "b"], MODEL, 100)
+    assert key is None
+    assert wait == pytest.approx(1.0, abs=0.05)  # "a" refills one request per second
+
+
+def test_buckets_are_per_key_and_model(limits):
+    limits["k"] = {"small": {"rpm": 1, "tpm": 100000}, "rpm": 30}
+    assert _reserve_key(["k"], "small", 100)[0] == "k"
+    assert _reserve_key(["k"], "small", 100)[0] is None
+    assert _reserve_key(["k"], "large", 100)[0] == "k"  # the default budget, untouched
+    assert llm_manager._bucket("k", "large").rpm == 30
+
+
+def test_refund_returns_the_reservation(limits):
+    prompt = "x" * 400
+    tokens = llm_manager._estimate_tokens(prompt)
+    key, _ = _reserve_key(["k"], MODEL, tokens)
+    bucket = llm_manager._bucket(key, MODEL)
+    assert bucket.requests == pytest.approx(llm_manager.KEY_REQUESTS_PER_MINUTE - 1, abs=0.01)
+    _refund_key(key, MODEL, prompt)
+    assert bucket.requests == pytest.approx(llm_manager.KEY_REQUESTS_PER_MINUTE, abs=0.01)
+    assert bucket.tokens == pytest.approx(llm_manager.KEY_TOKENS_PER_MINUTE, abs=1)
+
+
+def test_settle_replaces_the_estimate_with_reported_usage(limits):
+    prompt = "x" * 400
+    _reserve_key(["k"], MODEL, llm_manager._estimate_tokens(prompt))
+    llm_manager._settle_tokens("k", MODEL, prompt, object())  # no usage reported: estimate stays
+    reply = type("Message", (), {"response_metadata": {"token_usage": {"total_tokens": 150}}})()
+    llm_manager._settle_tokens("k", MODEL, prompt, reply)
+    assert llm_manager._bucket("k", MODEL).tokens == pytest.approx(llm_manager.KEY_TOKENS_PER_MINUTE - 150, abs=1)
+
+
+def test_acquire_waits_for_the_first_refill(limits):
+    limits["fast"] = {"rpm": 600, "tpm": 10 ** 6}
+    drain("fast")
+    started = time.monotonic()
+    assert acquire_key(["fast"], "prompt", MODEL) == "fast"
+    assert 0.05 < time.monotonic() - started < 1.0
+
+
+def test_acquire_gives_up_past_the_wait_budget(limits, monkeypatch):
+    monkeypatch.setattr(llm_manager, "RATE_LIMIT_MAX_WAIT_SECONDS", 0.5)
+    limits["slow"] = {"rpm": 1, "tpm": 10 ** 6}
+    drain("slow")
+    started = time.monotonic()
+    assert acquire_key(["slow"], "prompt", MODEL) is None
+    assert time.monotonic() - started < 0.1  # a 60 s refill is not slept on
+
+
+def test_scheduler_refunds_a_key_the_breaker_refuses(limits, monkeypatch):
+    monkeypatch.setattr(llm_manager, "_candidate_keys", lambda session: (["open", "ok"], "open"))
+    monkeypatch.setattr(llm_manager, "_claim_key", lambda key: key != "open")
+    assert list(llm_manager._scheduled_keys({}, "prompt", MODEL)) == ["ok"]
+    assert llm_manager._bucket("open", MODEL).requests == pytest.approx(llm_manager.KEY_REQUESTS_PER_MINUTE, abs=0.01)
+
+
+def test_refill_with_an_earlier_timestamp_takes_nothing():
+    bucket = _RateBucket(rpm=1, tpm=1000)
+    bucket.refill(bucket.updated - 5)
+    assert (bucket.requests, bucket.tokens) == (1.0, 1000.0)
+    assert bucket.wait_time(100) == 0
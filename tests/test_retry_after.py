@@ -0,0 +1,44 @@
+import pytest
+
+from llm_manager import _classify_error, _retry_after_seconds
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status_code=None, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}, "status_code": status_code})()
+
+
+@pytest.mark.parametrize("message, seconds", [
+    ("Rate limit reached. Please try again in 1m2.5s. Visit ...", 62.5),
+    ("Please try again in 450ms.", 0.45),
+    ("please TRY AGAIN IN 2h", 7200),
+    ("try again in 1h0m30s", 3630),
+    ("Rate limit reached", None),
+])
+def test_retry_after_from_message(message, seconds):
+    result = _retry_after_seconds(UpstreamError(message))
+    assert result == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def test_retry_after_header_wins_over_message():
+    error = UpstreamError("try again in 1m", headers={"retry-after": "7"})
+    assert _retry_after_seconds(error) == 7.0
+
+
+def test_retry_after_http_date_falls_back_to_message():
+    error = UpstreamError("try again in 3s", headers={"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"})
+    assert _retry_after_seconds(error) == 3.0
+
+
+@pytest.mark.parametrize("status, message, expected", [
+    (429, "try again in 1m2.5s", ("quota", pytest.approx(62.5))),
+    (401, "invalid api key", ("auth", None)),
+    (400, "context length exceeded", ("request", None)),
+    (503, "over capacity, try again in 2s", ("error", 2.0)),
+    (500, "internal error", ("error", None)),
+    (None, "429 rate limit, try again in 5s", ("quota", 5.0)),
+])
+def test_classify_error(status, message, expected):
+    assert _classify_error(UpstreamError(message, status_code=status)) == expected
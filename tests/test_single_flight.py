@@ -0,0 +1,59 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import llm_manager
+from llm_backends import GENERIC_RESPONSE, FakeBackend
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self, latency_ms):
+        super().__init__(latency_ms=latency_ms, sigma=0)
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def respond(self, prompt, model, api_key):
+        with self._lock:
+            self.prompts.append(prompt)
+        return super().respond(prompt, model, api_key)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = CountingBackend(latency_ms=200)
+    monkeypatch.setattr(llm_manager, "_offline_backend", backend)
+    monkeypatch.setattr(llm_manager, "_llm_clients", {})
+    return backend
+
+
+def call(prompt):
+    return llm_manager.call_llm(prompt, {}, model=llm_manager.DEFAULT_MODEL, hedge=False)
+
+
+def test_concurrent_identical_prompts_share_one_upstream_call(backend):
+    prompt = f"Say hello {uuid.uuid4().hex}"
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        responses = list(pool.map(call, [prompt] * 6))
+    assert responses == [GENERIC_RESPONSE] * 6
+    assert backend.prompts == [prompt]
+    assert not llm_manager._inflight
+
+
+def test_different_prompts_are_not_coalesced(backend):
+    prompts = [f"Say hello {uuid.uuid4().hex}" for _ in range(3)]
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(call, prompts))
+    assert sorted(backend.prompts) == sorted(prompts)
+
+
+def test_follower_retries_when_the_leader_fails(backend, monkeypatch):
+    prompt = f"Say hello {uuid.uuid4().hex}"
+    flight_key = llm_manager.hash_prompt(prompt, llm_manager.DEFAULT_MODEL)
+    failed = llm_manager.Future()
+    failed.set_result("❌ LLM unavailable: leader gave up")
+    monkeypatch.setitem(llm_manager._inflight, flight_key, failed)
+
+    assert call(prompt) == GENERIC_RESPONSE
+    assert backend.prompts == [prompt]
@@ -0,0 +1,97 @@
+import json
+import threading
+import uuid
+from typing import List
+
+import pytest
+from pydantic import BaseModel, Field
+
+import llm_manager
+from llm_backends import FakeBackend
+from llm_manager import DEFAULT_MODEL, call_llm_structured
+
+
+class GrammarReport(BaseModel):
+    score: int = Field(ge=0, le=5)
+    feedback: str
+    suggestions: List[str] = []
+
+
+VALID = json.dumps({"score": 4, "feedback": "Clear.", "suggestions": ["Use metrics."]})
+
+
+class ScriptedBackend(FakeBackend):
+    """Answers the original prompt with `first` and the repair prompt with `repaired`"""
+
+    def __init__(self, first, repaired=VALID):
+        super().__init__(latency_ms=0, sigma=0)
+        self.first, self.repaired = first, repaired
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def respond(self, prompt, model, api_key):
+        text = prompt if isinstance(prompt, str) else "\n".join(c for _, c in prompt)
+        with self._lock:
+            self.prompts.append(text)
+        return (self.repaired if "did not match the required JSON schema" in text else self.first), 0.0
+
+
+@pytest.fixture
+def use_backend(monkeypatch):
+    def use(backend):
+        monkeypatch.setattr(llm_manager, "_offline_backend", backend)
+        monkeypatch.setattr(llm_manager, "_llm_clients", {})
+        return backend
+    return use
+
+
+def prompt():
+    return [("system", "Score the grammar."), ("human", f"Resume {uuid.uuid4().hex}")]
+
+
+def structured(messages):
+    return call_llm_structured(messages, GrammarReport, {}, model=DEFAULT_MODEL, family="grammar")
+
+
+def test_valid_answer_is_parsed_and_kept_parsed(use_backend):
+    backend = use_backend(ScriptedBackend(f"Sure! {VALID}"))
+    messages = prompt()
+    report = structured(messages)
+    assert report == GrammarReport(score=4, feedback="Clear.", suggestions=["Use metrics."])
+    report.suggestions.append("mutated by the caller")
+    assert structured(messages).suggestions == ["Use metrics."]  # served from the parsed LRU
+    assert len(backend.prompts) == 1
+
+
+def test_schema_is_appended_to_the_system_message(use_backend):
+    backend = use_backend(ScriptedBackend(VALID))
+    structured(prompt())
+    assert backend.prompts[0].startswith("Score the grammar.\n\nRespond with a single JSON object")
+    assert '"title":"GrammarReport"' in backend.prompts[0]
+
+
+def test_invalid_answer_gets_one_repair_round_trip(use_backend):
+    backend = use_backend(ScriptedBackend('{"score": 9, "feedback": "Clear."}'))
+    messages = prompt()
+    assert structured(messages).score == 4
+    assert len(backend.prompts) == 2
+    assert "Validation error" in backend.prompts[1]
+    # The repaired JSON replaces the invalid answer, so a new process parses it directly
+    schema_prompt = llm_manager._with_schema(messages, GrammarReport)
+    assert json.loads(llm_manager.get_cached_response(schema_prompt, DEFAULT_MODEL))["score"] == 4
+
+
+def test_answer_still_invalid_after_repair_returns_none_and_is_uncached(use_backend):
+    backend = use_backend(ScriptedBackend("no json here", repaired='{"score": "high"}'))
+    messages = prompt()
+    assert structured(messages) is None
+    schema_prompt = llm_manager._with_schema(messages, GrammarReport)
+    assert llm_manager.get_cached_response(schema_prompt, DEFAULT_MODEL) is None
+    assert structured(messages) is None
+    assert len(backend.prompts) == 4  # nothing invalid was served from the cache
+
+
+def test_upstream_failure_returns_none(use_backend, monkeypatch):
+    use_backend(FakeBackend(latency_ms=0, sigma=0, error_rate=1.0))
+    monkeypatch.setattr(llm_manager, "_candidate_keys", lambda session: ([f"gsk-{uuid.uuid4().hex}"], None))
+    assert structured(prompt()) is None